@@ -0,0 +1,141 @@
+"""Home screen (get-assigned-cases) latency, five-way OR vs the user inbox, per user.
+
+Expects the default seed (python benchmarks/seed.py --cases 500000 --users 300). Makes
+sure sql/tables/user_inbox.sql has been applied, then runs both statements for every
+assigned user --iterations times over one connection:
+
+* legacy - CASE_ALLOCATION filtered with assignedtoanalyst = %s OR assignedtoqc = %s
+           OR ... (the old handler)
+* inbox  - shared_code.inbox.ASSIGNED_CASES, driven by a range scan of mtl.USER_INBOX
+
+Both must return the same cases for every user. The cost the writers now pay is
+reported too: inbox.sync for 1 and for --sync-batch cases, rolled back each time.
+
+    python benchmarks/assigned_cases.py --iterations 5 --output inbox.json
+"""
+import argparse
+import json
+import time
+from contextlib import closing
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from seed import REPO_DIR, apply_sql_file
+from shared_code import inbox
+
+INBOX_FILE = f'{REPO_DIR}/sql/tables/user_inbox.sql'
+
+LEGACY = ("SELECT ca.*, ct.case_tags FROM mtl.CASE_ALLOCATION ca LEFT JOIN mtl.CASE_TAGS ct ON ca.case_id = ct.case_id "
+          "and ct.end_ts = '9999-12-31 00:00:00' WHERE ca.end_ts = '9999-12-31 00:00:00' and (assignedtoanalyst = %s "
+          "OR assignedtoqc = %s OR assignedtoqa = %s OR assignedtoctc = %s OR assignedtoer = %s)")
+
+
+def plan_summary(cursor, statement, params):
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, params)
+    nodes = []
+
+    def walk(node):
+        label = node['Node Type'] + (f" on {node['Index Name']}" if 'Index Name' in node else '')
+        if 'Scan' in node['Node Type']:
+            nodes.append(label)
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(cursor.fetchone()[0][0]['Plan'])
+    return ', '.join(nodes)
+
+
+def timed_cases(cursor, statement, params, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        cursor.execute(statement, params)
+        case_ids = sorted(row[0] for row in cursor.fetchall())
+        samples.append(time.perf_counter() - started)
+    return samples, case_ids
+
+
+def timed_sync(conn, case_ids, iterations):
+    samples = []
+    for _ in range(iterations):
+        with conn.cursor() as cursor:
+            started = time.perf_counter()
+            inbox.sync(cursor, case_ids)
+            samples.append(time.perf_counter() - started)
+        conn.rollback()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--users', type=int, default=300, help='Measure at most this many assigned users')
+    parser.add_argument('--sync-batch', type=int, default=500)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    with closing(psycopg2.connect(**settings_from_env())) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            started = time.perf_counter()
+            apply_sql_file(cursor, INBOX_FILE)
+            cursor.execute('ANALYZE mtl.USER_INBOX')
+            print(f'user_inbox.sql applied in {time.perf_counter() - started:.1f}s')
+
+            cursor.execute("SELECT count(*) FROM mtl.CASE_ALLOCATION WHERE end_ts = '9999-12-31 00:00:00'")
+            cases = cursor.fetchone()[0]
+            cursor.execute("SELECT user_email, count(*) FROM mtl.USER_INBOX GROUP BY user_email ORDER BY user_email LIMIT %s",
+                           (args.users,))
+            users = cursor.fetchall()
+
+            legacy_samples, inbox_samples, mismatches = [], [], []
+            for email, _ in users:
+                samples, legacy_cases = timed_cases(cursor, LEGACY, (email,) * 5, args.iterations)
+                legacy_samples += samples
+                samples, inbox_cases = timed_cases(cursor, inbox.ASSIGNED_CASES, (email,), args.iterations)
+                inbox_samples += samples
+                if legacy_cases != inbox_cases:
+                    mismatches.append(email)
+
+            busiest = max(users, key=lambda user: user[1])[0]
+            plans = {
+                'legacy': plan_summary(cursor, LEGACY, (busiest,) * 5),
+                'inbox': plan_summary(cursor, inbox.ASSIGNED_CASES, (busiest,)),
+            }
+            cursor.execute("SELECT case_id FROM mtl.USER_INBOX ORDER BY case_id LIMIT %s", (args.sync_batch,))
+            batch = [row[0] for row in cursor.fetchall()]
+
+        conn.autocommit = False
+        sync = {
+            'single': summarise_ms(timed_sync(conn, batch[:1], args.iterations * 4)),
+            'batch': summarise_ms(timed_sync(conn, batch, args.iterations)),
+        }
+
+    report = {
+        'cases': cases,
+        'users': len(users),
+        'legacy': summarise_ms(legacy_samples),
+        'inbox': summarise_ms(inbox_samples),
+        'plans': plans,
+        'sync': sync,
+        'sync_batch': len(batch),
+        'mismatched_users': mismatches,
+    }
+
+    print(f"{report['users']} users, {cases} cases")
+    print(f"{'':<8}{'p50':>10}{'p95':>10}{'p99':>10}  scans (busiest user)")
+    for name in ('legacy', 'inbox'):
+        row = report[name]
+        print(f"{name:<8}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms  {plans[name]}")
+    print(f"sync 1 case p50 {sync['single']['p50_ms']:.1f}ms, {len(batch)} cases p50 {sync['batch']['p50_ms']:.1f}ms")
+    if mismatches:
+        print(f'{len(mismatches)} users got different cases, e.g. {mismatches[0]}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
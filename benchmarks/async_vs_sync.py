@@ -0,0 +1,128 @@
+"""Requests/sec per worker for the async and sync handler paths.
+
+Runs the get-dashboard (case_tracker) and get-case-details (bundle) workloads four ways:
+
+* unpooled  - one request at a time, each on a new db.connect() connection, as the
+              synchronous ``def main`` handlers did before they moved to async.
+* pooled    - one request at a time on db.pooled_connection(), as the repo's
+              remaining sync handlers serve them.
+* pooled xN - the same with --concurrency threads sharing the pool, as a sync
+              worker with that many threads would.
+* async     - the real ``async def main`` handlers driven with --concurrency
+              in-flight requests on a single event loop, as the Functions worker does.
+
+The sync runs execute the statements the handlers are built from (the dashboard's
+LAST_WEEK_STATES/CURRENT_LIVE_STATES and case_sections.fetch_bundle) back to back,
+and speedup is async against the best of them.
+
+Both pools are sized from the worker's one connection budget, db_max_connections
+(see shared_code.db.max_connections). Unless it is set, the budget here gives the
+asyncpg pool one connection per in-flight request; set db_max_connections=7 to
+compare at the default budget of a deployed worker.
+
+Connection settings come from the standard libpq variables (PGHOST, PGPORT,
+PGDATABASE, PGUSER, PGPASSWORD) so Key Vault is never contacted.
+
+    python benchmarks/async_vs_sync.py --requests 200 --concurrency 20 --case-id C000001
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from common import load_handler, settings_from_env
+
+import azure.functions as func
+from psycopg2.extras import RealDictCursor
+from shared_code import case_sections, db, db_async
+
+
+def make_request(function_name, params):
+    return func.HttpRequest(method='GET', url=f'/api/{function_name}', params=params, body=b'')
+
+
+def run_sync(dashboard, case_id, requests, threads, pooled):
+    def connection():
+        return db.pooled_connection() if pooled else closing(db.connect())
+
+    def dashboard_request():
+        with connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(dashboard.LAST_WEEK_STATES)
+            last_week_rows = cursor.fetchall()
+            cursor.execute(dashboard.CURRENT_LIVE_STATES)
+            current_live_rows = cursor.fetchall()
+        json.dumps(dashboard.merge_case_tracker_counts(last_week_rows, current_live_rows), cls=dashboard.CustomJSONEncoder)
+
+    def bundle_request():
+        with connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            bundle = case_sections.fetch_bundle(cursor, case_id)
+        json.dumps(bundle, cls=dashboard.CustomJSONEncoder)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for name, request in (('dashboard', dashboard_request), ('bundle', bundle_request)):
+            started = time.perf_counter()
+            for future in [executor.submit(request) for _ in range(requests)]:
+                future.result()
+            elapsed = time.perf_counter() - started
+            results[name] = requests / elapsed
+    return results
+
+
+async def run_async(dashboard, case_details, case_id, requests, concurrency):
+    workloads = {
+        'dashboard': lambda: dashboard.main(make_request('get-dashboard', {'query_type': 'case_tracker'})),
+        'bundle': lambda: case_details.main(make_request('get-case-details', {'query_type': 'bundle', 'case_id': case_id})),
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(call):
+        async with semaphore:
+            response = await call()
+            if response.status_code != 200:
+                raise RuntimeError(response.get_body().decode())
+
+    results = {}
+    await db_async.get_pool()
+    for name, call in workloads.items():
+        started = time.perf_counter()
+        await asyncio.gather(*(one(call) for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        results[name] = requests / elapsed
+    await db_async.close_pool()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--case-id', required=True)
+    args = parser.parse_args()
+
+    # Unless set, a budget that gives the asyncpg pool one connection per in-flight request
+    os.environ.setdefault('db_max_connections', str(3 * args.concurrency + 1))
+    db.set_db_settings(settings_from_env())
+    dashboard = load_handler('get-dashboard')
+    case_details = load_handler('get-case-details')
+
+    runs = {
+        'unpooled': run_sync(dashboard, args.case_id, args.requests, 1, pooled=False),
+        'pooled': run_sync(dashboard, args.case_id, args.requests, 1, pooled=True),
+        f'pooled x{args.concurrency}': run_sync(dashboard, args.case_id, args.requests, args.concurrency, pooled=True),
+        'async': asyncio.run(run_async(dashboard, case_details, args.case_id, args.requests, args.concurrency)),
+    }
+    db.get_pool().closeall()
+
+    print(f"{'req/s':<12}" + ''.join(f'{run:>14}' for run in runs) + f"{'speedup':>10}")
+    for name in runs['async']:
+        best_sync = max(rps[name] for run, rps in runs.items() if run != 'async')
+        print(f"{name:<12}" + ''.join(f'{rps[name]:>14.1f}' for rps in runs.values())
+              + f"{runs['async'][name] / best_sync:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Solve time of the post-auto-allocation planner on a synthetic backlog.
+
+Builds --cases unallocated cases over --cohorts cohorts (oldest first) and --reviewers
+reviewers with random free hours, then times shared_code.auto_allocation.solve
+--iterations times. Every solution is checked:
+
+* no reviewer is given more hours than they have free
+* every case is allocated at most once, oldest first; newer cases are only taken to fill
+  hours the oldest that fit could not use (newer_than_fit counts them)
+* no reviewer is left with room for a case that is still waiting (room_left)
+
+With --database the planner also runs as a dry run against the seeded database
+(python benchmarks/seed.py) for --start-date/--end-date, timing load and solve apart.
+
+    python benchmarks/auto_allocation.py --cases 100000 --reviewers 200 --output auto_allocation.json
+"""
+import argparse
+import json
+import time
+from contextlib import closing
+from datetime import date, timedelta
+
+from common import settings_from_env, summarise_ms
+
+import numpy as np
+import psycopg2
+from shared_code import auto_allocation
+
+
+def synthetic_problem(cases, cohorts, reviewers, load, seed):
+    rng = np.random.default_rng(seed)
+    cohort_hours = rng.choice([0.5, 1.0, 1.5, 2.0, 3.0, 4.0], size=cohorts)
+    case_cohorts = rng.integers(0, cohorts, size=cases)
+    # Free hours sized so the team can take roughly --load of the backlog
+    capacity = rng.uniform(0.0, 2.0, size=reviewers)
+    capacity *= load * cohort_hours[case_cohorts].sum() / capacity.sum()
+    return case_cohorts, cohort_hours, capacity
+
+
+def check(assignment, case_cohorts, cohort_hours, capacity):
+    allocated = assignment >= 0
+    used = np.bincount(assignment[allocated], weights=cohort_hours[case_cohorts[allocated]], minlength=len(capacity))
+    first_unallocated = np.argmin(allocated) if not allocated.all() else len(allocated)
+    hours_fitting = np.cumsum(cohort_hours[case_cohorts]) <= capacity.sum() + 1e-9
+    waiting_hours = cohort_hours[np.unique(case_cohorts[~allocated])]
+    room_left = (capacity - used)[:, None] >= waiting_hours[None, :] - 1e-9
+    return {
+        'over_capacity': int((used > capacity + 1e-6).sum()),
+        'out_of_range': int(((assignment < -1) | (assignment >= len(capacity))).sum()),
+        'newer_than_fit': int(allocated[~hours_fitting].sum()),
+        'left_over': int(hours_fitting.sum() - allocated.sum()),
+        'room_left': int(room_left.any(axis=1).sum()),
+        'first_unallocated': int(first_unallocated),
+        'utilisation': round(float(used.sum() / capacity.sum()), 4) if capacity.sum() else 0.0,
+    }
+
+
+def database_dry_run(start_date, end_date, iterations):
+    load_samples, solve_samples = [], []
+    with closing(psycopg2.connect(**settings_from_env())) as conn, conn.cursor() as cursor:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            problem = auto_allocation.load_problem(cursor, start_date, end_date)
+            load_samples.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            _, summary = auto_allocation.plan(problem)
+            solve_samples.append(time.perf_counter() - started)
+        conn.rollback()
+    return {
+        'cases': summary['cases'],
+        'reviewers': len(summary['reviewers']),
+        'allocated': summary['allocated'],
+        'load': summarise_ms(load_samples),
+        'plan': summarise_ms(solve_samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', type=int, default=100000)
+    parser.add_argument('--reviewers', type=int, default=200)
+    parser.add_argument('--cohorts', type=int, default=12)
+    parser.add_argument('--load', type=float, default=0.6, help='Team hours as a share of the backlog hours')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', action='store_true', help='Also dry run against the seeded database')
+    parser.add_argument('--start-date', type=date.fromisoformat, default=date.today())
+    parser.add_argument('--end-date', type=date.fromisoformat, default=date.today() + timedelta(days=13))
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    case_cohorts, cohort_hours, capacity = synthetic_problem(args.cases, args.cohorts, args.reviewers, args.load, args.seed)
+    samples = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        assignment = auto_allocation.solve(case_cohorts, cohort_hours, capacity)
+        samples.append(time.perf_counter() - started)
+
+    report = {
+        'cases': args.cases,
+        'reviewers': args.reviewers,
+        'cohorts': args.cohorts,
+        'allocated': int((assignment >= 0).sum()),
+        'solve': summarise_ms(samples),
+        'checks': check(assignment, case_cohorts, cohort_hours, capacity),
+    }
+    if args.database:
+        report['database'] = database_dry_run(args.start_date, args.end_date, args.iterations)
+
+    print(f"{args.cases} cases, {args.reviewers} reviewers, {args.cohorts} cohorts: {report['allocated']} allocated")
+    print(f"solve p50 {report['solve']['p50_ms']:.1f}ms, p95 {report['solve']['p95_ms']:.1f}ms")
+    print('checks', ', '.join(f'{name} {value}' for name, value in report['checks'].items()))
+    if args.database:
+        row = report['database']
+        print(f"database: {row['cases']} cases, {row['reviewers']} reviewers, {row['allocated']} allocated, "
+              f"load p50 {row['load']['p50_ms']:.1f}ms, plan p50 {row['plan']['p50_ms']:.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
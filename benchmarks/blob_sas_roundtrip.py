@@ -0,0 +1,89 @@
+"""Upload and download a case document through SAS URLs against a storage emulator.
+
+Exercises the browser flow end to end: get-blob-sas (upload) -> PUT the bytes
+straight to storage -> post-blob-files (confirm, size + checksum) -> get-blob-sas
+(download) -> GET the bytes back and compare. The handlers run in-process; only
+the PUT/GET go over HTTP, to the emulator.
+
+Start Azurite (``azurite-blob --loose``) and point at a database seeded by
+benchmarks/seed.py:
+
+    BLOB_CONNECTION_STRING=UseDevelopmentStorage=true python benchmarks/blob_sas_roundtrip.py --size-mb 50
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import time
+import urllib.request
+
+from common import load_handler, settings_from_env
+
+import azure.functions as func
+from azure.core.exceptions import ResourceExistsError
+import fakes
+from shared_code import blob_storage
+
+
+def call(handler, method, params=None, body=None):
+    req = func.HttpRequest(
+        method=method, url='/api/handler', params=params or {},
+        body=json.dumps(body).encode() if body is not None else b'',
+        headers={'Content-Type': 'application/json'},
+    )
+    response = handler.main(req)
+    payload = json.loads(response.get_body())
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.status_code}: {payload}')
+    return payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--case-id', default='C0000001')
+    parser.add_argument('--size-mb', type=float, default=10)
+    args = parser.parse_args()
+
+    os.environ['blob_connection_string'] = os.getenv('BLOB_CONNECTION_STRING', 'UseDevelopmentStorage=true')
+    fakes.install(settings_from_env(), blob_storage_fake=False)
+    try:
+        blob_storage.get_blob_service_client().create_container(blob_storage.CASE_DOCUMENTS_CONTAINER)
+    except ResourceExistsError:
+        pass
+
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    content_md5 = base64.b64encode(hashlib.md5(payload).digest()).decode()
+    get_blob_sas = load_handler('get-blob-sas')
+    post_blob_files = load_handler('post-blob-files')
+
+    upload = call(get_blob_sas, 'GET', {'case_id': args.case_id, 'access': 'upload', 'file_name': 'statement.pdf'})
+    request = urllib.request.Request(upload['upload_url'], data=payload, method='PUT', headers={
+        'x-ms-blob-type': 'BlockBlob',
+        'x-ms-blob-content-md5': content_md5,
+        'Content-Type': 'application/pdf',
+    })
+    started = time.perf_counter()
+    urllib.request.urlopen(request).close()
+    upload_s = time.perf_counter() - started
+
+    confirm_body = {'case_id': args.case_id, 'blob_name': upload['blob_name'], 'file_description': 'Roundtrip test',
+                    'user_name': 'roundtrip@example.com', 'content_md5': content_md5}
+    confirmed = call(post_blob_files, 'POST', body=confirm_body)
+    assert confirmed['size_bytes'] == len(payload) and confirmed['content_md5'] == content_md5, confirmed
+    # A retried confirmation must not add a second row
+    assert call(post_blob_files, 'POST', body=confirm_body) == confirmed
+
+    download = call(get_blob_sas, 'GET', {'case_id': args.case_id, 'access': 'download', 'blob_name': upload['blob_name']})
+    started = time.perf_counter()
+    with urllib.request.urlopen(download['download_url']) as response:
+        downloaded = response.read()
+    download_s = time.perf_counter() - started
+    assert downloaded == payload, 'downloaded bytes differ from upload'
+
+    size_mb = len(payload) / (1024 * 1024)
+    print(f"{upload['blob_name']}: {size_mb:.1f} MB, upload {size_mb / upload_s:.1f} MB/s, download {size_mb / download_s:.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
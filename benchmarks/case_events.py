@@ -0,0 +1,116 @@
+"""Change event delivery through LISTEN/NOTIFY vs screens polling on a timer.
+
+Starts the per-worker shared_code.case_events listener and --subscribers coroutines on one
+event loop that long-poll it for the qc screen, as get-case-events does. A writer then publishes
+--events events, one transaction each, --interval seconds apart, through
+case_events.publish. Reports:
+
+* delivery latency from the writer's commit to each subscriber waking up
+* how many subscriber wake-ups were expected and how many were seen
+* what the same subscribers would have cost polling QC_MAIN_SCREEN_VW every
+  --poll-seconds over the run, from the timed cost of one poll
+
+    python benchmarks/case_events.py --subscribers 200 --events 50 --output case_events.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from contextlib import closing
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from shared_code import case_events, db
+
+POLL = ("SELECT * FROM mtl.QC_MAIN_SCREEN_VW WHERE (LENGTH(assignedtoqc) = 0 OR assignedtoqc IS NULL) "
+        "AND casestatusqc = 'NEW' AND END_TS = '9999-12-31 00:00:00'")
+
+
+async def subscriber(listener, token, stop, committed, latencies):
+    while not stop.is_set():
+        events, resync = await listener.wait(token, {'qc'}, set(), 1.0)
+        woke = time.perf_counter()
+        if resync:
+            raise RuntimeError('Subscriber token fell out of the listener buffer')
+        if events:
+            latencies.extend(woke - committed[event['source']] for event in events)
+            # The writer commits one transaction at a time, so carrying on after the newest
+            # seq is safe here; get-case-events takes a fresh snapshot token instead
+            newest = max(event['seq'] for event in events) + 1
+            token = f"{newest}:{newest}:"
+
+
+def write_events(conn, args, committed):
+    conn.autocommit = False
+    for n in range(args.events):
+        with conn.cursor() as cursor:
+            case_events.publish(cursor, f'benchmark-{n}', [f'C{n:07d}'], ['qc'])
+        committed[f'benchmark-{n}'] = time.perf_counter()
+        conn.commit()
+        time.sleep(args.interval)
+    time.sleep(1.5)
+
+
+async def run(conn, listener, token, args, committed, latencies):
+    stop = asyncio.Event()
+    subscribers = [asyncio.create_task(subscriber(listener, token, stop, committed, latencies))
+                   for _ in range(args.subscribers)]
+    run_started = time.perf_counter()
+    await asyncio.to_thread(write_events, conn, args, committed)
+    run_seconds = time.perf_counter() - run_started
+    stop.set()
+    await asyncio.gather(*subscribers)
+    return run_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=200)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.2)
+    parser.add_argument('--poll-seconds', type=float, default=30)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    settings = settings_from_env()
+    db.set_db_settings(settings)
+    listener = case_events.get_listener()
+    with closing(psycopg2.connect(**settings)) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            while listener.listen_snapshot is None:
+                time.sleep(0.05)
+            token = case_events.current_token(cursor)
+            started = time.perf_counter()
+            cursor.execute(POLL)
+            cursor.fetchall()
+            poll_cost = time.perf_counter() - started
+
+        committed, latencies = {}, []
+        run_seconds = asyncio.run(run(conn, listener, token, args, committed, latencies))
+
+    polls = args.subscribers * run_seconds / args.poll_seconds
+    report = {
+        'subscribers': args.subscribers,
+        'events': args.events,
+        'expected_deliveries': args.subscribers * args.events,
+        'deliveries': len(latencies),
+        'latency': summarise_ms(latencies),
+        'polling': {'polls': round(polls), 'poll_ms': round(poll_cost * 1000, 1),
+                    'database_seconds': round(polls * poll_cost, 2)},
+        'run_seconds': round(run_seconds, 1),
+    }
+
+    print(f"{report['deliveries']}/{report['expected_deliveries']} deliveries, "
+          f"p50 {report['latency']['p50_ms']:.1f}ms, p95 {report['latency']['p95_ms']:.1f}ms after commit")
+    print(f"polling every {args.poll_seconds:g}s instead: {report['polling']['polls']} polls of "
+          f"{report['polling']['poll_ms']}ms, {report['polling']['database_seconds']}s of database time")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
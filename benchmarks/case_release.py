@@ -0,0 +1,102 @@
+"""Insert time for post-case-release at 10k, 50k and 100k released cases.
+
+For each batch size the same rows go into mtl.BULK_CASE_RELEASE three ways, each in
+its own transaction that is rolled back afterwards:
+
+* legacy         - one INSERT ... VALUES with the values string-joined into the SQL
+                   (the old handler)
+* execute_values - psycopg2.extras.execute_values with bound values, --page-size rows
+                   per statement
+* copy           - COPY FROM STDIN through shared_code.db.copy_rows (the handler now)
+
+The handler itself is then called once per size, in process, to include request
+parsing and the main screen write event; its rows are deleted afterwards.
+
+    python benchmarks/case_release.py --sizes 10000 50000 100000 --output release.json
+"""
+import argparse
+import json
+import time
+from contextlib import closing
+
+from common import load_handler, settings_from_env
+
+import psycopg2
+from psycopg2.extras import execute_values
+import fakes
+from shared_code import db
+from suite import make_request
+
+COLUMNS = ('case_id', 'caserelease_by', 'case_released')
+RELEASED_BY = 'release.benchmark@example.com'
+
+
+def legacy(cursor, cases):
+    sql_values = ", ".join(f"('{case['case_id']}', '{RELEASED_BY}', false)" for case in cases)
+    cursor.execute(f"INSERT INTO mtl.BULK_CASE_RELEASE (case_id, caserelease_by, case_released) VALUES {sql_values};")
+
+
+def with_execute_values(page_size):
+    def run(cursor, cases):
+        execute_values(
+            cursor, "INSERT INTO mtl.BULK_CASE_RELEASE (case_id, caserelease_by, case_released) VALUES %s",
+            ((case['case_id'], RELEASED_BY, False) for case in cases), page_size=page_size
+        )
+    return run
+
+
+def copy(cursor, cases):
+    db.copy_rows(cursor, 'mtl.BULK_CASE_RELEASE', COLUMNS, ((case['case_id'], RELEASED_BY, False) for case in cases))
+
+
+def timed_rollback(conn, strategy, cases):
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        strategy(cursor, cases)
+    elapsed = time.perf_counter() - started
+    conn.rollback()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    settings = settings_from_env()
+    fakes.install(settings)
+    handler = load_handler('post-case-release')
+    strategies = {'legacy': legacy, 'execute_values': with_execute_values(args.page_size), 'copy': copy}
+
+    results = []
+    with closing(psycopg2.connect(**settings)) as conn:
+        for size in args.sizes:
+            cases = [{'case_id': f'REL{n:09d}', 'email': RELEASED_BY} for n in range(size)]
+            row = {'cases': size}
+            for name, strategy in strategies.items():
+                row[f'{name}_s'] = round(timed_rollback(conn, strategy, cases), 3)
+
+            started = time.perf_counter()
+            response = handler.main(make_request('post-case-release', 'POST', {}, cases))
+            row['handler_s'] = round(time.perf_counter() - started, 3)
+            if response.status_code != 200:
+                raise RuntimeError(response.get_body().decode())
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM mtl.BULK_CASE_RELEASE WHERE caserelease_by = %s", (RELEASED_BY,))
+            conn.commit()
+            results.append(row)
+
+    print(f"{'cases':>8}{'legacy':>10}{'values':>10}{'copy':>10}{'handler':>10}")
+    for row in results:
+        print(f"{row['cases']:>8}{row['legacy_s']:>9.2f}s{row['execute_values_s']:>9.2f}s"
+              f"{row['copy_s']:>9.2f}s{row['handler_s']:>9.2f}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'page_size': args.page_size, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Steady-state refresh of a list screen: full reload vs get-changes deltas.
+
+Expects the default seed (python benchmarks/seed.py), which applies
+sql/tables/change_feed.sql. Each round writes to --changes random cases, touching the
+current CASE_ALLOCATION and CASE_TRACKER rows without changing their values, then
+refreshes the QC unallocated screen both ways:
+
+* full  - the get-qc-cases query, the whole list downloaded again
+* delta - shared_code.change_feed.changes from the previous round's token
+
+Reports payload bytes and latency for both, and checks that every case written in the
+round came back in the delta.
+
+    python benchmarks/change_feed.py --rounds 10 --changes 50 --output change_feed.json
+"""
+import argparse
+import json
+import time
+from contextlib import closing
+from datetime import date, datetime
+from decimal import Decimal
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from shared_code import change_feed
+
+FULL = ("SELECT * FROM mtl.QC_MAIN_SCREEN_VW WHERE (LENGTH(assignedtoqc) = 0 OR assignedtoqc IS NULL) "
+        "AND casestatusqc = 'NEW' AND END_TS = '9999-12-31 00:00:00'")
+
+TOUCH = """
+UPDATE mtl.CASE_ALLOCATION SET on_hold_reason = on_hold_reason
+WHERE case_id = ANY(%(case_ids)s) AND end_ts = '9999-12-31 00:00:00';
+UPDATE mtl.CASE_TRACKER SET audit_log = audit_log
+WHERE case_id = ANY(%(case_ids)s) AND end_ts = '9999-12-31 00:00:00';
+"""
+
+
+def encode(obj):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(type(obj).__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--changes', type=int, default=50)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    full_samples, delta_samples, full_bytes, delta_bytes, missed = [], [], [], [], 0
+    with closing(psycopg2.connect(**settings_from_env())) as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            token = change_feed.current_token(cursor)
+        conn.commit()
+
+        for _ in range(args.rounds):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT case_id FROM mtl.CASE_ALLOCATION WHERE end_ts = '9999-12-31 00:00:00' "
+                               "ORDER BY random() LIMIT %s", (args.changes,))
+                case_ids = [row[0] for row in cursor.fetchall()]
+                cursor.execute(TOUCH, {'case_ids': case_ids})
+            conn.commit()
+
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                started = time.perf_counter()
+                cursor.execute(FULL)
+                body = json.dumps(cursor.fetchall(), default=encode)
+                full_samples.append(time.perf_counter() - started)
+                full_bytes.append(len(body))
+            conn.commit()
+
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                started = time.perf_counter()
+                token, rows = change_feed.changes(cursor, token)
+                body = json.dumps({'token': token, **rows}, default=encode)
+                delta_samples.append(time.perf_counter() - started)
+                delta_bytes.append(len(body))
+            conn.commit()
+
+            returned = {row['case_id'] for row in rows['case_allocation']}
+            missed += len(set(case_ids) - returned)
+
+    report = {
+        'rounds': args.rounds,
+        'changes_per_round': args.changes,
+        'full': {'bytes_p50': sorted(full_bytes)[len(full_bytes) // 2], **summarise_ms(full_samples)},
+        'delta': {'bytes_p50': sorted(delta_bytes)[len(delta_bytes) // 2], **summarise_ms(delta_samples)},
+        'missed_cases': missed,
+    }
+
+    print(f"{args.rounds} rounds of {args.changes} changed cases")
+    print(f"{'':<7}{'bytes':>12}{'p50':>10}{'p95':>10}")
+    for name in ('full', 'delta'):
+        row = report[name]
+        print(f"{name:<7}{row['bytes_p50']:>12}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms")
+    print(f"changed cases missing from the delta: {missed}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import importlib.util
+import os
+import sys
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'functions')
+if FUNCTIONS_DIR not in sys.path:
+    sys.path.insert(0, FUNCTIONS_DIR)
+
+
+def load_handler(function_name):
+    # Function folders use hyphens, so they cannot be imported by name
+    path = os.path.join(FUNCTIONS_DIR, function_name, '__init__.py')
+    spec = importlib.util.spec_from_file_location(function_name.replace('-', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def settings_from_env():
+    # Standard libpq variables, so benchmarks never contact Key Vault
+    return {
+        'host': os.getenv('PGHOST', 'localhost'),
+        'port': os.getenv('PGPORT', '5432'),
+        'dbname': os.getenv('PGDATABASE', 'postgres'),
+        'user': os.getenv('PGUSER', 'postgres'),
+        'password': os.getenv('PGPASSWORD', ''),
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarise_ms(samples):
+    return {
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000 if samples else 0.0,
+    }
@@ -0,0 +1,211 @@
+"""Contact save latency, legacy multi-statement flow vs one statement, at 5/20/50 ms RTT.
+
+A small TCP proxy in front of Postgres holds every packet for half the simulated round
+trip in each direction, so each statement costs what it would from a Function App in
+another region. For each RTT the same outbound-call save (proposed name change plus a
+new address) is made --requests times three ways:
+
+* legacy  - the old post-contact-updates sequence: BEGIN, version lock, two contact
+            tracker updates, address close, address insert, COMMIT
+* single  - shared_code.contact_writes on an open autocommit connection (one round trip,
+            prepared on first use)
+* handler - the post-contact-updates handler in process, on the worker's connection pool
+
+    python benchmarks/contact_round_trips.py --rtt-ms 5 20 50 --requests 50 --output contacts.json
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+from contextlib import closing
+
+from common import load_handler, settings_from_env, summarise_ms
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+import fakes
+from shared_code import contact_writes, db, instrumentation
+from suite import make_request
+
+SAVED_BY = 'contact.benchmark@example.com'
+
+LEGACY_STATEMENTS = [
+    ("SELECT contact_tracker_sk FROM mtl.contact_tracker WHERE contact_tracker_sk = %(contact_tracker_sk)s "
+     "AND case_id = %(case_id)s AND end_ts = '9999-12-31 00:00:00' FOR UPDATE NOWAIT"),
+    ("UPDATE mtl.contact_tracker SET proposed_title_change = %(proposed_title)s, proposed_forename_change = %(proposed_forename)s, "
+     "proposed_middle_name_change = %(proposed_middle_name)s, proposed_surname_change = %(proposed_surname)s, tl_rejection_reason = NULL, "
+     "recalc_reason = %(recalc_reason)s, payment_type = %(payment_type)s, customer_info_confirmed = %(customer_info_confirmed)s "
+     "WHERE case_id = %(case_id)s AND contact_tracker_sk = %(contact_tracker_sk)s AND end_ts = '9999-12-31 00:00:00'"),
+    ("UPDATE mtl.contact_tracker SET contact_actual_ts = %(contact_actual_ts)s::timestamp, outcome = %(outcome)s, contact_type = %(contact_type)s, "
+     "call_summary = %(call_summary)s, update_user = %(update_user)s, sc_approval_required = %(sc_approval_required)s, audit_log = %(audit_log)s, "
+     "recalc_reason = %(recalc_reason)s, payment_type = %(payment_type)s, customer_info_confirmed = %(customer_info_confirmed)s "
+     "WHERE case_id = %(case_id)s AND contact_tracker_sk = %(contact_tracker_sk)s AND end_ts = '9999-12-31 00:00:00'"),
+    "UPDATE mtl.address SET end_ts = CURRENT_TIMESTAMP WHERE case_id = %(case_id)s AND end_ts = '9999-12-31 00:00:00'",
+    ("INSERT INTO mtl.address (case_id, title, forename, surname, address_line_1, postcode, update_user, audit_log, start_ts, end_ts) "
+     "VALUES (%(case_id)s, %(title)s, %(forename)s, %(surname)s, %(address_line_1)s, %(postcode)s, %(update_user)s, %(audit_log)s, "
+     "CURRENT_TIMESTAMP, '9999-12-31 00:00:00')"),
+]
+
+
+class DelayProxy:
+    # Forwards localhost connections to Postgres, sleeping rtt/2 before passing on each chunk
+    def __init__(self, upstream_host, upstream_port, rtt_ms):
+        self._upstream = (upstream_host, int(upstream_port))
+        self._delay = rtt_ms / 2000
+        self._listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self._listener.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(self._upstream)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._pump, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client), daemon=True).start()
+
+    def _pump(self, source, target):
+        try:
+            while True:
+                chunk = source.recv(65536)
+                if not chunk:
+                    break
+                time.sleep(self._delay)
+                target.sendall(chunk)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, target):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def close(self):
+        self._listener.close()
+
+
+def load_contacts(settings, count):
+    with closing(psycopg2.connect(**settings)) as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT case_id, max(contact_tracker_sk) FROM mtl.contact_tracker "
+            "WHERE end_ts = '9999-12-31 00:00:00' GROUP BY case_id ORDER BY case_id LIMIT %s",
+            (count,)
+        )
+        return cursor.fetchall()
+
+
+def address_payload(case_id, contact_tracker_sk, n):
+    return {
+        'case_id': case_id, 'contact_tracker_sk': contact_tracker_sk, 'contact_type': 'Outbound Call',
+        'outcome': 'Spoke to customer', 'actual_contact_dtm': '2024-05-01 10:30:00', 'call_summary': f'Benchmark call {n}',
+        'proposed_title': 'Dr', 'proposed_forename': 'Sam', 'proposed_middle_name': None, 'proposed_surname': 'Example',
+        'sc_approval_required': 'Yes', 'recalc_reason': 'Address change', 'payment_type': 'Cheque',
+        'customer_info_confirmed': 'Yes', 'title': 'Dr', 'forename': 'Sam', 'surname': 'Example',
+        'address_line_1': f'{n} Benchmark Road', 'postcode': 'BE1 1NC', 'update_user': SAVED_BY,
+        'audit_log': 'Outbound Contact Screen - Outcome: Spoke to customer',
+    }
+
+
+def statement_params(payload):
+    params = {key: value for key, value in payload.items() if key != 'actual_contact_dtm'}
+    params['contact_actual_ts'] = '2024-05-01T10:30:00Z'
+    # Saves the same rows over and over, so the row_version check is left out
+    params['row_version'] = None
+    return params
+
+
+def address_row(params):
+    columns = ['case_id', 'title', 'forename', 'surname', 'address_line_1', 'postcode', 'update_user', 'audit_log']
+    return {column: params[column] for column in columns}
+
+
+def run_legacy(conn, params):
+    with conn.cursor() as cursor:
+        for statement in LEGACY_STATEMENTS:
+            cursor.execute(statement, params)
+    conn.commit()
+
+
+def run_single(conn, params):
+    statement, statement_args = contact_writes.contact_update(conn, params, 'outbound_call', address_row(params))
+    with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        contact_writes.run(cursor, statement, statement_args)
+
+
+def timed(samples, call):
+    started = time.perf_counter()
+    call()
+    samples.append(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rtt-ms', type=float, nargs='+', default=[5, 20, 50])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    settings = settings_from_env()
+    handler = load_handler('post-contact-updates')
+    contacts = load_contacts(settings, args.requests)
+    if not contacts:
+        raise SystemExit('No current contact tracker rows; run seed.py first')
+
+    results = []
+    for rtt_ms in args.rtt_ms:
+        proxy = DelayProxy(settings['host'], settings['port'], rtt_ms)
+        proxied = dict(settings, host='127.0.0.1', port=str(proxy.port))
+        fakes.install(proxied)
+        samples = {'legacy': [], 'single': [], 'handler': []}
+
+        single = closing(psycopg2.connect(**proxied, connection_factory=instrumentation.InstrumentedConnection))
+        with closing(psycopg2.connect(**proxied)) as legacy_conn, single as single_conn:
+            single_conn.autocommit = True
+            for n in range(args.requests):
+                case_id, contact_tracker_sk = contacts[n % len(contacts)]
+                payload = address_payload(case_id, contact_tracker_sk, n)
+                params = statement_params(payload)
+                timed(samples['legacy'], lambda: run_legacy(legacy_conn, params))
+                timed(samples['single'], lambda: run_single(single_conn, params))
+
+                request = make_request('post-contact-updates', 'POST', {'query-type': 'outbound_call'}, {'address': payload})
+                started = time.perf_counter()
+                response = handler.main(request)
+                samples['handler'].append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(response.get_body().decode())
+        # The pool points at this RTT's proxy; the next RTT opens a new one
+        db.get_pool().closeall()
+        proxy.close()
+
+        row = {'rtt_ms': rtt_ms}
+        for name, timings in samples.items():
+            row[name] = summarise_ms(timings)
+        results.append(row)
+
+    with closing(psycopg2.connect(**settings)) as conn, conn.cursor() as cursor:
+        cursor.execute("DELETE FROM mtl.address WHERE update_user = %s", (SAVED_BY,))
+        cursor.execute(
+            "UPDATE mtl.address a SET end_ts = '9999-12-31 00:00:00' WHERE a.update_user = 'seed' "
+            "AND NOT EXISTS (SELECT 1 FROM mtl.address c WHERE c.case_id = a.case_id AND c.end_ts = '9999-12-31 00:00:00')"
+        )
+        conn.commit()
+
+    print(f"{'rtt':>6}{'legacy p50':>12}{'single p50':>12}{'handler p50':>13}")
+    for row in results:
+        print(f"{row['rtt_ms']:>4.0f}ms{row['legacy']['p50_ms']:>10.1f}ms{row['single']['p50_ms']:>10.1f}ms"
+              f"{row['handler']['p50_ms']:>11.1f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'requests': args.requests, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""In-process stand-ins for Key Vault and Blob Storage used by the local benchmarks.
+
+Only the calls the handlers make are implemented. Uploaded blobs are kept in memory
+so exports can be sized and checked after a run.
+"""
+import io
+
+from shared_code import blob_storage, db
+
+
+class FakeSecret:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class FakeSecretClient:
+    def __init__(self, secrets):
+        self._secrets = dict(secrets)
+
+    def get_secret(self, name):
+        if name not in self._secrets:
+            raise KeyError(f'Secret not found: {name}')
+        return FakeSecret(name, self._secrets[name])
+
+
+def key_vault_for(settings, **extra_secrets):
+    # Maps psycopg2 settings back onto the Key Vault secret names the handlers ask for
+    secrets = {db.DB_SECRET_NAMES[key]: str(value) for key, value in settings.items()}
+    secrets.setdefault('DataConnectionString', 'UseDevelopmentStorage=true')
+    secrets.update(extra_secrets)
+    return FakeSecretClient(secrets)
+
+
+class FakeDownloader(io.BytesIO):
+    def __init__(self, payload):
+        super().__init__(payload)
+        self.size = len(payload)
+
+    def chunks(self):
+        yield self.getvalue()
+
+    def readall(self):
+        return self.getvalue()
+
+
+class FakeBlobClient:
+    # Staged blocks live in a separate dict until commit_block_list, as in storage
+    _staged = {}
+
+    def __init__(self, store, container, blob):
+        self._store = store
+        self.container_name = container
+        self.blob_name = blob
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        key = (self.container_name, self.blob_name)
+        if key in self._store and not overwrite:
+            raise ValueError(f'Blob already exists: {self.container_name}/{self.blob_name}')
+        if isinstance(data, (bytes, bytearray)):
+            payload = bytes(data)
+        elif isinstance(data, str):
+            payload = data.encode()
+        elif hasattr(data, 'read'):
+            payload = data.read()
+        else:
+            payload = b''.join(data)
+        self._store[key] = payload
+        return {'etag': str(len(self._store)), 'size': len(payload)}
+
+    def stage_block(self, block_id, data, **kwargs):
+        self._staged[(self.container_name, self.blob_name, block_id)] = bytes(data)
+
+    def commit_block_list(self, blocks, **kwargs):
+        payload = b''.join(self._staged.pop((self.container_name, self.blob_name, block.id)) for block in blocks)
+        self._store[(self.container_name, self.blob_name)] = payload
+        return {'etag': str(len(self._store)), 'size': len(payload)}
+
+    def download_blob(self, **kwargs):
+        return FakeDownloader(self._store[(self.container_name, self.blob_name)])
+
+    def exists(self):
+        return (self.container_name, self.blob_name) in self._store
+
+    def delete_blob(self, **kwargs):
+        del self._store[(self.container_name, self.blob_name)]
+
+
+class FakeBlobServiceClient:
+    # Shared across instances, as every handler builds its own client
+    blobs = {}
+
+    def __init__(self, connection_string=None):
+        self.connection_string = connection_string
+
+    @classmethod
+    def from_connection_string(cls, connection_string, **kwargs):
+        return cls(connection_string)
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self.blobs, container, blob)
+
+    @classmethod
+    def uploaded_bytes(cls):
+        return sum(len(payload) for payload in cls.blobs.values())
+
+    @classmethod
+    def reset(cls):
+        cls.blobs.clear()
+
+
+def install(settings, blob_storage_fake=True):
+    # Route Key Vault lookups in shared_code.db, and blob I/O in shared_code.blob_storage, to the fakes
+    db.set_secret_client(key_vault_for(settings))
+    db.set_db_settings(settings)
+    if blob_storage_fake:
+        blob_storage.set_blob_service_client(FakeBlobServiceClient())
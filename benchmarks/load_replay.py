@@ -0,0 +1,327 @@
+"""Replay a mix of endpoint calls against a running function host.
+
+Start the host locally (``func start`` in functions/, pointed at a seeded database
+such as the one benchmarks/seed.py builds), then either
+
+* replay a recorded session - a JSONL file, one call per line:
+      {"at": 12.5, "function": "get-qc-cases", "method": "GET", "params": {"query_type": "allocated"}}
+      {"at": 12.9, "function": "post-qc-assigned-cases", "method": "POST", "body": [...]}
+  ``at`` is seconds from the start of the recording; --speed scales it, and
+  --as-fast-as-possible ignores it; or
+* generate a synthetic mix from one of the PROFILES for --duration seconds.
+  --save writes the calls that were issued in the replay format so a run can be repeated.
+
+Calls are issued by --concurrency workers (closed loop), or paced to --rate calls
+per second (open loop). For every endpoint it reports throughput, error rate,
+latency percentiles and a latency histogram. While the load runs, pg_stat_activity
+is sampled for sessions waiting on locks; shared_code.db tags each connection with
+application_name 'mtl:<function>', so lock waits are attributed to endpoints.
+
+    python benchmarks/load_replay.py --profile monday-rush --duration 120 --concurrency 40 --output rush.json
+    python benchmarks/load_replay.py --replay recorded.jsonl --speed 2
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import time
+from collections import defaultdict
+
+from common import settings_from_env, summarise_ms
+
+import aiohttp
+import asyncpg
+from suite import load_samples
+
+HISTOGRAM_BOUNDS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+def pick(rng, values):
+    return values[rng.randrange(len(values))]
+
+
+def qc_allocation(samples, rng):
+    # Team leads allocate overlapping slices of the same pool, as in the Monday rush
+    start = rng.randrange(max(1, len(samples['review_completed']) - 50))
+    cases = samples['review_completed'][start:start + rng.randint(10, 50)]
+    qc_email, qc_name = pick(rng, samples['qc_users'])
+    body = [
+        {'qcemail': qc_email, 'qcname': qc_name, 'case_selection_criteria': 'Random', 'case_id': case_id, 'email': qc_email}
+        for case_id in cases
+    ]
+    return 'post-qc-assigned-cases', 'POST', {}, body
+
+
+def case_update(samples, rng):
+    case_id, analyst = pick(rng, samples['in_review'])
+    body = {
+        'case_id': case_id,
+        'update_user': analyst,
+        'iscomplete': rng.random() < 0.3,
+        'access_level': 1,
+        'review_outcome': pick(rng, ['Redress due', 'No redress']),
+        'analyst_notes': 'Load test review notes ' + ' '.join(str(rng.randrange(10 ** 6)) for _ in range(20)),
+    }
+    return 'update-case', 'POST', {}, body
+
+
+def open_case(samples, rng):
+    case_id, analyst = pick(rng, samples['in_review'])
+    return 'post-open-case', 'POST', {}, {'case_id': case_id, 'userEmail': analyst, 'role': 'File Reviewer'}
+
+
+def case_tags(samples, rng):
+    case_id = pick(rng, samples['case_ids'])
+    return 'post-case-tags', 'POST', {}, {'case_id': case_id, 'tags': pick(rng, ['Vulnerable', 'Complaint', 'Priority']), 'userEmail': 'tl1@example.com'}
+
+
+def get(function_name, **params):
+    return lambda samples, rng: (function_name, 'GET', params, None)
+
+
+def case_read(function_name, param):
+    return lambda samples, rng: (function_name, 'GET', {param: pick(rng, samples['case_ids'])}, None)
+
+
+def assigned_cases(samples, rng):
+    return 'get-assigned-cases', 'GET', {'user': pick(rng, samples['analysts']), 'query_type': 'fr'}, None
+
+
+# profile -> [(weight, builder(samples, rng) -> (function, method, params, body))]
+PROFILES = {
+    'monday-rush': [
+        (20, qc_allocation),
+        (25, get('get-qc-cases', query_type='unallocated')),
+        (15, get('get-qc-cases', query_type='allocated')),
+        (5, get('get-qc-cases', query_type='batched')),
+        (10, assigned_cases),
+        (10, case_update),
+        (5, open_case),
+        (5, case_read('get-case', 'caseId')),
+        (3, get('get-dashboard', query_type='case_tracker')),
+        (2, case_tags),
+    ],
+    'read-only': [
+        (30, get('get-qc-cases', query_type='unallocated')),
+        (20, get('get-qa-cases', query_type='unallocated')),
+        (20, assigned_cases),
+        (15, case_read('get-case', 'caseId')),
+        (10, lambda samples, rng: ('get-case-details', 'GET', {'query_type': 'bundle', 'case_id': pick(rng, samples['case_ids'])}, None)),
+        (5, get('get-dashboard', query_type='case_tracker')),
+    ],
+}
+
+
+def synthetic_calls(profile, samples, rate, seed):
+    # Endless; drive() stops pulling once --duration has passed
+    rng = random.Random(seed)
+    weights = [weight for weight, _ in PROFILES[profile]]
+    builders = [builder for _, builder in PROFILES[profile]]
+    i = 0
+    while True:
+        function_name, method, params, body = rng.choices(builders, weights)[0](samples, rng)
+        yield {'at': i / rate if rate else 0.0, 'function': function_name, 'method': method, 'params': params, 'body': body}
+        i += 1
+
+
+def recorded_calls(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.status_codes = defaultdict(int)
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def record(self, elapsed, status):
+        self.latencies.append(elapsed)
+        self.status_codes[status] += 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, elapsed * 1000)] += 1
+
+
+async def issue(session, base_url, call, stats):
+    started = time.perf_counter()
+    status = None
+    try:
+        async with session.request(
+            call.get('method', 'GET'),
+            f"{base_url}/{call['function']}",
+            params=call.get('params') or None,
+            json=call.get('body'),
+        ) as response:
+            await response.read()
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+    stats[call['function']].record(time.perf_counter() - started, status)
+
+
+async def drive(calls, base_url, concurrency, speed, paced, duration, timeout):
+    stats = defaultdict(EndpointStats)
+    issued = []
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def worker():
+            while True:
+                call = await queue.get()
+                if call is None:
+                    return
+                await issue(session, base_url, call, stats)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for call in calls:
+            if duration is not None and time.perf_counter() - started >= duration:
+                break
+            if paced:
+                # Open loop: hold each call until its scheduled time
+                delay = started + call['at'] / speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                call = dict(call, at=round(time.perf_counter() - started, 3))
+            issued.append(call)
+            await queue.put(call)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+    return stats, elapsed, issued
+
+
+async def sample_lock_waits(settings, interval, stop):
+    # Approximates lock wait time per endpoint as waiting sessions x sample interval
+    waits = defaultdict(lambda: {'lock_wait_s': 0.0, 'max_waiters': 0})
+    conn = await asyncpg.connect(
+        host=settings['host'], port=int(settings['port']), database=settings['dbname'],
+        user=settings['user'], password=settings['password'],
+    )
+    try:
+        deadlocks_before = await conn.fetchval("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        while not stop.is_set():
+            rows = await conn.fetch(
+                """SELECT application_name, COUNT(*) AS waiters
+                   FROM pg_stat_activity
+                   WHERE datname = current_database() AND wait_event_type = 'Lock' AND pid <> pg_backend_pid()
+                   GROUP BY application_name"""
+            )
+            for row in rows:
+                endpoint = row['application_name'].removeprefix('mtl:') or 'unknown'
+                waits[endpoint]['lock_wait_s'] += row['waiters'] * interval
+                waits[endpoint]['max_waiters'] = max(waits[endpoint]['max_waiters'], row['waiters'])
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+        deadlocks_after = await conn.fetchval("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+    finally:
+        await conn.close()
+    return dict(waits), deadlocks_after - deadlocks_before
+
+
+async def run(calls, args, settings):
+    stop = asyncio.Event()
+    sampler = None
+    if settings is not None:
+        sampler = asyncio.create_task(sample_lock_waits(settings, args.lock_sample_ms / 1000, stop))
+    try:
+        paced = bool(args.rate) if args.profile else not args.as_fast_as_possible
+        duration = args.duration if args.profile else None
+        stats, elapsed, issued = await drive(calls, args.base_url, args.concurrency, args.speed, paced, duration, args.timeout)
+    finally:
+        stop.set()
+    lock_waits, deadlocks = await sampler if sampler else ({}, None)
+    return stats, elapsed, issued, lock_waits, deadlocks
+
+
+def build_report(stats, elapsed, lock_waits, deadlocks):
+    endpoints = {}
+    for function_name, endpoint in sorted(stats.items()):
+        count = len(endpoint.latencies)
+        endpoints[function_name] = {
+            'requests': count,
+            'errors': endpoint.errors,
+            'error_rate': endpoint.errors / count if count else 0.0,
+            'throughput_per_sec': count / elapsed if elapsed else 0.0,
+            **summarise_ms(endpoint.latencies),
+            'status_codes': {str(code): n for code, n in endpoint.status_codes.items()},
+            'histogram_ms': {
+                f'<={bound}' if i < len(HISTOGRAM_BOUNDS_MS) else f'>{HISTOGRAM_BOUNDS_MS[-1]}': n
+                for i, (bound, n) in enumerate(zip(HISTOGRAM_BOUNDS_MS + [None], endpoint.histogram))
+            },
+            **lock_waits.get(function_name, {'lock_wait_s': 0.0, 'max_waiters': 0}),
+        }
+    total = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'elapsed_s': elapsed,
+        'requests': total,
+        'throughput_per_sec': total / elapsed if elapsed else 0.0,
+        'deadlocks': deadlocks,
+        'endpoints': endpoints,
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['elapsed_s']:.1f}s ({report['throughput_per_sec']:.1f}/s), deadlocks: {report['deadlocks']}")
+    print(f"{'endpoint':<28}{'req':>7}{'req/s':>8}{'err %':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'lock s':>8}")
+    for name, endpoint in report['endpoints'].items():
+        print(f"{name:<28}{endpoint['requests']:>7}{endpoint['throughput_per_sec']:>8.1f}{endpoint['error_rate'] * 100:>7.1f}"
+              f"{endpoint['p50_ms']:>8.0f}{endpoint['p95_ms']:>8.0f}{endpoint['p99_ms']:>8.0f}{endpoint['lock_wait_s']:>8.1f}")
+        peak = max(endpoint['histogram_ms'].values()) or 1
+        for bucket, n in endpoint['histogram_ms'].items():
+            if n:
+                print(f"    {bucket:>8} ms {'#' * max(1, round(n / peak * 40))} {n}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--replay', help='JSONL file of recorded calls')
+    source.add_argument('--profile', choices=sorted(PROFILES), help='Generate a synthetic mix')
+    parser.add_argument('--base-url', default='http://localhost:7071/api')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--rate', type=float, help='Calls per second (open loop); default is closed loop')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of synthetic traffic')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier')
+    parser.add_argument('--as-fast-as-possible', action='store_true', help='Ignore recorded timings')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Write the issued calls as a replay file')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--lock-sample-ms', type=float, default=200)
+    parser.add_argument('--no-db', action='store_true', help='Skip sampling Postgres (PG* variables) for lock waits')
+    parser.add_argument('--output', help='Write the report as JSON')
+    args = parser.parse_args()
+
+    settings = None if args.no_db else settings_from_env()
+    if args.profile:
+        # Sample ids come from the same database the host is pointed at
+        calls = synthetic_calls(args.profile, load_samples(settings_from_env()), args.rate, args.seed)
+    else:
+        calls = recorded_calls(args.replay)
+
+    stats, elapsed, issued, lock_waits, deadlocks = asyncio.run(run(calls, args, settings))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            for call in issued:
+                f.write(json.dumps(call) + '\n')
+
+    report = build_report(stats, elapsed, lock_waits, deadlocks)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
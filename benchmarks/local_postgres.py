@@ -0,0 +1,60 @@
+"""Throwaway Postgres cluster for benchmarks.
+
+Uses initdb/pg_ctl from PATH or from ``pg_config --bindir``. The cluster lives in a
+temporary directory, listens on 127.0.0.1 only, runs with fsync off, and is
+removed on exit. initdb refuses to run as root; point the benchmarks at an
+existing server with the PG* variables instead in that case.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+
+def postgres_bindir():
+    initdb = shutil.which('initdb')
+    if initdb:
+        return os.path.dirname(initdb)
+    pg_config = shutil.which('pg_config')
+    if pg_config:
+        bindir = subprocess.run([pg_config, '--bindir'], capture_output=True, text=True, check=True).stdout.strip()
+        if os.path.exists(os.path.join(bindir, 'initdb')):
+            return bindir
+    raise RuntimeError('initdb not found; install PostgreSQL server binaries or set PGHOST to use an existing server')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_postgres(keep=False):
+    bindir = postgres_bindir()
+    workdir = tempfile.mkdtemp(prefix='mtl-bench-pg-')
+    datadir = os.path.join(workdir, 'data')
+    port = free_port()
+
+    subprocess.run(
+        [os.path.join(bindir, 'initdb'), '-D', datadir, '-U', 'postgres', '-A', 'trust', '--no-sync'],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    options = f"-p {port} -k {workdir} -c listen_addresses=127.0.0.1 -c fsync=off -c synchronous_commit=off -c max_connections=200"
+    subprocess.run(
+        [os.path.join(bindir, 'pg_ctl'), '-D', datadir, '-o', options, '-l', os.path.join(workdir, 'postgres.log'), '-w', 'start'],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    try:
+        yield {'host': '127.0.0.1', 'port': str(port), 'dbname': 'postgres', 'user': 'postgres', 'password': ''}
+    finally:
+        subprocess.run(
+            [os.path.join(bindir, 'pg_ctl'), '-D', datadir, '-m', 'fast', '-w', 'stop'],
+            check=False, stdout=subprocess.DEVNULL,
+        )
+        if keep:
+            print(f'Postgres data kept in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
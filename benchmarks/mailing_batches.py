@@ -0,0 +1,144 @@
+"""Mailing batch review, per-case updates vs one statement per action.
+
+Expects the default seed (python benchmarks/seed.py), which releases a share of the
+CTC-completed cases. Each iteration cuts a batch of --batch-size released cases with
+shared_code.mailing_batches.create_batch, reviews it (--fail-share removed with a
+reason, --reset-share reset, the rest approved) and rolls everything back:
+
+* per-case - the old post-mailing-review loop, one UPDATE per case
+* bulk     - mailing_batches.review, one statement per action
+
+After each bulk review the MAILING_BATCH counters are checked against a recount of
+QC_MAILING, and the cost of reading readiness is compared: the counter row against
+aggregating the batch's QC_MAILING rows.
+
+    python benchmarks/mailing_batches.py --batch-size 2000 --iterations 5 --output mailing.json
+"""
+import argparse
+import json
+import time
+from contextlib import closing
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from shared_code import mailing_batches
+
+RECOUNT = f"""
+SELECT count(*),
+       count(*) FILTER (WHERE state = 'ready'), count(*) FILTER (WHERE state = 'removed'),
+       count(*) FILTER (WHERE state = 'reset')
+FROM (SELECT {mailing_batches.state('qm')} AS state FROM mtl.QC_MAILING qm WHERE mailing_batch_number = %s) AS rows
+"""
+
+COUNTERS = "SELECT cases, ready, removed, reset FROM mtl.MAILING_BATCH WHERE mailing_batch_number = %s"
+
+
+def review_body(case_ids, batch_number, fail_share, reset_share):
+    body = []
+    for n, case_id in enumerate(case_ids):
+        position = n / len(case_ids)
+        if position < fail_share:
+            body.append({'mailing_check': 'fail', 'removal_reason': 'Address incomplete'})
+        elif position < fail_share + reset_share:
+            body.append({'mailing_check': 'reset'})
+        else:
+            body.append({'mailing_check': 'pass'})
+        body[-1].update({'case_id': case_id, 'batch_number': batch_number, 'userEmail': 'qc1@example.com'})
+    return body
+
+
+def per_case_review(cursor, body):
+    for item in body:
+        if item['mailing_check'] == 'pass':
+            cursor.execute("UPDATE mtl.QC_MAILING SET QC_MAILING_READY = TRUE, QC_USER_EMAIL = %s, QC_INSERT_TS = CURRENT_TIMESTAMP "
+                           "WHERE case_id = %s AND mailing_batch_number = %s",
+                           (item['userEmail'], item['case_id'], item['batch_number']))
+        elif item['mailing_check'] == 'fail':
+            cursor.execute("UPDATE mtl.QC_MAILING SET QC_REASON_REMOVE_BATCH = %s, QC_MAILING_READY = FALSE, QC_USER_EMAIL = %s, "
+                           "QC_INSERT_TS = CURRENT_TIMESTAMP WHERE case_id = %s AND mailing_batch_number = %s",
+                           (item['removal_reason'], item['userEmail'], item['case_id'], item['batch_number']))
+        else:
+            cursor.execute("UPDATE mtl.CASE_ALLOCATION SET CASERELEASE_TS = NULL WHERE case_id = %s; "
+                           "UPDATE mtl.QC_MAILING SET CASE_RESET = TRUE WHERE case_id = %s AND mailing_batch_number = %s;",
+                           (item['case_id'], item['case_id'], item['batch_number']))
+            cursor.execute("UPDATE mtl.CASE_TRACKER SET END_TS = CURRENT_TIMESTAMP WHERE end_ts = '9999-12-31 00:00:00' and case_id = %s",
+                           (item['case_id'],))
+            cursor.execute("INSERT INTO mtl.CASE_TRACKER (case_id, state, sub_state, start_ts, end_ts, audit_log, update_user) "
+                           "VALUES (%s, 'Review', 'Case Review Unallocated', CURRENT_TIMESTAMP, '9999-12-31 00:00:00', "
+                           "'FUNCTION: post-mailing-review', %s)", (item['case_id'], item['userEmail']))
+
+
+def timed_read(cursor, statement, batch_number, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        cursor.execute(statement, (batch_number,))
+        cursor.fetchall()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--fail-share', type=float, default=0.05)
+    parser.add_argument('--reset-share', type=float, default=0.02)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    create_samples, per_case_samples, bulk_samples = [], [], []
+    counter_reads, recount_reads, mismatches, cases = [], [], 0, 0
+    with closing(psycopg2.connect(**settings_from_env())) as conn:
+        for _ in range(args.iterations):
+            for mode in ('per-case', 'bulk'):
+                with conn.cursor() as cursor:
+                    started = time.perf_counter()
+                    batch_number, case_ids = mailing_batches.create_batch(cursor, 'benchmark', args.batch_size)
+                    create_samples.append(time.perf_counter() - started)
+                    if batch_number is None:
+                        raise SystemExit('No released cases to batch; run benchmarks/seed.py first')
+                    cases = len(case_ids)
+                    body = review_body(case_ids, batch_number, args.fail_share, args.reset_share)
+
+                    started = time.perf_counter()
+                    if mode == 'per-case':
+                        per_case_review(cursor, body)
+                        per_case_samples.append(time.perf_counter() - started)
+                    else:
+                        mailing_batches.review(cursor, body)
+                        bulk_samples.append(time.perf_counter() - started)
+                        cursor.execute(COUNTERS, (batch_number,))
+                        counters = cursor.fetchone()
+                        cursor.execute(RECOUNT, (batch_number,))
+                        if cursor.fetchone() != counters:
+                            mismatches += 1
+                        counter_reads += timed_read(cursor, COUNTERS, batch_number, 10)
+                        recount_reads += timed_read(cursor, RECOUNT, batch_number, 10)
+                conn.rollback()
+
+    report = {
+        'batch_size': cases,
+        'create_batch': summarise_ms(create_samples),
+        'per_case': summarise_ms(per_case_samples),
+        'bulk': summarise_ms(bulk_samples),
+        'readiness': {'counters': summarise_ms(counter_reads), 'recount': summarise_ms(recount_reads)},
+        'counter_mismatches': mismatches,
+    }
+
+    print(f"batch of {cases} cases, cut in p50 {report['create_batch']['p50_ms']:.1f}ms")
+    print(f"{'review':<10}{'p50':>10}{'p95':>10}")
+    for name in ('per_case', 'bulk'):
+        row = report[name]
+        print(f"{name:<10}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms")
+    print(f"readiness p50: counters {report['readiness']['counters']['p50_ms']:.2f}ms, "
+          f"recount {report['readiness']['recount']['p50_ms']:.2f}ms, counter mismatches {mismatches}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Claim throughput for post-next-case with many reviewers pulling at once.
+
+--workers threads, each with its own connection (one reviewer each), claim cases from
+one role's queue through shared_code.work_queue until --claims cases have been handed
+out. Each mode is run in turn:
+
+* skip-locked - the shipped statement, FOR UPDATE SKIP LOCKED
+* for-update  - the same statement with plain FOR UPDATE, where every claimer queues on
+                the row at the head of the queue
+
+Reports claims/s, claim latency, how many sessions were seen waiting on locks in
+pg_stat_activity, and checks that no case was handed out twice. Claimed cases are put
+back in the queue after each mode. Keep --workers below the server's max_connections.
+
+    python benchmarks/next_case.py --role qc --workers 64 --claims 2000 --output next_case.json
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from seed import REPO_DIR, apply_sql_file
+from shared_code import inbox, work_queue
+
+INDEX_FILE = f'{REPO_DIR}/sql/indexes/case_allocation_work_queue.sql'
+
+LOCK_WAITS = "SELECT count(*) FROM pg_stat_activity WHERE wait_event_type = 'Lock' AND application_name = 'next_case_benchmark'"
+
+
+def claimer(settings, statement, worker, remaining, lock, claimed, samples):
+    email = f'puller{worker}@example.com'
+    with closing(psycopg2.connect(**settings, application_name='next_case_benchmark')) as conn:
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            with conn.cursor() as cursor:
+                cursor.execute(statement, {'email': email, 'name': f'Puller {worker}', 'cohort': None})
+                row = cursor.fetchone()
+                if row is not None:
+                    inbox.sync(cursor, [row[0]])
+            conn.commit()
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append(elapsed)
+                if row is None:
+                    remaining[0] = 0
+                else:
+                    claimed.append(row[0])
+
+
+def sample_lock_waits(settings, stop, waits):
+    with closing(psycopg2.connect(**settings)) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            while not stop.is_set():
+                cursor.execute(LOCK_WAITS)
+                waits.append(cursor.fetchone()[0])
+                time.sleep(0.05)
+
+
+def put_back(settings, role, case_ids):
+    queue = work_queue.QUEUES[role]
+    with closing(psycopg2.connect(**settings)) as conn, conn.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE mtl.CASE_ALLOCATION SET {queue.assignee} = NULL, {queue.assignee_name} = NULL "
+            f"WHERE case_id = ANY(%s) AND end_ts = '9999-12-31 00:00:00'", (case_ids,)
+        )
+        cursor.execute("DELETE FROM mtl.CASE_TRACKER WHERE case_id = ANY(%s) AND audit_log = 'FUNCTION: post-next-case'",
+                       (case_ids,))
+        cursor.execute(
+            """UPDATE mtl.CASE_TRACKER SET end_ts = '9999-12-31 00:00:00' WHERE case_tracker_sk IN (
+                   SELECT max(case_tracker_sk) FROM mtl.CASE_TRACKER WHERE case_id = ANY(%s) GROUP BY case_id)""",
+            (case_ids,)
+        )
+        inbox.sync(cursor, case_ids)
+        conn.commit()
+
+
+def run_mode(settings, role, statement, workers, claims):
+    remaining, lock, claimed, samples = [claims], threading.Lock(), [], []
+    stop, waits = threading.Event(), []
+    sampler = threading.Thread(target=sample_lock_waits, args=(settings, stop, waits))
+    sampler.start()
+    threads = [
+        threading.Thread(target=claimer, args=(settings, statement, worker, remaining, lock, claimed, samples))
+        for worker in range(workers)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    sampler.join()
+
+    duplicates = [case_id for case_id, count in Counter(claimed).items() if count > 1]
+    put_back(settings, role, claimed)
+    return {
+        'claims': len(claimed),
+        'claims_per_s': round(len(claimed) / elapsed, 1) if elapsed else 0.0,
+        'elapsed_s': round(elapsed, 2),
+        'max_lock_waits': max(waits, default=0),
+        'mean_lock_waits': round(sum(waits) / len(waits), 1) if waits else 0.0,
+        'duplicates': len(duplicates),
+        **summarise_ms(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--role', choices=sorted(work_queue.QUEUES), default='qc')
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--claims', type=int, default=2000)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    settings = settings_from_env()
+    with closing(psycopg2.connect(**settings)) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            apply_sql_file(cursor, INDEX_FILE)
+
+    statement = work_queue.claim_statement(args.role)
+    modes = {'skip-locked': statement, 'for-update': statement.replace('FOR UPDATE SKIP LOCKED', 'FOR UPDATE')}
+    results = {name: run_mode(settings, args.role, mode_statement, args.workers, args.claims)
+               for name, mode_statement in modes.items()}
+
+    print(f"{args.workers} reviewers pulling {args.role} cases")
+    print(f"{'mode':<13}{'claims':>8}{'per s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'lock waits':>12}{'dupes':>7}")
+    for name, row in results.items():
+        print(f"{name:<13}{row['claims']:>8}{row['claims_per_s']:>9.0f}{row['p50_ms']:>7.1f}ms{row['p95_ms']:>7.1f}ms"
+              f"{row['p99_ms']:>7.1f}ms{row['max_lock_waits']:>12}{row['duplicates']:>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'role': args.role, 'workers': args.workers, 'modes': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Latency of get-payments for every allocation mode at a given payment volume.
+
+Tops mtl.MASTER_PAYMENT up to --payments current rows (synthetic cases prefixed PB,
+spread like the seed data), then runs each statement from shared_code.payments
+--iterations times over one psycopg2 connection and reports p50/p95 and rows returned.
+Run with and without sql/indexes/master_payment_reads.sql (--drop-indexes removes
+them first) to see what the partial and covering indexes buy.
+
+    python benchmarks/payment_reads.py --payments 1000000 --iterations 30 --output payments.json
+"""
+import argparse
+import json
+import re
+import time
+from contextlib import closing
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from seed import REPO_DIR, apply_sql_file
+from shared_code import payments
+
+INDEX_FILE = f'{REPO_DIR}/sql/indexes/master_payment_reads.sql'
+
+TOP_UP = """
+    INSERT INTO mtl.MASTER_PAYMENT (case_id, payment_reference, first_name, last_name, net_redress_value, payment_method,
+                                    scheduled_payment_date, assignedtoanalyst, payment_completed_by_analyst,
+                                    payment_completed_by_analyst_date, total_redress, interest, withheld_tax,
+                                    address_line_1, address_line_2, postcode)
+    SELECT 'PB' || lpad(n::text, 8, '0'), 'PAYB' || lpad(n::text, 8, '0'), 'First' || n %% 997, 'Last' || n %% 1499,
+           round((r * 5000)::numeric, 2), (ARRAY['Cheque', 'BACS'])[1 + n %% 2],
+           CURRENT_DATE + (n %% 120) - 60,
+           CASE WHEN r < 0.6 THEN 'analyst' || (1 + n %% %(analysts)s) || '@example.com' END,
+           r < 0.3,
+           CASE WHEN r < 0.3 THEN now() - r * interval '60 days' END,
+           round((r * 5200)::numeric, 2), round((r * 250)::numeric, 2), round((r * 50)::numeric, 2),
+           n || ' Synthetic Street', 'Testville', 'TE' || (n %% 99) || ' 1AA'
+    FROM (SELECT n, random() AS r FROM generate_series(%(start)s, %(stop)s) AS n) AS payments
+"""
+
+
+def top_up(cursor, target, analysts):
+    cursor.execute("SELECT count(*) FROM mtl.MASTER_PAYMENT WHERE end_ts = '9999-12-31 00:00:00'")
+    current = cursor.fetchone()[0]
+    if current >= target:
+        return 0
+    cursor.execute("SELECT count(*) FROM mtl.MASTER_PAYMENT WHERE case_id LIKE 'PB%'")
+    start = cursor.fetchone()[0] + 1
+    cursor.execute(TOP_UP, {'start': start, 'stop': start + target - current - 1, 'analysts': analysts})
+    cursor.execute('ANALYZE mtl.MASTER_PAYMENT')
+    return target - current
+
+
+def drop_indexes(cursor):
+    with open(INDEX_FILE) as f:
+        for name in re.findall(r'IF NOT EXISTS (\w+)', f.read()):
+            cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS mtl.{name}')
+
+
+def modes(analyst_email):
+    for email in (payments.ALL_ANALYSTS, analyst_email):
+        for allocation in ('unallocated', 'allocated', 'completed'):
+            if email != payments.ALL_ANALYSTS and allocation == 'unallocated':
+                continue
+            for include_future in ('false', 'true'):
+                yield email, allocation, include_future
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payments', type=int, default=1000000)
+    parser.add_argument('--analysts', type=int, default=300)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--drop-indexes', action='store_true', help='Measure without the master_payment_reads indexes')
+    parser.add_argument('--output', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    report = []
+    with closing(psycopg2.connect(**settings_from_env())) as conn:
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            started = time.perf_counter()
+            added = top_up(cursor, args.payments, args.analysts)
+            print(f'added {added} payments in {time.perf_counter() - started:.1f}s')
+            if args.drop_indexes:
+                drop_indexes(cursor)
+            else:
+                apply_sql_file(cursor, INDEX_FILE)
+
+            cursor.execute("SELECT assignedtoanalyst FROM mtl.MASTER_PAYMENT WHERE assignedtoanalyst IS NOT NULL LIMIT 1")
+            analyst_email = cursor.fetchone()[0]
+
+            for email, allocation, include_future in modes(analyst_email):
+                sql_statement, params = payments.build_payments_query(email, allocation, include_future)
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql_statement, params)
+                plan = cursor.fetchone()[0][0]['Plan']
+                samples = []
+                for _ in range(args.iterations):
+                    started = time.perf_counter()
+                    cursor.execute(sql_statement, params)
+                    rows = len(cursor.fetchall())
+                    samples.append(time.perf_counter() - started)
+                report.append({
+                    'analyst': 'team' if email == payments.ALL_ANALYSTS else 'analyst',
+                    'allocation': allocation,
+                    'include_future_payments': include_future,
+                    'rows': rows,
+                    'plan': plan['Node Type'] + (f" on {plan['Index Name']}" if 'Index Name' in plan else ''),
+                    **summarise_ms(samples),
+                })
+
+    print(f"{'mode':<36}{'rows':>9}{'p50':>10}{'p95':>10}  plan")
+    for row in report:
+        label = f"{row['analyst']}/{row['allocation']}" + (' +future' if row['include_future_payments'] == 'true' else '')
+        print(f"{label:<36}{row['rows']:>9}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms  {row['plan']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'payments': args.payments, 'indexes': not args.drop_indexes, 'modes': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Compression of large list responses: ratio and CPU per encoding and level.
+
+Builds the body of one of the large list endpoints from the seeded database (python
+benchmarks/seed.py) with the handler's own query, then compresses it the way
+shared_code.responses does (row slices fed to a streaming compressor) with every
+installed encoding at each of --levels. Reports compressed size, ratio, wall and CPU
+time per encoding, and the transfer time saved at --mbps, so the default levels in
+responses.DEFAULT_LEVELS can be checked against real payloads.
+
+    python benchmarks/response_compression.py --endpoint qc-unallocated --output compression.json
+"""
+import argparse
+import json
+import os
+import time
+from contextlib import closing
+from datetime import date, datetime
+from decimal import Decimal
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from shared_code import responses
+
+ENDPOINTS = {
+    'qc-unallocated': ("SELECT * FROM mtl.QC_MAIN_SCREEN_VW WHERE (LENGTH(assignedtoqc) = 0 OR assignedtoqc IS NULL) "
+                       "AND casestatusqc = 'NEW' AND END_TS = '9999-12-31 00:00:00'"),
+    'payments': "SELECT * FROM mtl.MASTER_PAYMENT",
+    'queries': "SELECT * FROM mtl.CONTACT_QUERIES",
+    'case-overview': "SELECT * FROM mtl.CASE_OVERVIEW_VW",
+}
+
+LEVELS = {'gzip': (1, 5, 6, 9), 'br': (1, 4, 5, 11), 'zstd': (1, 3, 9, 19)}
+
+
+class Encoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
+
+def compress_once(encoding, level, chunks):
+    os.environ[f'response_{encoding}_level'] = str(level)
+    compress, flush = responses.compressor(encoding)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    size = sum(len(compress(chunk)) for chunk in chunks) + len(flush())
+    return size, time.perf_counter() - started, time.process_time() - cpu_started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='qc-unallocated')
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--mbps', type=float, default=20, help='Client bandwidth for the transfer estimate')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    with closing(psycopg2.connect(**settings_from_env())) as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(ENDPOINTS[args.endpoint])
+        rows = cursor.fetchall()
+    chunks = list(responses.json_chunks(rows, cls=Encoder))
+    uncompressed = sum(len(chunk) for chunk in chunks)
+
+    def transfer_ms(size):
+        return size * 8 / (args.mbps * 1e6) * 1000
+
+    results = []
+    for encoding in responses.available_encodings():
+        for level in LEVELS[encoding]:
+            walls, cpus = [], []
+            for _ in range(args.iterations):
+                size, wall, cpu = compress_once(encoding, level, chunks)
+                walls.append(wall)
+                cpus.append(cpu)
+            results.append({
+                'encoding': encoding,
+                'level': level,
+                'default': str(level) == responses.DEFAULT_LEVELS[encoding],
+                'bytes': size,
+                'ratio': round(uncompressed / size, 2),
+                'cpu_ms': round(sorted(cpus)[len(cpus) // 2] * 1000, 1),
+                'saved_transfer_ms': round(transfer_ms(uncompressed - size), 1),
+                **summarise_ms(walls),
+            })
+
+    print(f"{args.endpoint}: {len(rows)} rows, {uncompressed} bytes uncompressed "
+          f"({transfer_ms(uncompressed):.0f}ms at {args.mbps:g} Mbit/s)")
+    print(f"{'encoding':<10}{'level':>6}{'bytes':>12}{'ratio':>8}{'p50':>10}{'cpu':>10}{'saved':>10}")
+    for row in results:
+        marker = ' *' if row['default'] else ''
+        print(f"{row['encoding']:<10}{row['level']:>6}{row['bytes']:>12}{row['ratio']:>8.1f}{row['p50_ms']:>8.1f}ms"
+              f"{row['cpu_ms']:>8.1f}ms{row['saved_transfer_ms']:>8.0f}ms{marker}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'endpoint': args.endpoint, 'rows': len(rows), 'uncompressed_bytes': uncompressed,
+                       'mbps': args.mbps, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""QC/QA sample selection, browser-side vs post-sample-cases, on the seeded database.
+
+Expects the default seed (python benchmarks/seed.py). For --role, each run is rolled
+back so the population never changes:
+
+* client - what the screens did: download the whole QC/QA main screen view, pick the
+           sample in Python, then allocate it one case at a time as the old
+           post-qc-assigned-cases / post-qa-assigned-cases handlers do
+* server - shared_code.sampling.draw, one statement returning only the sample
+
+Reports latency and the bytes each approach pulls over the wire, and checks that the
+server-side sample is the same for the same seed, different for another seed, and
+holds each stratum to its rate.
+
+    python benchmarks/sampling.py --role qc --rate 0.1 --iterations 5 --output sampling.json
+"""
+import argparse
+import json
+import math
+import random
+import time
+from collections import Counter
+from contextlib import closing
+
+from common import settings_from_env, summarise_ms
+
+import psycopg2
+from shared_code import sampling, work_queue
+
+CHECKERS = [{'email': f'qc{n}@example.com', 'name': f'Qc {n}'} for n in range(1, 11)]
+
+VIEWS = {'qc': 'mtl.QC_MAIN_SCREEN_VW', 'qa': 'mtl.QA_MAIN_SCREEN_VW'}
+
+
+def client_sample(cursor, role, rate, seed):
+    queue = work_queue.QUEUES[role]
+    checked_by = sampling.SAMPLINGS[role].checked_by
+    cursor.execute(f"SELECT * FROM {VIEWS[role]} WHERE (LENGTH({queue.assignee}) = 0 OR {queue.assignee} IS NULL) "
+                   f"AND {queue.status} = 'NEW' AND END_TS = '9999-12-31 00:00:00'")
+    columns = [column.name for column in cursor.description]
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    payload = len(json.dumps(rows, default=str))
+
+    strata = {}
+    for row in rows:
+        strata.setdefault((row[checked_by], row['population_cohort']), []).append(row['case_id'])
+    picker = random.Random(seed)
+    chosen = [case_id for cases in strata.values() for case_id in picker.sample(cases, max(1, math.ceil(rate * len(cases))))]
+
+    sampled = sampling.SAMPLINGS[role]
+    for n, case_id in enumerate(chosen):
+        checker = CHECKERS[n % len(CHECKERS)]
+        cursor.execute(f"UPDATE mtl.CASE_ALLOCATION SET {queue.assignee} = %s, {queue.assignee_name} = %s, "
+                       f"{sampled.criteria} = %s WHERE case_id = %s",
+                       (checker['email'], checker['name'], 'client sample', case_id))
+        cursor.execute(f"""
+            INSERT INTO mtl.case_tracker (case_id, state, sub_state, audit_log, update_user, end_ts)
+            SELECT case_id, 'Review', '{queue.sub_state}', 'benchmark', 'benchmark', '9999-12-31 00:00:00'
+            FROM mtl.case_tracker WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00' AND sub_state = '{queue.from_sub_state}';
+            UPDATE mtl.case_tracker SET end_ts = CURRENT_TIMESTAMP
+            WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00' AND sub_state = '{queue.from_sub_state}'""",
+                       (case_id, case_id))
+    return chosen, payload
+
+
+def server_sample(cursor, role, rate, seed):
+    sample, strata = sampling.draw(cursor, role, CHECKERS, seed, 'benchmark', rate)
+    return sample, strata, len(json.dumps({'cases': sample, 'strata': strata}, default=str))
+
+
+def timed(conn, run, iterations):
+    samples, result = [], None
+    for _ in range(iterations):
+        with conn.cursor() as cursor:
+            started = time.perf_counter()
+            result = run(cursor)
+            samples.append(time.perf_counter() - started)
+        conn.rollback()
+    return samples, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--role', choices=sorted(sampling.SAMPLINGS), default='qc')
+    parser.add_argument('--rate', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    with closing(psycopg2.connect(**settings_from_env())) as conn:
+        client_samples, (chosen, client_bytes) = timed(
+            conn, lambda cursor: client_sample(cursor, args.role, args.rate, args.seed), args.iterations)
+        server_samples, (sample, strata, server_bytes) = timed(
+            conn, lambda cursor: server_sample(cursor, args.role, args.rate, args.seed), args.iterations)
+        _, (repeat, _, _) = timed(
+            conn, lambda cursor: server_sample(cursor, args.role, args.rate, args.seed), 1)
+        _, (other_sample, _, _) = timed(
+            conn, lambda cursor: server_sample(cursor, args.role, args.rate, args.seed + 1), 1)
+
+    off_rate = [stratum for stratum in strata
+                if stratum['sampled'] != max(1, math.ceil(stratum['rate'] * stratum['population']))]
+    report = {
+        'role': args.role,
+        'rate': args.rate,
+        'population': sum(stratum['population'] for stratum in strata),
+        'strata': len(strata),
+        'client': {'sampled': len(chosen), 'bytes': client_bytes, **summarise_ms(client_samples)},
+        'server': {'sampled': len(sample), 'bytes': server_bytes, **summarise_ms(server_samples)},
+        'checks': {
+            'reproducible': [case['case_id'] for case in sample] == [case['case_id'] for case in repeat],
+            'other_seed_overlap': round(len({c['case_id'] for c in sample} & {c['case_id'] for c in other_sample})
+                                        / max(1, len(sample)), 3),
+            'strata_off_rate': len(off_rate),
+            'per_checker': dict(Counter(case['assigned_to'] for case in sample)),
+        },
+    }
+
+    print(f"{args.role} population {report['population']} in {report['strata']} strata, rate {args.rate}")
+    print(f"{'':<8}{'sampled':>9}{'bytes':>12}{'p50':>10}{'p95':>10}")
+    for name in ('client', 'server'):
+        row = report[name]
+        print(f"{name:<8}{row['sampled']:>9}{row['bytes']:>12}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms")
+    print('checks', json.dumps(report['checks']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
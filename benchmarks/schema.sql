@@ -0,0 +1,354 @@
+-- Synthetic copy of the mtl objects the functions touch, for local benchmarking only.
+-- Column lists follow what the handlers read and write; the view definitions are
+-- stand-ins with the same shape as production, not copies of the real views.
+-- Applied by benchmarks/seed.py before sql/materialized_views and sql/indexes.
+
+CREATE SCHEMA IF NOT EXISTS mtl;
+
+CREATE TABLE mtl.POPULATION_MASTER (
+    case_id TEXT PRIMARY KEY,
+    claim_reference TEXT NOT NULL,
+    cohort TEXT NOT NULL,
+    title TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    date_of_birth DATE
+);
+
+CREATE TABLE mtl.CASE_ALLOCATION (
+    case_id TEXT NOT NULL,
+    population_cohort TEXT,
+    assignedtoanalyst TEXT,
+    assignedtoanalystname TEXT,
+    casestatusanalyst TEXT,
+    fr_complete_date TIMESTAMP,
+    engineer_referral TEXT,
+    assignedtoer TEXT,
+    assignedtoername TEXT,
+    casestatuser TEXT,
+    er_complete_ts TIMESTAMP,
+    qc_complete_ts TIMESTAMP,
+    qa_complete_ts TIMESTAMP,
+    ctc_complete_ts TIMESTAMP,
+    assignedtoqc TEXT,
+    assignedtoqcname TEXT,
+    casestatusqc TEXT,
+    case_selection_criteria TEXT,
+    assignedtoqa TEXT,
+    assignedtoqaname TEXT,
+    casestatusqa TEXT,
+    case_selection_criteria_qa TEXT,
+    assignedtoctc TEXT,
+    assignedtoctcname TEXT,
+    casestatusctc TEXT,
+    case_selection_criteria_ctc TEXT,
+    batch_number TEXT,
+    on_hold_reason TEXT,
+    caserelease_ts TIMESTAMP,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    PRIMARY KEY (case_id, end_ts)
+);
+
+CREATE TABLE mtl.CASE_TRACKER (
+    case_tracker_sk BIGSERIAL PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    state TEXT,
+    sub_state TEXT,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    audit_log TEXT,
+    update_user TEXT
+);
+CREATE INDEX case_tracker_case_id ON mtl.CASE_TRACKER (case_id, end_ts);
+
+CREATE TABLE mtl.INPUT_FILE_REVIEW (
+    input_file_review_sk BIGSERIAL PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    review_outcome TEXT,
+    qc_review_outcome TEXT,
+    qa_review_outcome TEXT,
+    analyst_notes TEXT,
+    redress_amount NUMERIC(12, 2),
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    update_user TEXT,
+    audit_log TEXT
+);
+CREATE INDEX input_file_review_case_id ON mtl.INPUT_FILE_REVIEW (case_id);
+
+CREATE TABLE mtl.CONTACT_TRACKER (
+    contact_tracker_sk BIGSERIAL PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    outcome TEXT,
+    contact_type TEXT,
+    contact_channel TEXT,
+    call_summary TEXT,
+    contact_actual_ts TIMESTAMP,
+    assigned_to TEXT,
+    assigned_to_name TEXT,
+    sc_approval_required TEXT,
+    tl_rejection_reason TEXT,
+    recalc_reason TEXT,
+    payment_type TEXT,
+    customer_info_confirmed TEXT,
+    proposed_title_change TEXT,
+    proposed_forename_change TEXT,
+    proposed_middle_name_change TEXT,
+    proposed_surname_change TEXT,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    update_user TEXT,
+    audit_log TEXT
+);
+CREATE INDEX contact_tracker_case_id ON mtl.CONTACT_TRACKER (case_id);
+
+CREATE TABLE mtl.ADDRESS (
+    address_sk BIGSERIAL PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    title TEXT,
+    forename TEXT,
+    middle_name TEXT,
+    surname TEXT,
+    address_line_1 TEXT,
+    address_line_2 TEXT,
+    address_line_3 TEXT,
+    address_line_4 TEXT,
+    address_line_5 TEXT,
+    postcode TEXT,
+    change_name_reason TEXT,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    update_user TEXT,
+    audit_log TEXT
+);
+CREATE INDEX address_case_id ON mtl.ADDRESS (case_id, end_ts);
+
+CREATE TABLE mtl.DECEASED_ADDRESS (
+    deceased_address_sk BIGSERIAL PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    address_line_1 TEXT,
+    address_line_2 TEXT,
+    address_line_3 TEXT,
+    address_line_4 TEXT,
+    address_line_5 TEXT,
+    postcode TEXT,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    update_user TEXT,
+    audit_log TEXT
+);
+CREATE INDEX deceased_address_case_id ON mtl.DECEASED_ADDRESS (case_id, end_ts);
+
+CREATE TABLE mtl.CASE_TAGS (
+    case_id TEXT NOT NULL,
+    case_tags TEXT,
+    update_user TEXT,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00',
+    audit_log TEXT
+);
+CREATE INDEX case_tags_case_id ON mtl.CASE_TAGS (case_id, end_ts);
+
+CREATE TABLE mtl.ACCESS_LEVEL (
+    access_level_id INTEGER PRIMARY KEY,
+    access_level_description TEXT NOT NULL
+);
+
+CREATE TABLE mtl.USER_ACCESS (
+    user_email TEXT PRIMARY KEY,
+    user_name TEXT NOT NULL,
+    access_level_id INTEGER REFERENCES mtl.ACCESS_LEVEL (access_level_id),
+    reporting_manager TEXT,
+    client_user_id TEXT
+);
+
+CREATE TABLE mtl.MASTER_PAYMENT (
+    case_id TEXT NOT NULL,
+    payment_reference TEXT,
+    first_name TEXT,
+    last_name TEXT,
+    net_redress_value NUMERIC(12, 2),
+    payment_method TEXT,
+    scheduled_payment_date DATE,
+    assignedtoanalyst TEXT,
+    payment_completed_by_analyst BOOLEAN NOT NULL DEFAULT false,
+    payment_completed_by_analyst_date TIMESTAMP,
+    total_redress NUMERIC(12, 2),
+    interest NUMERIC(12, 2),
+    withheld_tax NUMERIC(12, 2),
+    address_line_1 TEXT,
+    address_line_2 TEXT,
+    address_line_3 TEXT,
+    address_line_4 TEXT,
+    address_line_5 TEXT,
+    postcode TEXT,
+    start_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31 00:00:00'
+);
+
+CREATE TABLE mtl.CONTACT_QUERIES (
+    query_id BIGSERIAL,
+    case_id TEXT,
+    claim_reference TEXT,
+    open_date TIMESTAMP,
+    open_user TEXT,
+    update_date TIMESTAMP,
+    closed_date TIMESTAMP,
+    closed_user TEXT,
+    query_status TEXT,
+    query_type TEXT,
+    query_description TEXT,
+    end_ts TIMESTAMP NOT NULL DEFAULT '9999-12-31',
+    update_user TEXT,
+    audit_log TEXT
+);
+
+CREATE TABLE mtl.FILE_REVIEW_STATS (
+    case_id TEXT,
+    user_email TEXT,
+    role TEXT,
+    active BOOLEAN,
+    start_ts TIMESTAMP,
+    end_ts TIMESTAMP
+);
+
+CREATE TABLE mtl.FILE_REVIEWER_AVAILABILITY (
+    reviewer_id TEXT,
+    date DATE,
+    available_hours NUMERIC(5, 2)
+);
+
+CREATE TABLE mtl.QC_MAILING (
+    case_id TEXT NOT NULL,
+    mailing_batch_number TEXT NOT NULL,
+    qc_mailing_ready BOOLEAN,
+    qc_reason_remove_batch TEXT,
+    qc_user_email TEXT,
+    qc_insert_ts TIMESTAMP,
+    case_reset BOOLEAN NOT NULL DEFAULT false
+);
+
+CREATE TABLE mtl.METADATA_MAILING_REMOVAL (
+    removal_reason TEXT PRIMARY KEY,
+    active BOOLEAN NOT NULL DEFAULT true
+);
+
+CREATE TABLE mtl.UPLOADED_FILES (
+    case_id TEXT,
+    file_name TEXT,
+    file_description TEXT,
+    upload_user TEXT,
+    upload_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE mtl.BULK_CASE_RELEASE (
+    case_id TEXT,
+    caserelease_by TEXT,
+    case_released BOOLEAN NOT NULL DEFAULT false,
+    release_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE mtl.MI_METADATA_EXPORT (
+    object_name TEXT NOT NULL,
+    tab_name TEXT NOT NULL,
+    object_active BOOLEAN NOT NULL DEFAULT true,
+    sql TEXT NOT NULL,
+    mi_file_name TEXT NOT NULL
+);
+
+-- Stand-in views
+
+CREATE VIEW mtl.MASTER_PAYMENT_ANALYST_VW AS
+SELECT * FROM mtl.MASTER_PAYMENT;
+
+CREATE VIEW mtl.CASE_DETAILS_VW AS
+SELECT ca.*, pm.claim_reference, pm.cohort, pm.title, pm.first_name, pm.last_name, pm.date_of_birth,
+       ct.state, ct.sub_state
+FROM mtl.CASE_ALLOCATION ca
+JOIN mtl.POPULATION_MASTER pm ON pm.case_id = ca.case_id
+LEFT JOIN mtl.CASE_TRACKER ct ON ct.case_id = ca.case_id AND ct.end_ts = '9999-12-31 00:00:00'
+WHERE ca.end_ts = '9999-12-31 00:00:00';
+
+CREATE VIEW mtl.CASE_OVERVIEW_VW AS
+SELECT pm.case_id, pm.claim_reference, pm.cohort, ct.state, ct.sub_state, ct.start_ts AS last_updated_ts,
+       COALESCE(ca.assignedtoctc, ca.assignedtoqa, ca.assignedtoqc, ca.assignedtoanalyst) AS assignedto,
+       COALESCE(ca.assignedtoctcname, ca.assignedtoqaname, ca.assignedtoqcname, ca.assignedtoanalystname) AS assignedtoname
+FROM mtl.POPULATION_MASTER pm
+JOIN mtl.CASE_TRACKER ct ON ct.case_id = pm.case_id AND ct.end_ts = '9999-12-31 00:00:00'
+LEFT JOIN mtl.CASE_ALLOCATION ca ON ca.case_id = pm.case_id AND ca.end_ts = '9999-12-31 00:00:00';
+
+CREATE VIEW mtl.QC_MAIN_SCREEN_VW AS
+SELECT ca.*, pm.claim_reference, pm.first_name, pm.last_name, ct.sub_state
+FROM mtl.CASE_ALLOCATION ca
+JOIN mtl.POPULATION_MASTER pm ON pm.case_id = ca.case_id
+LEFT JOIN mtl.CASE_TRACKER ct ON ct.case_id = ca.case_id AND ct.end_ts = '9999-12-31 00:00:00'
+WHERE ca.casestatusanalyst = 'COMPLETED';
+
+CREATE VIEW mtl.QA_MAIN_SCREEN_VW AS
+SELECT ca.*, pm.claim_reference, pm.first_name, pm.last_name, ct.sub_state
+FROM mtl.CASE_ALLOCATION ca
+JOIN mtl.POPULATION_MASTER pm ON pm.case_id = ca.case_id
+LEFT JOIN mtl.CASE_TRACKER ct ON ct.case_id = ca.case_id AND ct.end_ts = '9999-12-31 00:00:00'
+WHERE ca.casestatusqc = 'COMPLETED';
+
+CREATE VIEW mtl.CTC_MAIN_SCREEN_VW AS
+SELECT ca.*, pm.claim_reference, pm.first_name, pm.last_name, ct.sub_state
+FROM mtl.CASE_ALLOCATION ca
+JOIN mtl.POPULATION_MASTER pm ON pm.case_id = ca.case_id
+LEFT JOIN mtl.CASE_TRACKER ct ON ct.case_id = ca.case_id AND ct.end_ts = '9999-12-31 00:00:00'
+WHERE ca.casestatusqa = 'COMPLETED';
+
+CREATE VIEW mtl.RELEASE_MAIN_SCREEN_VW AS
+SELECT ca.*, pm.claim_reference, pm.first_name, pm.last_name
+FROM mtl.CASE_ALLOCATION ca
+JOIN mtl.POPULATION_MASTER pm ON pm.case_id = ca.case_id
+WHERE ca.end_ts = '9999-12-31 00:00:00' AND ca.batch_number IS NOT NULL;
+
+CREATE VIEW mtl.QC_BATCH_SCREEN_VW AS
+SELECT batch_number, COUNT(*) AS cases, COUNT(*) FILTER (WHERE casestatusqc = 'COMPLETED') AS qc_completed
+FROM mtl.CASE_ALLOCATION
+WHERE end_ts = '9999-12-31 00:00:00' AND batch_number IS NOT NULL
+GROUP BY batch_number;
+
+CREATE VIEW mtl.QA_BATCH_SCREEN_VW AS
+SELECT batch_number, COUNT(*) AS cases, COUNT(*) FILTER (WHERE casestatusqa = 'COMPLETED') AS qa_completed
+FROM mtl.CASE_ALLOCATION
+WHERE end_ts = '9999-12-31 00:00:00' AND batch_number IS NOT NULL
+GROUP BY batch_number;
+
+CREATE VIEW mtl.CTC_BATCH_SCREEN_VW AS
+SELECT batch_number, COUNT(*) AS cases, COUNT(*) FILTER (WHERE casestatusctc = 'COMPLETED') AS ctc_completed
+FROM mtl.CASE_ALLOCATION
+WHERE end_ts = '9999-12-31 00:00:00' AND batch_number IS NOT NULL
+GROUP BY batch_number;
+
+CREATE VIEW mtl.RELEASE_BATCH_SCREEN_VW AS
+SELECT batch_number, COUNT(*) AS cases, COUNT(caserelease_ts) AS released
+FROM mtl.CASE_ALLOCATION
+WHERE end_ts = '9999-12-31 00:00:00' AND batch_number IS NOT NULL
+GROUP BY batch_number;
+
+-- Stands in for the production aggregate; sql/views/qc_mailing_stats_vw.sql redefines it over MAILING_BATCH
+CREATE VIEW mtl.QC_MAILING_STATS_VW AS
+SELECT mailing_batch_number, COUNT(*) AS total_cases,
+       COUNT(*) FILTER (WHERE NOT case_reset AND COALESCE(qc_mailing_ready, false)) AS ready_cases,
+       COUNT(*) FILTER (WHERE NOT case_reset AND NOT COALESCE(qc_mailing_ready, false) AND qc_reason_remove_batch IS NOT NULL) AS removed_cases,
+       COUNT(*) FILTER (WHERE case_reset) AS reset_cases,
+       COUNT(*) FILTER (WHERE NOT case_reset AND NOT COALESCE(qc_mailing_ready, false) AND qc_reason_remove_batch IS NULL) AS pending_cases
+FROM mtl.QC_MAILING
+GROUP BY mailing_batch_number;
+
+CREATE VIEW mtl.REVIEWER_STATS_VW AS
+SELECT ua.user_email, ua.user_name, ua.reporting_manager,
+       COUNT(ca.case_id) FILTER (WHERE ca.casestatusanalyst = 'COMPLETED') AS reviews_completed,
+       COUNT(ca.case_id) FILTER (WHERE ca.casestatusanalyst = 'IN_PROGRESS') AS reviews_in_progress
+FROM mtl.USER_ACCESS ua
+LEFT JOIN mtl.CASE_ALLOCATION ca ON ca.assignedtoanalyst = ua.user_email AND ca.end_ts = '9999-12-31 00:00:00'
+GROUP BY ua.user_email, ua.user_name, ua.reporting_manager;
+
+CREATE VIEW mtl.SOFT_INVITE_CASE_DETAIL_VW AS
+SELECT pm.case_id, pm.claim_reference, pm.title, pm.first_name, pm.last_name,
+       ct.contact_tracker_sk, ct.contact_type, ct.outcome, ct.assigned_to, ct.assigned_to_name
+FROM mtl.POPULATION_MASTER pm
+JOIN mtl.CONTACT_TRACKER ct ON ct.case_id = pm.case_id AND ct.end_ts = '9999-12-31 00:00:00';
@@ -0,0 +1,303 @@
+"""Create the mtl schema in a local database and seed a synthetic population.
+
+Every case gets a population record, an allocation row, a case tracker history
+that ends in one of the review stages, and (depending on its stage) file review,
+contact, tag and payment rows. Seeding is done with set-based INSERT ... SELECT
+statements and a fixed random seed, so the same --cases/--seed always produces
+the same data set.
+
+After seeding, the materialized main-screen views and the filter indexes from
+sql/ are applied and refreshed so handlers see the same objects as production.
+
+    python benchmarks/seed.py --cases 500000 --users 300 --reset
+"""
+import argparse
+import os
+import time
+
+from common import settings_from_env
+
+import psycopg2
+from shared_code import main_screen_views
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+SCHEMA_FILE = os.path.join(BENCHMARKS_DIR, 'schema.sql')
+REPO_SQL_FILES = [
+    os.path.join(REPO_DIR, 'sql', 'materialized_views', 'main_screen_views.sql'),
+    os.path.join(REPO_DIR, 'sql', 'indexes', 'case_overview_filters.sql'),
+    os.path.join(REPO_DIR, 'sql', 'indexes', 'master_payment_reads.sql'),
+    os.path.join(REPO_DIR, 'sql', 'indexes', 'case_allocation_work_queue.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'uploaded_files_blobs.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'mi_metadata_export_watermarks.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'idempotency_keys.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'user_inbox.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'cohort_handling_times.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'mailing_batches.sql'),
+    os.path.join(REPO_DIR, 'sql', 'views', 'qc_mailing_stats_vw.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'change_feed.sql'),
+    os.path.join(REPO_DIR, 'sql', 'tables', 'contact_tracker_row_version.sql'),
+]
+
+STAGES = [
+    # (sub_state, share of cases)
+    ('Case Created', 0.35),
+    ('Case Review In Progress', 0.20),
+    ('Case Review Completed', 0.15),
+    ('QC Allocated', 0.10),
+    ('Case QC Completed', 0.08),
+    ('Case QA Completed', 0.05),
+    ('Case CTC Completed', 0.07),
+]
+
+ACCESS_LEVELS = [(1, 'File Reviewer'), (2, 'QC'), (3, 'QA'), (4, 'Team Leader'), (5, 'Contact Centre')]
+
+SEED_STATEMENTS = [
+    ('access levels', """
+        INSERT INTO mtl.ACCESS_LEVEL (access_level_id, access_level_description)
+        SELECT * FROM unnest(%(access_level_ids)s::int[], %(access_level_names)s::text[])
+    """),
+    ('users', """
+        INSERT INTO mtl.USER_ACCESS (user_email, user_name, access_level_id, reporting_manager, client_user_id)
+        SELECT role || n || '@example.com', initcap(role) || ' ' || n, level, 'tl' || (1 + n %% %(leads)s) || '@example.com', 'U' || level || lpad(n::text, 5, '0')
+        FROM (VALUES ('analyst', 1, %(analysts)s), ('qc', 2, %(checkers)s), ('qa', 3, %(checkers)s),
+                     ('tl', 4, %(leads)s), ('contact', 5, %(contacts)s)) AS roles (role, level, headcount),
+             generate_series(1, headcount) AS n
+    """),
+    ('case plan', """
+        CREATE TEMP TABLE seed_cases AS
+        SELECT 'C' || lpad(n::text, 7, '0') AS case_id,
+               n,
+               (ARRAY['A', 'B', 'C', 'D', 'E'])[1 + n %% 5] AS cohort,
+               width_bucket(random(), %(stage_thresholds)s::float8[]) AS stage,
+               1 + floor(random() * %(analysts)s)::int AS analyst_no,
+               1 + floor(random() * %(checkers)s)::int AS qc_no,
+               1 + floor(random() * %(checkers)s)::int AS qa_no,
+               random() AS r
+        FROM generate_series(1, %(cases)s) AS n
+    """),
+    ('population_master', """
+        INSERT INTO mtl.POPULATION_MASTER (case_id, claim_reference, cohort, title, first_name, last_name, date_of_birth)
+        SELECT case_id, 'CLM' || lpad(n::text, 8, '0'), cohort, (ARRAY['Mr', 'Mrs', 'Ms', 'Dr'])[1 + n %% 4],
+               'First' || n %% 997, 'Last' || n %% 1499, DATE '1940-01-01' + n %% 20000
+        FROM seed_cases
+    """),
+    ('case_allocation', """
+        INSERT INTO mtl.CASE_ALLOCATION (
+            case_id, population_cohort, assignedtoanalyst, assignedtoanalystname, casestatusanalyst, fr_complete_date,
+            assignedtoqc, assignedtoqcname, casestatusqc, assignedtoqa, assignedtoqaname, casestatusqa,
+            assignedtoctc, assignedtoctcname, casestatusctc, batch_number, caserelease_ts, start_ts)
+        SELECT case_id, cohort,
+               CASE WHEN stage >= 1 THEN 'analyst' || analyst_no || '@example.com' END,
+               CASE WHEN stage >= 1 THEN 'Analyst ' || analyst_no END,
+               CASE WHEN stage = 0 THEN 'NEW' WHEN stage = 1 THEN 'IN_PROGRESS' ELSE 'COMPLETED' END,
+               CASE WHEN stage >= 2 THEN now() - r * interval '90 days' END,
+               CASE WHEN stage >= 3 THEN 'qc' || qc_no || '@example.com' END,
+               CASE WHEN stage >= 3 THEN 'Qc ' || qc_no END,
+               CASE WHEN stage IN (2, 3) THEN 'NEW' WHEN stage >= 4 THEN 'COMPLETED' END,
+               CASE WHEN stage >= 5 THEN 'qa' || qa_no || '@example.com' END,
+               CASE WHEN stage >= 5 THEN 'Qa ' || qa_no END,
+               CASE WHEN stage = 4 THEN 'NEW' WHEN stage >= 5 THEN 'COMPLETED' END,
+               CASE WHEN stage >= 6 THEN 'qa' || qc_no || '@example.com' END,
+               CASE WHEN stage >= 6 THEN 'Qa ' || qc_no END,
+               CASE WHEN stage = 5 THEN 'NEW' WHEN stage >= 6 THEN 'COMPLETED' END,
+               CASE WHEN stage >= 4 THEN 'B' || lpad((n / 250 %% 400)::text, 4, '0') END,
+               CASE WHEN stage = 6 AND r < 0.5 THEN now() - r * interval '30 days' END,
+               now() - (1 - r) * interval '180 days'
+        FROM seed_cases
+    """),
+    ('case_tracker', """
+        INSERT INTO mtl.CASE_TRACKER (case_id, state, sub_state, start_ts, end_ts, audit_log, update_user)
+        SELECT case_id,
+               CASE WHEN k = 0 THEN 'Intake' ELSE 'Review' END,
+               (%(sub_states)s::text[])[k + 1],
+               now() - interval '180 days' + k * interval '7 days' + r * interval '1 day',
+               CASE WHEN k = stage THEN TIMESTAMP '9999-12-31 00:00:00'
+                    ELSE now() - interval '180 days' + (k + 1) * interval '7 days' + r * interval '1 day' END,
+               'seed', 'analyst' || analyst_no || '@example.com'
+        FROM seed_cases, generate_series(0, stage) AS k
+        ORDER BY n, k
+    """),
+    ('input_file_review history', """
+        INSERT INTO mtl.INPUT_FILE_REVIEW (case_id, review_outcome, qc_review_outcome, analyst_notes, redress_amount, start_ts, end_ts, update_user, audit_log)
+        SELECT case_id, 'Draft', '', 'Draft review for ' || case_id, round((r * 4000)::numeric, 2),
+               now() - interval '60 days', now() - interval '30 days', 'analyst' || analyst_no || '@example.com', 'seed'
+        FROM seed_cases WHERE stage >= 3
+    """),
+    ('input_file_review', """
+        INSERT INTO mtl.INPUT_FILE_REVIEW (case_id, review_outcome, qc_review_outcome, qa_review_outcome, analyst_notes, redress_amount, start_ts, end_ts, update_user, audit_log)
+        SELECT case_id, (ARRAY['Redress due', 'No redress'])[1 + n %% 2],
+               CASE WHEN stage >= 4 THEN (ARRAY['Pass', 'Fail', 'Pass with comments'])[1 + n %% 3] ELSE '' END,
+               CASE WHEN stage >= 5 THEN 'Pass' END,
+               'Synthetic review notes for ' || case_id, round((r * 5000)::numeric, 2),
+               now() - interval '30 days', TIMESTAMP '9999-12-31 00:00:00', 'analyst' || analyst_no || '@example.com', 'seed'
+        FROM seed_cases WHERE stage >= 2
+    """),
+    ('contact_tracker', """
+        INSERT INTO mtl.CONTACT_TRACKER (case_id, outcome, contact_type, contact_channel, call_summary, contact_actual_ts,
+                                         assigned_to, assigned_to_name, start_ts, end_ts, update_user, audit_log)
+        SELECT case_id, (ARRAY['Contact made', 'No answer', 'Voicemail'])[1 + (n + k) %% 3],
+               (ARRAY['Soft Invite', 'Outbound Call'])[k], 'Call', 'Synthetic call summary',
+               now() - k * interval '3 days',
+               'contact' || (1 + n %% %(contacts)s) || '@example.com', 'Contact ' || (1 + n %% %(contacts)s),
+               now() - k * interval '3 days', TIMESTAMP '9999-12-31 00:00:00', 'seed', 'seed'
+        FROM seed_cases, generate_series(1, 1 + n %% 2) AS k
+        WHERE r < 0.3
+    """),
+    ('address', """
+        INSERT INTO mtl.ADDRESS (case_id, title, forename, surname, address_line_1, address_line_2, postcode, update_user, audit_log)
+        SELECT case_id, (ARRAY['Mr', 'Mrs', 'Ms', 'Dr'])[1 + n %% 4], 'First' || n %% 997, 'Last' || n %% 1499,
+               n || ' Synthetic Street', 'Testville', 'TE' || (n %% 99) || ' 1AA', 'seed', 'seed'
+        FROM seed_cases WHERE r < 0.3
+    """),
+    ('case_tags', """
+        INSERT INTO mtl.CASE_TAGS (case_id, case_tags, update_user, audit_log)
+        SELECT case_id, (ARRAY['Vulnerable', 'Complaint', 'Priority'])[1 + n %% 3], 'seed', 'seed'
+        FROM seed_cases WHERE r >= 0.9
+    """),
+    ('master_payment', """
+        INSERT INTO mtl.MASTER_PAYMENT (case_id, payment_reference, first_name, last_name, net_redress_value, payment_method,
+                                        scheduled_payment_date, assignedtoanalyst, payment_completed_by_analyst,
+                                        total_redress, interest, withheld_tax, address_line_1, address_line_2, postcode)
+        SELECT case_id, 'PAY' || lpad(n::text, 8, '0'), 'First' || n %% 997, 'Last' || n %% 1499,
+               round((r * 5000)::numeric, 2), (ARRAY['Cheque', 'BACS'])[1 + n %% 2],
+               CURRENT_DATE + (n %% 60) - 30,
+               CASE WHEN r < 0.6 THEN 'analyst' || analyst_no || '@example.com' END,
+               r < 0.3,
+               round((r * 5200)::numeric, 2), round((r * 250)::numeric, 2), round((r * 50)::numeric, 2),
+               n || ' Synthetic Street', 'Testville', 'TE' || (n %% 99) || ' 1AA'
+        FROM seed_cases WHERE stage >= 5
+    """),
+    ('file_reviewer_availability', """
+        INSERT INTO mtl.FILE_REVIEWER_AVAILABILITY (reviewer_id, date, available_hours)
+        SELECT 'analyst' || n || '@example.com', day::date, (ARRAY[7.5, 7.5, 6, 3.75, 0])[1 + (n + d) %% 5]
+        FROM generate_series(1, %(analysts)s) AS n,
+             generate_series(0, 27) AS d, LATERAL (SELECT CURRENT_DATE + d AS day) AS days
+        WHERE extract(isodow FROM day) < 6
+    """),
+    ('metadata_mailing_removal', """
+        INSERT INTO mtl.METADATA_MAILING_REMOVAL (removal_reason, active) VALUES
+            ('Address incomplete', true), ('Deceased', true), ('Complaint open', true), ('Gone away', false)
+    """),
+    ('mi_metadata_export', """
+        INSERT INTO mtl.MI_METADATA_EXPORT (object_name, tab_name, sql, mi_file_name) VALUES
+            ('case_overview', 'Cases', 'SELECT * FROM mtl.CASE_OVERVIEW_VW', 'case_overview'),
+            ('reviewer_stats', 'Reviewers', 'SELECT * FROM mtl.REVIEWER_STATS_VW', 'reviewer_stats'),
+            ('case_tracker_summary', 'Tracker', 'SELECT state, sub_state, COUNT(*) AS cases FROM mtl.CASE_TRACKER WHERE end_ts = ''9999-12-31 00:00:00'' GROUP BY 1, 2', 'case_tracker_summary'),
+            ('ops_pack', 'Cases', 'SELECT * FROM mtl.CASE_OVERVIEW_VW', 'ops_pack'),
+            ('ops_pack', 'Reviewers', 'SELECT * FROM mtl.REVIEWER_STATS_VW', 'ops_pack'),
+            ('ops_pack', 'Tracker', 'SELECT state, sub_state, COUNT(*) AS cases FROM mtl.CASE_TRACKER WHERE end_ts = ''9999-12-31 00:00:00'' GROUP BY 1, 2', 'ops_pack'),
+            ('ops_pack', 'Payments', 'SELECT * FROM mtl.MASTER_PAYMENT_ANALYST_VW', 'ops_pack')
+    """),
+]
+
+# Rows that depend on columns added by the REPO_SQL_FILES migrations
+POST_MIGRATION_STATEMENTS = [
+    ('mi_metadata_export_incremental', """
+        INSERT INTO mtl.MI_METADATA_EXPORT (object_name, tab_name, sql, mi_file_name, watermark_column) VALUES
+            ('case_status_changes', 'Changes', 'SELECT case_id, state, sub_state, start_ts, update_user FROM mtl.CASE_TRACKER', 'case_status_changes', 'start_ts'),
+            ('payment_extract', 'Payments', 'SELECT case_id, payment_reference, net_redress_value, payment_method, scheduled_payment_date, start_ts FROM mtl.MASTER_PAYMENT', 'payment_extract', 'start_ts')
+    """),
+]
+
+
+def split_statements(sql_text):
+    # The sql/ files hold plain DDL, so ';' at a line end ends a statement unless it is
+    # inside a $$ quoted function body
+    statements = []
+    current = []
+    in_body = False
+    for line in sql_text.splitlines():
+        if line.strip().startswith('--') and not current:
+            continue
+        current.append(line)
+        in_body ^= line.count('$$') % 2 == 1
+        if line.rstrip().endswith(';') and not in_body:
+            statement = '\n'.join(current).strip()
+            if statement.strip(';').strip():
+                statements.append(statement)
+            current = []
+    if '\n'.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+def apply_sql_file(cursor, path):
+    # Statement by statement, as CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with open(path) as f:
+        for statement in split_statements(f.read()):
+            cursor.execute(statement)
+
+
+def seed_parameters(cases, users, seed):
+    thresholds = []
+    running = 0.0
+    for _, share in STAGES[:-1]:
+        running += share
+        thresholds.append(round(running, 4))
+    return {
+        'cases': cases,
+        'analysts': max(1, users * 60 // 100),
+        'checkers': max(1, users * 12 // 100),
+        'leads': max(1, users * 6 // 100),
+        'contacts': max(1, users * 10 // 100),
+        'stage_thresholds': thresholds,
+        'sub_states': [sub_state for sub_state, _ in STAGES],
+        'access_level_ids': [level for level, _ in ACCESS_LEVELS],
+        'access_level_names': [name for _, name in ACCESS_LEVELS],
+        'seed': seed,
+    }
+
+
+def seed(settings, cases=500000, users=300, seed=0.42, reset=False, log=print):
+    params = seed_parameters(cases, users, seed)
+    conn = psycopg2.connect(**settings)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            if reset:
+                cursor.execute('DROP SCHEMA IF EXISTS mtl CASCADE')
+            apply_sql_file(cursor, SCHEMA_FILE)
+
+            # setseed only holds for this session, so everything random runs on this connection
+            cursor.execute('SELECT setseed(%(seed)s)', params)
+            for name, statement in SEED_STATEMENTS:
+                started = time.perf_counter()
+                cursor.execute(statement, params)
+                log(f'{name:<28}{cursor.rowcount:>10} rows {time.perf_counter() - started:>8.1f}s')
+
+            for path in REPO_SQL_FILES:
+                started = time.perf_counter()
+                apply_sql_file(cursor, path)
+                log(f'{os.path.relpath(path, REPO_DIR):<44}{time.perf_counter() - started:>8.1f}s')
+
+            for name, statement in POST_MIGRATION_STATEMENTS:
+                started = time.perf_counter()
+                cursor.execute(statement, params)
+                log(f'{name:<28}{cursor.rowcount:>10} rows {time.perf_counter() - started:>8.1f}s')
+
+        # Populate the materialized copies through the same code path as the timer function
+        results = main_screen_views.refresh_due_views(conn, force=True)
+        for result in results:
+            log(f"refreshed {result['view']}")
+
+        with conn.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    finally:
+        conn.close()
+    return params
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--seed', type=float, default=0.42, help='Postgres setseed value, between -1 and 1')
+    parser.add_argument('--reset', action='store_true', help='Drop the mtl schema first')
+    args = parser.parse_args()
+
+    seed(settings_from_env(), cases=args.cases, users=args.users, seed=args.seed, reset=args.reset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""Per-endpoint latency, throughput and memory for the function handlers.
+
+Starts a throwaway Postgres (or uses the server in the PG* variables with
+--use-existing), seeds it with benchmarks/seed.py, then calls each handler's
+``main`` with synthetic HttpRequests. Key Vault and Blob Storage are replaced by
+the in-process fakes in benchmarks/fakes.py, so nothing outside this machine is
+contacted.
+
+Each scenario runs in its own process so peak RSS is attributable to that
+endpoint. Results are written as JSON; pass a previous results file with
+--compare to print the change in p95 and rows/sec.
+
+    python benchmarks/suite.py --cases 500000 --iterations 30 --output results.json
+    python benchmarks/suite.py --use-existing --skip-seed --only 'get-qc-*' --compare results.json
+"""
+import argparse
+import asyncio
+import fnmatch
+import inspect
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+from contextlib import closing
+from datetime import datetime, timezone
+
+from common import load_handler, settings_from_env, summarise_ms
+
+import azure.functions as func
+import psycopg2
+import fakes
+import seed as seeder
+from local_postgres import local_postgres
+
+
+def get(function_name, params):
+    return lambda samples, i: (function_name, 'GET', params, None)
+
+
+def post_qc_assigned_cases(samples, i):
+    # Each iteration allocates its own slice of review-completed cases
+    batch = samples['review_completed'][i * 25:(i + 1) * 25]
+    qc_email, qc_name = samples['qc_users'][i % len(samples['qc_users'])]
+    body = [
+        {'qcemail': qc_email, 'qcname': qc_name, 'case_selection_criteria': 'Random', 'case_id': case_id, 'email': qc_email}
+        for case_id in batch
+    ]
+    return 'post-qc-assigned-cases', 'POST', {}, body
+
+
+def post_payments(samples, i):
+    # A 200-case payment run; alternate iterations flip the flags back, so every call changes rows
+    batch = samples['payment_cases'][(i // 2) * 200 % len(samples['payment_cases']):][:200]
+    return 'post-payments', 'POST', {}, {'payments': [{'case_id': case_id, 'completed': i % 2 == 0} for case_id in batch]}
+
+
+# name -> request builder(samples, iteration) returning (function, method, params, json body).
+# Write scenarios go last so the read scenarios see the data exactly as seeded.
+SCENARIOS = {
+    'get-qc-cases:unallocated': get('get-qc-cases', {'query_type': 'unallocated'}),
+    'get-qc-cases:unallocated:cached': get('get-qc-cases', {'query_type': 'unallocated', 'freshness': 'cached'}),
+    'get-qc-cases:allocated': get('get-qc-cases', {'query_type': 'allocated'}),
+    'get-qc-cases:batched': get('get-qc-cases', {'query_type': 'batched'}),
+    'get-qa-cases:unallocated': get('get-qa-cases', {'query_type': 'unallocated'}),
+    'get-qa-cases:unallocated_ctc': get('get-qa-cases', {'query_type': 'unallocated_ctc'}),
+    'get-qc-batched-cases:release': lambda samples, i: (
+        'get-qc-batched-cases', 'GET', {'query_type': 'release', 'batch_id': samples['batches'][i % len(samples['batches'])]}, None),
+    'get-fr-cases:unallocated': get('get-fr-cases', {'query_type': 'unallocated'}),
+    'get-fr-cases:bulk_unallocated': get('get-fr-cases', {'query_type': 'bulk_unallocated'}),
+    'get-fr-cases:bulk_allocated': get('get-fr-cases', {'query_type': 'bulk_allocated'}),
+    'get-assigned-cases:fr': lambda samples, i: (
+        'get-assigned-cases', 'GET', {'user': samples['analysts'][i % len(samples['analysts'])], 'query_type': 'fr'}, None),
+    'get-case': lambda samples, i: (
+        'get-case', 'GET', {'caseId': samples['case_ids'][i % len(samples['case_ids'])]}, None),
+    'get-case-details:bundle': lambda samples, i: (
+        'get-case-details', 'GET', {'query_type': 'bundle', 'case_id': samples['case_ids'][i % len(samples['case_ids'])]}, None),
+    'get-dashboard:case_tracker': get('get-dashboard', {'query_type': 'case_tracker'}),
+    'get-dashboard:quality': get('get-dashboard', {'query_type': 'quality'}),
+    'get-tl-filtered-cases:cohort_state': get('get-tl-filtered-cases', {'case_cohort': 'A', 'state': 'Review'}),
+    'get-tl-filtered-cases:assignee': lambda samples, i: (
+        'get-tl-filtered-cases', 'GET', {'email': samples['analysts'][i % len(samples['analysts'])]}, None),
+    'get-payments:unallocated': get('get-payments', {'analyst_email': 'na', 'allocation': 'unallocated', 'include_future_payments': 'true'}),
+    'get-payments:allocated': lambda samples, i: (
+        'get-payments', 'GET', {'analyst_email': samples['analysts'][i % len(samples['analysts'])], 'allocation': 'allocated', 'include_future_payments': 'true'}, None),
+    'get-user-access': get('get-user-access', {}),
+    'get-view-freshness': get('get-view-freshness', {}),
+    'get-mi-export:reviewer_stats': get('get-mi-export', {'object_name': 'reviewer_stats', 'tab_name': 'Reviewers'}),
+    'get-mi-export:case_overview': get('get-mi-export', {'object_name': 'case_overview', 'tab_name': 'Cases'}),
+    'get-mi-export:ops_pack': get('get-mi-export', {'object_name': 'ops_pack'}),
+    # After the first iteration this measures the steady-state delta; full=true re-extracts everything
+    'get-mi-export:case_status_changes': get('get-mi-export', {'object_name': 'case_status_changes'}),
+    'get-mi-export:case_status_changes_full': get('get-mi-export', {'object_name': 'case_status_changes', 'full': 'true'}),
+    'post-qc-assigned-cases': post_qc_assigned_cases,
+    'post-payments:batch': post_payments,
+}
+
+SAMPLE_QUERIES = {
+    'case_ids': "SELECT case_id FROM mtl.POPULATION_MASTER ORDER BY md5(case_id) LIMIT 200",
+    'analysts': "SELECT assignedtoanalyst FROM mtl.CASE_ALLOCATION WHERE assignedtoanalyst IS NOT NULL GROUP BY 1 ORDER BY 1 LIMIT 50",
+    'batches': "SELECT batch_number FROM mtl.CASE_ALLOCATION WHERE batch_number IS NOT NULL GROUP BY 1 ORDER BY 1 LIMIT 50",
+    'review_completed': "SELECT case_id FROM mtl.CASE_TRACKER WHERE end_ts = '9999-12-31 00:00:00' AND sub_state = 'Case Review Completed' ORDER BY case_id LIMIT 5000",
+    'qc_users': "SELECT user_email, user_name FROM mtl.USER_ACCESS WHERE access_level_id = 2 ORDER BY 1 LIMIT 20",
+    'payment_cases': "SELECT case_id FROM mtl.MASTER_PAYMENT WHERE NOT payment_completed_by_analyst GROUP BY 1 ORDER BY 1 LIMIT 5000",
+    'in_review': "SELECT case_id, assignedtoanalyst FROM mtl.CASE_ALLOCATION WHERE casestatusanalyst = 'IN_PROGRESS' AND end_ts = '9999-12-31 00:00:00' ORDER BY case_id LIMIT 5000",
+}
+
+
+def load_samples(settings):
+    samples = {}
+    with closing(psycopg2.connect(**settings)) as conn, conn.cursor() as cursor:
+        for name, sql_statement in SAMPLE_QUERIES.items():
+            cursor.execute(sql_statement)
+            rows = cursor.fetchall()
+            samples[name] = [row if len(row) > 1 else row[0] for row in rows]
+    return samples
+
+
+def make_request(function_name, method, params, body):
+    return func.HttpRequest(
+        method=method,
+        url=f'/api/{function_name}',
+        headers={'Content-Type': 'application/json'},
+        params=params,
+        body=json.dumps(body).encode() if body is not None else b'',
+    )
+
+
+def count_rows(body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return 0
+    if isinstance(payload, list):
+        return len(payload)
+    if isinstance(payload, dict):
+        return sum(len(value) for value in payload.values() if isinstance(value, list))
+    return 0
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_scenario(name, settings, samples, iterations, warmup):
+    # Runs in a fresh process, so peak RSS belongs to this endpoint alone
+    fakes.install(settings)
+    builder = SCENARIOS[name]
+    function_name = builder(samples, 0)[0]
+    handler = load_handler(function_name)
+    fakes.FakeBlobServiceClient.reset()
+
+    loop = asyncio.new_event_loop()
+    if inspect.iscoroutinefunction(handler.main):
+        call = lambda req: loop.run_until_complete(handler.main(req))
+    else:
+        call = handler.main
+
+    baseline_rss = peak_rss_mb()
+    latencies = []
+    rows = 0
+    response_bytes = 0
+    errors = 0
+    for i in range(warmup + iterations):
+        _, method, params, body = builder(samples, i)
+        req = make_request(function_name, method, params, body)
+        started = time.perf_counter()
+        response = call(req)
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        payload = response.get_body() if hasattr(response, 'get_body') else b''
+        response_bytes += len(payload)
+        if getattr(response, 'status_code', 500) >= 400:
+            errors += 1
+        else:
+            rows += count_rows(payload)
+    loop.close()
+
+    total = sum(latencies)
+    return {
+        'function': function_name,
+        'iterations': iterations,
+        'errors': errors,
+        **summarise_ms(latencies),
+        'mean_ms': total / len(latencies) * 1000 if latencies else 0.0,
+        'requests_per_sec': len(latencies) / total if total else 0.0,
+        'rows_per_request': rows / len(latencies) if latencies else 0.0,
+        'rows_per_sec': rows / total if total else 0.0,
+        'response_bytes_per_request': response_bytes / len(latencies) if latencies else 0.0,
+        'blob_bytes_uploaded': fakes.FakeBlobServiceClient.uploaded_bytes(),
+        'baseline_rss_mb': baseline_rss,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_isolated(name, settings, samples, iterations, warmup):
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(run_scenario, (name, settings, samples, iterations, warmup))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    print(f"{'scenario':<38}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rows/s':>11}{'rss MB':>8}{'err':>5}")
+    for name, result in results.items():
+        line = (f"{name:<38}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+                f"{result['rows_per_sec']:>11.0f}{result['peak_rss_mb']:>8.0f}{result['errors']:>5}")
+        previous = (baseline or {}).get(name)
+        if previous and previous['p95_ms']:
+            line += f"   p95 {(result['p95_ms'] / previous['p95_ms'] - 1) * 100:+.0f}%"
+        print(line)
+
+
+def run_suite(settings, names, iterations, warmup, log=print):
+    samples = load_samples(settings)
+    results = {}
+    for name in names:
+        log(f'running {name}')
+        results[name] = run_isolated(name, settings, samples, iterations, warmup)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--use-existing', action='store_true', help='Use the server in PGHOST/PGPORT/... instead of starting one')
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse an already seeded mtl schema (with --use-existing)')
+    parser.add_argument('--keep', action='store_true', help='Keep the throwaway cluster directory')
+    parser.add_argument('--cases', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', action='append', help='Scenario name or glob; may be repeated')
+    parser.add_argument('--output', help='Write results as JSON')
+    parser.add_argument('--compare', help='Previous JSON results to compare against')
+    args = parser.parse_args()
+
+    names = [name for name in SCENARIOS if not args.only or any(fnmatch.fnmatch(name, pattern) for pattern in args.only)]
+    if not names:
+        parser.error('no scenarios match --only')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scenarios']
+
+    def execute(settings):
+        if not args.skip_seed:
+            seeder.seed(settings, cases=args.cases, users=args.users, reset=True)
+        return run_suite(settings, names, args.iterations, args.warmup)
+
+    if args.use_existing:
+        results = execute(settings_from_env())
+    else:
+        with local_postgres(keep=args.keep) as settings:
+            results = execute(settings)
+
+    print_report(results, baseline)
+
+    if args.output:
+        report = {
+            'run': {
+                'started': datetime.now(timezone.utc).isoformat(),
+                'commit': git_commit(),
+                'cases': args.cases,
+                'users': args.users,
+                'iterations': args.iterations,
+                'warmup': args.warmup,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+            },
+            'scenarios': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Latency of get-tl-filtered-cases across every filter combination.
+
+For each combination of filters the same query is run two ways on asyncpg:
+
+* legacy  - values inlined into the SQL text (the old string-fragment builder),
+            on a connection with the statement cache disabled so every call is
+            parsed and planned from scratch.
+* builder - shared_code.case_filters with bound parameters on a pooled
+            connection, so each statement shape is prepared once and reused.
+
+Filter values are sampled from mtl.CASE_OVERVIEW_VW. Run before and after
+applying sql/indexes/case_overview_filters.sql to see the effect of the indexes.
+
+    python benchmarks/tl_filtered_cases.py --iterations 50 --output tl_filters.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+
+from common import settings_from_env, summarise_ms
+
+import asyncpg
+from shared_code.case_filters import CASE_OVERVIEW_FILTERS, CASE_OVERVIEW_SELECT, build_case_overview_query
+
+SAMPLE_COLUMNS = {
+    'case_id': 'case_id',
+    'case_cohort': 'cohort',
+    'state': 'state',
+    'sub_state': 'sub_state',
+    'email': 'assignedto',
+    'claim_reference': 'claim_reference',
+}
+
+
+def filter_combinations():
+    names = [name for name, _, _ in CASE_OVERVIEW_FILTERS]
+    for size in range(len(names) + 1):
+        for combo in itertools.combinations(names, size):
+            if 'claim_reference' in combo and 'claim_reference_prefix' in combo:
+                continue
+            yield combo
+
+
+def legacy_sql(params):
+    sql_statement = CASE_OVERVIEW_SELECT + " WHERE 1=1"
+    for name, column, operator in CASE_OVERVIEW_FILTERS:
+        if name in params:
+            value = params[name].replace("'", "''")
+            if operator == 'LIKE':
+                sql_statement += f" AND {column} LIKE '{value}%' "
+            else:
+                sql_statement += f" AND {column} = '{value}' "
+    return sql_statement
+
+
+async def timed(samples, coro_factory, iterations):
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await coro_factory()
+        samples.append(time.perf_counter() - started)
+
+
+async def run(iterations):
+    settings = settings_from_env()
+    connect_args = dict(host=settings['host'], port=int(settings['port']), database=settings['dbname'],
+                        user=settings['user'], password=settings['password'])
+    legacy_conn = await asyncpg.connect(statement_cache_size=0, **connect_args)
+    builder_conn = await asyncpg.connect(**connect_args)
+
+    sample = await builder_conn.fetchrow(
+        "SELECT case_id, cohort, state, sub_state, assignedto, claim_reference FROM mtl.CASE_OVERVIEW_VW "
+        "WHERE assignedto IS NOT NULL AND claim_reference IS NOT NULL LIMIT 1"
+    )
+    values = {name: str(sample[column]) for name, column in SAMPLE_COLUMNS.items()}
+    values['claim_reference_prefix'] = values['claim_reference'][:4]
+
+    report = []
+    for combo in filter_combinations():
+        params = {name: values[name] for name in combo}
+        sql_statement, sql_args = build_case_overview_query(params)
+        legacy_statement = legacy_sql(params)
+
+        legacy_samples, builder_samples = [], []
+        await timed(legacy_samples, lambda: legacy_conn.fetch(legacy_statement), iterations)
+        await timed(builder_samples, lambda: builder_conn.fetch(sql_statement, *sql_args), iterations)
+
+        report.append({
+            'filters': list(combo),
+            'legacy': summarise_ms(legacy_samples),
+            'builder': summarise_ms(builder_samples),
+        })
+
+    await legacy_conn.close()
+    await builder_conn.close()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.iterations))
+
+    print(f"{'filters':<70}{'legacy p95':>12}{'builder p95':>13}")
+    for row in report:
+        label = ', '.join(row['filters']) or '(none)'
+        print(f"{label:<70}{row['legacy']['p95_ms']:>10.2f}ms{row['builder']['p95_ms']:>11.2f}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,9 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from shared_code import db, inbox, instrumentation
  
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -14,6 +11,7 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -38,30 +36,15 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         }
 
     try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         userIdentifier = userIdentifier.lower()
 
         if query_type == 'fr':
-            sql_statement = "SELECT ca.*, ct.case_tags FROM mtl.CASE_ALLOCATION ca LEFT JOIN mtl.CASE_TAGS ct ON ca.case_id = ct.case_id and ct.end_ts = '9999-12-31 00:00:00' WHERE ca.end_ts = '9999-12-31 00:00:00' and (assignedtoanalyst = %s OR assignedtoqc = %s OR assignedtoqa = %s OR assignedtoctc = %s   OR assignedtoer = %s)"
-            cursor.execute(sql_statement, (userIdentifier, userIdentifier, userIdentifier, userIdentifier, userIdentifier))
+            # The user's inbox rows drive the lookup, so this is one index range scan whatever their roles
+            cursor.execute(inbox.ASSIGNED_CASES, (userIdentifier,))
 
         elif query_type == 'sc':
             sql_statement = "SELECT * FROM mtl.SOFT_INVITE_CASE_DETAIL_VW WHERE ASSIGNED_TO = %s"
@@ -76,7 +59,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         conn.close()
 
         # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
+        results_json = instrumentation.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
 
         # Return the records as a JSON response
         return func.HttpResponse(
@@ -0,0 +1,102 @@
+import azure.functions as func
+import logging
+import json
+from psycopg2.extras import RealDictCursor
+from shared_code import blob_storage, db, instrumentation
+
+@instrumentation.instrumented
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Blob SAS function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type'
+    }
+
+    case_id = req.params.get('case_id')
+    access = req.params.get('access')
+    if not case_id or access not in ('upload', 'download'):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: Missing required query parameter "case_id" or "access" (upload or download)'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        if access == 'upload':
+            try:
+                blob_name = blob_storage.new_case_document_name(case_id, req.params.get('file_name'))
+            except ValueError as e:
+                return func.HttpResponse(
+                    body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+                    status_code=400,
+                    headers=headers
+                )
+
+            upload_url, expires_on = blob_storage.upload_sas_url(blob_name)
+
+            # The browser PUTs the file to upload_url with these headers, then calls
+            # post-blob-files with the blob_name to record it
+            response = {
+                'upload_url': upload_url,
+                'blob_name': blob_name,
+                'expires_on': expires_on.isoformat(),
+                'required_headers': {
+                    'x-ms-blob-type': 'BlockBlob',
+                    'x-ms-blob-content-md5': '<base64 MD5 of the file>'
+                }
+            }
+
+        else:
+            blob_name = req.params.get('blob_name')
+            if not blob_name or not blob_storage.is_case_document(case_id, blob_name):
+                return func.HttpResponse(
+                    body=json.dumps({'message': 'Bad Request: Missing or invalid query parameter "blob_name"'}),
+                    status_code=400,
+                    headers=headers
+                )
+
+            # Only hand out read access to documents whose upload was confirmed for this case
+            conn = db.connect()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(
+                "SELECT file_name FROM mtl.UPLOADED_FILES WHERE case_id = %s AND blob_name = %s AND confirmed_ts IS NOT NULL",
+                (case_id, blob_name)
+            )
+            document = cursor.fetchone()
+            cursor.close()
+            conn.close()
+
+            if document is None:
+                return func.HttpResponse(
+                    body=json.dumps({'message': 'Document not found'}),
+                    status_code=404,
+                    headers=headers
+                )
+
+            download_url, expires_on = blob_storage.download_sas_url(blob_name, document['file_name'])
+            response = {
+                'download_url': download_url,
+                'blob_name': blob_name,
+                'expires_on': expires_on.isoformat()
+            }
+
+        return func.HttpResponse(
+            body=json.dumps(response),
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
@@ -0,0 +1,88 @@
+import azure.functions as func
+import logging
+import json
+from shared_code import case_events, db_async, instrumentation
+
+
+def sse_body(token, events, resync):
+    # One response's worth of server-sent events. EventSource reconnects retry ms after it
+    # ends and sends the last id as Last-Event-ID, which is the token to carry on from
+    lines = ['retry: 500']
+    if resync:
+        lines += [f'id: {token}', 'event: resync', 'data: {}', '']
+    elif events:
+        for event in events:
+            lines += [f'id: {token}', 'event: change', f'data: {json.dumps(event)}', '']
+    else:
+        lines += [f'id: {token}', ': no changes', '']
+    return '\n'.join(lines) + '\n'
+
+
+@instrumentation.instrumented
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database get-case-events function processed a request.')
+
+    event_stream = 'text/event-stream' in (req.headers.get('Accept') or '')
+    headers = {
+        'Content-Type': 'text/event-stream' if event_stream else 'application/json',
+        'Cache-Control': 'no-cache',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Last-Event-ID'
+    }
+
+    screens = {screen.strip().lower() for screen in (req.params.get('screens') or '').split(',') if screen.strip()}
+    batches = {batch.strip() for batch in (req.params.get('batches') or '').split(',') if batch.strip()}
+    token = req.params.get('token') or req.headers.get('Last-Event-ID')
+    try:
+        wait = min(float(req.params.get('wait') or case_events.max_wait_seconds()), case_events.max_wait_seconds())
+        if token is not None:
+            case_events.parse_token(token)
+    except ValueError as e:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+            status_code=400,
+            headers={**headers, 'Content-Type': 'application/json'}
+        )
+    if (not screens and not batches) or screens - set(case_events.SCREENS):
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: subscribe to "screens" from {", ".join(case_events.SCREENS)} '
+                                        'and/or "batches"'}),
+            status_code=400,
+            headers={**headers, 'Content-Type': 'application/json'}
+        )
+
+    try:
+        events, resync = [], False
+        if token is not None:
+            # Waits on this worker's listener, holding no database connection or thread meanwhile
+            events, resync = await case_events.get_listener().wait(token, screens, batches, max(wait, 0))
+
+        # No token yet, or the client refetches now: hand out a token from after this point.
+        # A quiet poll keeps its token, so nothing that commits meanwhile is skipped.
+        if token is None or events or resync:
+            rows = await db_async.fetch_all(case_events.CURRENT_TOKEN)
+            token = rows[0]['token']
+
+        if event_stream:
+            body = sse_body(token, events, resync)
+        else:
+            body = json.dumps({'token': token, 'resync': resync, 'events': events})
+
+        return func.HttpResponse(
+            body=body,
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers={**headers, 'Content-Type': 'application/json'}
+        )
@@ -0,0 +1,79 @@
+import azure.functions as func
+import logging
+import json
+from decimal import Decimal
+from psycopg2.extras import RealDictCursor
+from datetime import date, datetime
+from shared_code import change_feed, db, instrumentation
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+        elif isinstance(obj, Decimal):  # Convert Decimal to float
+            return float(obj)
+        return super().default(obj)
+
+@instrumentation.instrumented
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database get-changes function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type'
+    }
+
+    # No token: hand out a starting token, to be taken before the screen's full load
+    token = req.params.get('token')
+    feeds = [feed.strip().lower() for feed in req.params.get('feeds', ','.join(change_feed.FEEDS)).split(',') if feed.strip()]
+    unknown = [feed for feed in feeds if feed not in change_feed.FEEDS]
+    if unknown or not feeds:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: feeds must be from {", ".join(change_feed.FEEDS)}'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        with db.pooled_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                if token is None:
+                    result = {'token': change_feed.current_token(cursor), **{feed: [] for feed in feeds}}
+                else:
+                    new_token, rows = change_feed.changes(cursor, token, feeds)
+                    result = {'token': new_token, **rows}
+
+        return func.HttpResponse(
+            body=instrumentation.dumps(result, cls=CustomJSONEncoder),
+            status_code=200,
+            headers=headers
+        )
+
+    except change_feed.InvalidToken as e:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+            status_code=400,
+            headers=headers
+        )
+
+    except change_feed.TooManyChanges as e:
+        # Too far behind to catch up by deltas; the client reloads the screen and starts again
+        return func.HttpResponse(
+            body=json.dumps({'message': str(e), 'resync': True}),
+            status_code=410,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
@@ -1,12 +1,8 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
-from psycopg2.extras import RealDictCursor
 from datetime import date, datetime, timedelta
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db_async, instrumentation
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -17,91 +13,36 @@ class CustomJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Database query function processed a request.')
-
-    headers = {
-        'Content-Type': 'application/json',
-        'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
-    }
-
-
-    try:
-        query_type = req.params.get('query_type')
-    except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': headers,
-           'body': json.dumps({
-                'message': 'Bad Request: Missing required query parameter "query_type"'
-            })
-        }
-
-    # if query_type == "fr":
-    #     sql_statement = "SELECT * FROM PUBLIC.DASHBOARD_FR_VW"
-    # elif query_type == "qc":
-    #     sql_statement = "SELECT * FROM PUBLIC.DASHBOARD_QC_VW"
-    # elif query_type == "rm":
-    #     sql_statement = "SELECT * FROM PUBLIC.DASHBOARD_RM_VW"
-    if query_type == "case_tracker":
-        sql_statement = """WITH last_friday AS (
-                            SELECT date_trunc('week', CURRENT_DATE) - interval '2 days' + interval '1 second' AS end_of_last_friday),
-                        last_week_states AS (
-                            SELECT
-                                ct.state, ct.sub_state, pm.cohort, COUNT(*) AS last_week_count
-                            FROM mtl.CASE_TRACKER ct
-                            LEFT JOIN mtl.population_master pm ON ct.case_id = pm.case_id
-                            WHERE
-                                ct.start_ts <= (SELECT end_of_last_friday FROM last_friday)
-                                AND (ct.end_ts > (SELECT end_of_last_friday FROM last_friday) OR ct.end_ts = '9999-12-31 00:00:00')
-                            GROUP BY ct.state, ct.sub_state, pm.cohort
-                        ),
-                        current_live_states AS (
-                            SELECT
-                                ct.state, ct.sub_state, pm.cohort, COUNT(*) AS current_live_count
-                            FROM 
-                                mtl.CASE_TRACKER ct
-                            LEFT JOIN
-                                mtl.CASE_ALLOCATION ca ON ct.case_id = ca.case_id
-                            LEFT JOIN
-                                mtl.POPULATION_MASTER pm ON ct.case_id = pm.case_id
-                            WHERE
-                                ct.end_ts = '9999-12-31 00:00:00'
-                            GROUP BY
-                                ct.state, ct.sub_state, pm.cohort
-                        )
-                        SELECT
-                            c.state, c.sub_state, c.cohort, COALESCE(l.last_week_count, 0) AS last_week_count, COALESCE(c.current_live_count, 0) AS current_live_count
-                        FROM
-                            current_live_states c
-                        LEFT JOIN
-                            last_week_states l
-                        ON
-                            c.state = l.state
-                            AND c.sub_state = l.sub_state
-                            AND c.cohort = l.cohort
-                        UNION ALL
+# The case_tracker dashboard used to be one statement with two CTEs joined together.
+# The CTEs are independent, so they now run concurrently on separate pooled connections
+# and are combined in merge_case_tracker_counts.
+LAST_WEEK_STATES = """WITH last_friday AS (
+                            SELECT date_trunc('week', CURRENT_DATE) - interval '2 days' + interval '1 second' AS end_of_last_friday)
                         SELECT
-                            l.state, l.sub_state, l.cohort, COALESCE(l.last_week_count, 0) AS last_week_count, 0 AS current_live_count
+                            ct.state, ct.sub_state, pm.cohort, COUNT(*) AS last_week_count
+                        FROM mtl.CASE_TRACKER ct
+                        LEFT JOIN mtl.population_master pm ON ct.case_id = pm.case_id
+                        WHERE
+                            ct.start_ts <= (SELECT end_of_last_friday FROM last_friday)
+                            AND (ct.end_ts > (SELECT end_of_last_friday FROM last_friday) OR ct.end_ts = '9999-12-31 00:00:00')
+                        GROUP BY ct.state, ct.sub_state, pm.cohort
+                        """
+
+CURRENT_LIVE_STATES = """SELECT
+                            ct.state, ct.sub_state, pm.cohort, COUNT(*) AS current_live_count
                         FROM 
-                            last_week_states l
-                        LEFT JOIN 
-                            current_live_states c
-                        ON
-                            l.state = c.state
-                            AND l.sub_state = c.sub_state
-                            AND l.cohort = c.cohort
+                            mtl.CASE_TRACKER ct
+                        LEFT JOIN
+                            mtl.CASE_ALLOCATION ca ON ct.case_id = ca.case_id
+                        LEFT JOIN
+                            mtl.POPULATION_MASTER pm ON ct.case_id = pm.case_id
                         WHERE
-                            c.state IS NULL
-                        ORDER BY
-                            state, sub_state, cohort
+                            ct.end_ts = '9999-12-31 00:00:00'
+                        GROUP BY
+                            ct.state, ct.sub_state, pm.cohort
                         """
-    elif query_type == "file_review":
-        sql_statement = "SELECT * FROM mtl.file_review_stats_vw"
-    elif query_type == "quality":
-        sql_statement = """SELECT ifr.qc_review_outcome, assignedtoanalyst, assignedtoanalystname, reporting_manager, COUNT(*) 
+
+QUALITY = """SELECT ifr.qc_review_outcome, assignedtoanalyst, assignedtoanalystname, reporting_manager, COUNT(*) 
                             FROM mtl.case_allocation ca
                             LEFT JOIN mtl.user_access ua on ua.user_email = ca.assignedtoanalyst
                             LEFT JOIN ( SELECT DISTINCT max(input_file_review.input_file_review_sk) AS id_sk,
@@ -131,39 +72,71 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                                 WHERE ifr.qc_review_outcome <> '' group by 1"""
 
 
-    try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
+def merge_case_tracker_counts(last_week_rows, current_live_rows):
+    # Same result as the old FULL JOIN / UNION ALL: keys containing NULLs never match, like SQL equality
+    def state_key(row):
+        return (row['state'], row['sub_state'], row['cohort'])
+
+    last_week = {state_key(row): row['last_week_count'] for row in last_week_rows if None not in state_key(row)}
+    current_keys = set()
+    results = []
+
+    for row in current_live_rows:
+        key = state_key(row)
+        current_keys.add(key)
+        results.append({
+            'state': row['state'], 'sub_state': row['sub_state'], 'cohort': row['cohort'],
+            'last_week_count': last_week.get(key, 0) if None not in key else 0,
+            'current_live_count': row['current_live_count'] or 0
+        })
+
+    for row in last_week_rows:
+        key = state_key(row)
+        if None in key or key not in current_keys:
+            results.append({
+                'state': row['state'], 'sub_state': row['sub_state'], 'cohort': row['cohort'],
+                'last_week_count': row['last_week_count'] or 0,
+                'current_live_count': 0
+            })
 
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
+    # ORDER BY state, sub_state, cohort (NULLs last, as Postgres sorts them)
+    results.sort(key=lambda row: tuple((row[col] is None, row[col] or '') for col in ('state', 'sub_state', 'cohort')))
+    return results
 
 
-        # Establish a connection
-        conn = psycopg2.connect(conn_string)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+@instrumentation.instrumented
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database query function processed a request.')
 
-        cursor.execute(sql_statement)
-        
-        # Fetch all results
-        results = cursor.fetchall()
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type'
+    }
 
+    query_type = req.params.get('query_type')
+    if query_type not in ('case_tracker', 'file_review', 'quality'):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: Missing or invalid query parameter "query_type"'}),
+            status_code=400,
+            headers=headers
+        )
 
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
+    try:
+        if query_type == "case_tracker":
+            last_week_rows, current_live_rows = await db_async.fetch_concurrently(
+                (LAST_WEEK_STATES, ()),
+                (CURRENT_LIVE_STATES, ()),
+            )
+            results = merge_case_tracker_counts(last_week_rows, current_live_rows)
+        elif query_type == "file_review":
+            results = await db_async.fetch_all("SELECT * FROM mtl.file_review_stats_vw")
+        elif query_type == "quality":
+            results = await db_async.fetch_all(QUALITY)
 
         # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
+        results_json = instrumentation.dumps(results, cls=CustomJSONEncoder)
 
         # Return the records as a JSON response
         return func.HttpResponse(
@@ -183,5 +156,3 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             status_code=500,
             headers=headers      
         )
-
- 
@@ -1,12 +1,9 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, instrumentation, mailing_batches
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -14,6 +11,7 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -38,35 +36,20 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         }
 
     try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         if query_type == "cut_batch":
             sql_statement = "SELECT * FROM mtl.QC_MAILING_VW"
             cursor.execute(sql_statement)
         elif query_type == "qc_review":
-            sql_statement = "SELECT * FROM mtl.QC_MAILING_STATS_VW"
-            cursor.execute(sql_statement)
+            # QC_MAILING_STATS_VW, now read from counters kept up to date as cases are batched and reviewed
+            sql_statement, params = mailing_batches.readiness_query(batch_number)
+            cursor.execute(sql_statement, params)
         elif query_type == "qc_batch_review":
             sql_statement = f"SELECT * FROM mtl.QC_MAILING_SCREEN_VW WHERE MAILING_BATCH_NUMBER = %s"
-            cursor.execute(sql_statement, (batch_number))
+            cursor.execute(sql_statement, (batch_number,))
         elif query_type == "mailing":
             sql_statement = "SELECT * FROM mtl.QC_MAILING WHERE QC_MAILING_READY = TRUE"
             cursor.execute(sql_statement)
@@ -83,7 +66,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         conn.close()
 
         # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
+        results_json = instrumentation.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
 
         # Return the records as a JSON response
         return func.HttpResponse(
@@ -1,15 +1,9 @@
 import azure.functions as func
 import logging
 import json
-from openpyxl import Workbook
-import io
 from datetime import datetime
 from psycopg2.extras import RealDictCursor
-import psycopg2
-import os
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
-from azure.storage.blob import BlobServiceClient
+from shared_code import blob_storage, db, instrumentation, mi_export
 
 headers = {
     'Content-Type': 'application/json',
@@ -17,13 +11,17 @@ headers = {
     'Access-Control-Allow-Methods': 'OPTIONS,GET'
 }
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
     try:
         OBJECT_NAME = req.params.get('object_name')
+        # Without tab_name every active tab for the object is exported as one workbook
         TAB_NAME = req.params.get('tab_name')
-        if not OBJECT_NAME or not TAB_NAME:
+        # Incremental definitions export only rows changed since the last run unless full=true
+        FULL = req.params.get('full', 'false').lower() == 'true'
+        if not OBJECT_NAME:
             raise KeyError
     except KeyError:
         return func.HttpResponse(
@@ -33,85 +31,72 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-        # Retrieve the secret containing the database credentials
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        # Execute a SELECT query for metadata table to return row headers for excel and sql query for mi report
-        query = f"SELECT * FROM MTL.MI_METADATA_EXPORT WHERE object_name = '{OBJECT_NAME}' AND tab_name = '{TAB_NAME}' AND object_active = true"
-        dangerous_keywords = ['DROP', 'DELETE', 'TRUNCATE', 'UPDATE', 'ALTER', 'CREATE', 'GRANT']
-
-        if not any(keyword in query.upper() for keyword in dangerous_keywords):
-            cursor.execute(query)
-        else:
-            raise Exception('Detected dangerous keyword.')
-
-        # Fetch all results
-        results = cursor.fetchall()
-
-        # Set query for mi, execute and return results
-        mi_sql_query = results[0]["sql"]
-        mi_file_name = results[0]["mi_file_name"]
-        cursor.execute(mi_sql_query)
-        rows = cursor.fetchall()
-
-        # Combine column names and rows
-        result = []
-        col_names = list(rows[0].keys())
-        result.append(col_names)  # Add column names as the first element in the result list
-        # Extract values from each JSON object and add them to the result list
-        for obj in rows:
-            row_values = [obj[col] for col in col_names]  # Extract values corresponding to each column
-            result.append(row_values)
-
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
-
-        # Create a new workbook
-        wb = Workbook()
-
-        # Access the active sheet
-        ws = wb.active
-
-        # Name the sheet
-        ws.title = TAB_NAME
-
-        # Add the rows to the sheet
-        for row in result:
-            ws.append(row)
-
-        # Save the workbook to a buffer
-        excel_buffer = io.BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-
-        # Get the current date and time
-        current_datetime = datetime.now()
-        formatted_datetime = current_datetime.strftime('%Y%m%d_%H%M%S')
-        new_file_key = f'{mi_file_name}_{formatted_datetime}.xlsx'
-
-        # Upload the new Excel file to Azure Blob Storage
-        blob_service_client = BlobServiceClient.from_connection_string(secret_client.get_secret('DataConnectionString').value)
-        blob_client = blob_service_client.get_blob_client(container='mi-exports', blob=new_file_key)
-        blob_client.upload_blob(excel_buffer, overwrite=True)
+        # Claim the object's export window before reading its watermarks, so an overlapping
+        # run cannot export the same rows again
+        if not mi_export.claim_export(cursor, OBJECT_NAME):
+            cursor.close()
+            conn.close()
+            return func.HttpResponse(
+                body=json.dumps({'message': 'An export of this object is already running'}),
+                status_code=409,
+                headers=headers
+            )
+
+        try:
+            # Read the metadata rows holding the sheet names and sql queries for the mi report
+            definitions = mi_export.load_definitions(cursor, OBJECT_NAME, TAB_NAME)
+            if not definitions:
+                return func.HttpResponse(
+                    body=json.dumps({'message': 'No active MI export found'}),
+                    status_code=404,
+                    headers=headers
+                )
+            upper_bound = mi_export.export_upper_bound(cursor)
+            # Don't sit idle in a transaction while the export runs; the claim is held by the session
+            conn.commit()
+
+            # Run every tab's query concurrently, each streaming into its own sheet
+            excel_file, tabs = mi_export.build_workbook(definitions, upper_bound, FULL)
+            incremental = any(tab['incremental'] for tab in tabs) and not FULL
+
+            # Get the current date and time
+            current_datetime = datetime.now()
+            formatted_datetime = current_datetime.strftime('%Y%m%d_%H%M%S')
+            mi_file_name = definitions[0]["mi_file_name"] if TAB_NAME else OBJECT_NAME
+            new_file_key = f'{mi_file_name}_{"delta_" if incremental else ""}{formatted_datetime}.xlsx'
+
+            # Upload the new Excel file to Azure Blob Storage in parallel blocks
+            with excel_file:
+                blob_storage.upload_stream('mi-exports', new_file_key, excel_file, content_type=mi_export.XLSX_CONTENT_TYPE)
+
+            # Only move the watermarks on once the file is safely stored
+            conflicts = mi_export.save_watermarks(cursor, definitions, upper_bound, FULL)
+            if conflicts:
+                # Moved by a run that did not take the claim; this file would repeat its rows
+                conn.rollback()
+                blob_storage.delete_blob('mi-exports', new_file_key)
+                logging.warning('MI export watermark moved by a concurrent run: %s', ', '.join(conflicts))
+                return func.HttpResponse(
+                    body=json.dumps({'message': 'MI export watermark moved by a concurrent run', 'tabs': conflicts}),
+                    status_code=409,
+                    headers=headers
+                )
+            conn.commit()
+        finally:
+            # Closing the session drops the claim as well, should the unlock itself fail
+            try:
+                if not conn.closed:
+                    conn.rollback()
+                    mi_export.release_export(cursor, OBJECT_NAME)
+            finally:
+                conn.close()
 
         return func.HttpResponse(
-            body=json.dumps({'message': 'MI Report Created'}),
+            body=json.dumps({'message': 'MI Report Created', 'file_name': new_file_key, 'tabs': tabs}),
             status_code=200,
             headers=headers
         )
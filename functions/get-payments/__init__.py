@@ -1,13 +1,10 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
 from decimal import Decimal
+from shared_code import db, instrumentation, payments, responses
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -18,6 +15,7 @@ class CustomJSONEncoder(json.JSONEncoder):
         return super().default(obj)
 
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -59,63 +57,12 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
 
     try:
-        # Retrieve the secret containing the database credentials
-        # For Azure, you would use Azure Key Vault to store and retrieve secrets
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this example, we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        base_query = """
-            SELECT case_id, payment_reference, first_name, last_name, net_redress_value, 
-                payment_method, scheduled_payment_date, assignedtoanalyst, 
-                payment_completed_by_analyst, payment_completed_by_analyst_date, 
-                total_redress, interest, withheld_tax, address_line_1, address_line_2, 
-                address_line_3, address_line_4, address_line_5, postcode
-            FROM mtl.master_payment_analyst_vw
-            WHERE end_ts = '9999-12-31'
-        """
-
-        conditions = []
-        params = {}
-
-        # Include only past payments if include_future_payments is false
-        if include_future_payments != "true":
-            conditions.append("scheduled_payment_date <= CURRENT_DATE")
-
-        # Filter by analyst
-        if analyst_email == "na":
-            if allocation == "unallocated":
-                conditions.append("assignedtoanalyst IS NULL")
-            elif allocation == "allocated":
-                conditions.append("assignedtoanalyst IS NOT NULL AND payment_completed_by_analyst = false")
-            elif allocation == "completed":
-                conditions.append("payment_completed_by_analyst = true")
-        else:
-            if allocation in ["allocated", "completed"]:
-                conditions.append("assignedtoanalyst = %(analyst_email)s")
-                params["analyst_email"] = analyst_email
-                conditions.append(f"payment_completed_by_analyst = {'true' if allocation == 'completed' else 'false'}")
-
-        # Append conditions to base query
-        if conditions:
-            base_query += " AND " + " AND ".join(conditions)
-
-        #base_query += " ORDER BY case_id"
+        # One parameterized statement per allocation mode, served by the partial indexes on master_payment
+        base_query, params = payments.build_payments_query(analyst_email, allocation, include_future_payments)
 
         cursor.execute(base_query, params)
 
@@ -127,15 +74,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         cursor.close()
         conn.close()
 
-        # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
-
-        # Return the records as a JSON response
-        return func.HttpResponse(
-            body=results_json,
-            status_code=200,
-            headers=headers  
-        )
+        # Return the records as a JSON response, compressed when the client accepts it
+        return responses.json_response(req, results, headers=headers, cls=CustomJSONEncoder)
         
     except Exception as e:
         logging.error(f"Error: {str(e)}")
@@ -1,12 +1,9 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, instrumentation, main_screen_views
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -14,6 +11,7 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -36,21 +34,38 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             })
         }
     
+    try:
+        freshness = main_screen_views.parse_freshness(req)
+    except ValueError as e:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+            status_code=400,
+            headers=headers
+        )
+
+    # Main screen views are served from their materialized copies when freshness=cached
+    source_view = None
     if query_type == 'unallocated':
-        sql_statement = "SELECT * FROM mtl.QA_MAIN_SCREEN_VW WHERE (LENGTH(assignedtoqa) = 0 OR assignedtoqa IS NULL) AND casestatusqa = 'NEW' AND END_TS = '9999-12-31 00:00:00'"
+        source_view = 'mtl.QA_MAIN_SCREEN_VW'
+        sql_statement = "SELECT * FROM {source} WHERE (LENGTH(assignedtoqa) = 0 OR assignedtoqa IS NULL) AND casestatusqa = 'NEW' AND END_TS = '9999-12-31 00:00:00'"
     elif query_type == 'allocated':
-        sql_statement = "SELECT * FROM mtl.QA_MAIN_SCREEN_VW WHERE LENGTH(assignedtoqa) > 0 AND (casestatusqa = 'NEW' OR casestatusqa = 'IN_PROGRESS')  AND END_TS = '9999-12-31 00:00:00'"
+        source_view = 'mtl.QA_MAIN_SCREEN_VW'
+        sql_statement = "SELECT * FROM {source} WHERE LENGTH(assignedtoqa) > 0 AND (casestatusqa = 'NEW' OR casestatusqa = 'IN_PROGRESS')  AND END_TS = '9999-12-31 00:00:00'"
     elif query_type == 'completed':
-        sql_statement = "SELECT * FROM mtl.QA_MAIN_SCREEN_VW WHERE LENGTH(assignedtoqa) > 0 AND casestatusqa = 'COMPLETED'  AND END_TS = '9999-12-31 00:00:00'"
+        source_view = 'mtl.QA_MAIN_SCREEN_VW'
+        sql_statement = "SELECT * FROM {source} WHERE LENGTH(assignedtoqa) > 0 AND casestatusqa = 'COMPLETED'  AND END_TS = '9999-12-31 00:00:00'"
     elif query_type == 'batched':
         sql_statement = "SELECT * FROM mtl.QA_BATCH_SCREEN_VW"
     
     elif query_type == 'unallocated_ctc':
-        sql_statement = "SELECT * FROM mtl.CTC_MAIN_SCREEN_VW WHERE (LENGTH(assignedtoctc) = 0 OR assignedtoctc IS NULL) AND casestatusctc = 'NEW' AND END_TS = '9999-12-31 00:00:00'"
+        source_view = 'mtl.CTC_MAIN_SCREEN_VW'
+        sql_statement = "SELECT * FROM {source} WHERE (LENGTH(assignedtoctc) = 0 OR assignedtoctc IS NULL) AND casestatusctc = 'NEW' AND END_TS = '9999-12-31 00:00:00'"
     elif query_type == 'allocated_ctc':
-        sql_statement = "SELECT * FROM mtl.CTC_MAIN_SCREEN_VW WHERE LENGTH(assignedtoctc) > 0 AND (casestatusctc = 'NEW' OR casestatusctc = 'IN_PROGRESS')  AND END_TS = '9999-12-31 00:00:00'"
+        source_view = 'mtl.CTC_MAIN_SCREEN_VW'
+        sql_statement = "SELECT * FROM {source} WHERE LENGTH(assignedtoctc) > 0 AND (casestatusctc = 'NEW' OR casestatusctc = 'IN_PROGRESS')  AND END_TS = '9999-12-31 00:00:00'"
     elif query_type == 'completed_ctc':
-        sql_statement = "SELECT * FROM mtl.CTC_MAIN_SCREEN_VW WHERE LENGTH(assignedtoctc) > 0 AND casestatusctc = 'COMPLETED'  AND END_TS = '9999-12-31 00:00:00'"
+        source_view = 'mtl.CTC_MAIN_SCREEN_VW'
+        sql_statement = "SELECT * FROM {source} WHERE LENGTH(assignedtoctc) > 0 AND casestatusctc = 'COMPLETED'  AND END_TS = '9999-12-31 00:00:00'"
     elif query_type == 'batched_ctc':
         sql_statement = "SELECT * FROM mtl.CTC_BATCH_SCREEN_VW"
 
@@ -63,26 +78,15 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         print("unable to find query string")
 
     try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
+        if source_view:
+            source, staleness_seconds = main_screen_views.resolve_source(cursor, source_view, freshness)
+            headers.update(main_screen_views.source_headers(source_view, source, staleness_seconds))
+            sql_statement = sql_statement.format(source=source)
+
         #Execute SQL
         cursor.execute(sql_statement)
 
@@ -95,7 +99,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         conn.close()
 
         # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
+        results_json = instrumentation.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
 
         # Return the records as a JSON response
         return func.HttpResponse(
@@ -1,12 +1,9 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, instrumentation, main_screen_views
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -14,6 +11,7 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -39,42 +37,47 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     
 
     try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
+        freshness = main_screen_views.parse_freshness(req)
+    except ValueError as e:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+            status_code=400,
+            headers=headers
+        )
 
+    try:
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
 
-        #cursor.execute(f"REFRESH MATERIALIZED VIEW mtl.release_main_screen_vw;")
+        # Main screen views are served from their materialized copies when freshness=cached
+        sql_params = ()
         if query_type == 'unallocated':
-            sql_statement = f"SELECT * FROM mtl.QC_MAIN_SCREEN_VW WHERE (LENGTH(assignedtoqc) = 0 OR assignedtoqc IS NULL) AND casestatusqc = 'NEW'"
+            source_view = 'mtl.QC_MAIN_SCREEN_VW'
+            sql_statement = "SELECT * FROM {source} WHERE (LENGTH(assignedtoqc) = 0 OR assignedtoqc IS NULL) AND casestatusqc = 'NEW'"
         elif query_type == 'allocated':
-            sql_statement = f"SELECT * FROM mtl.QC_MAIN_SCREEN_VW WHERE LENGTH(assignedtoqc) > 1 AND (casestatusqc = 'NEW' OR casestatusqc = 'IN_PROGRESS')"
+            source_view = 'mtl.QC_MAIN_SCREEN_VW'
+            sql_statement = "SELECT * FROM {source} WHERE LENGTH(assignedtoqc) > 1 AND (casestatusqc = 'NEW' OR casestatusqc = 'IN_PROGRESS')"
         elif query_type == 'completed':
-            sql_statement = f"SELECT * FROM mtl.QC_MAIN_SCREEN_VW WHERE LENGTH(assignedtoqc) > 1 AND casestatusqc = 'COMPLETED'"
+            source_view = 'mtl.QC_MAIN_SCREEN_VW'
+            sql_statement = "SELECT * FROM {source} WHERE LENGTH(assignedtoqc) > 1 AND casestatusqc = 'COMPLETED'"
         elif query_type == 'release':
-            sql_statement = f"SELECT * FROM mtl.RELEASE_MAIN_SCREEN_VW WHERE (LENGTH(on_hold_reason) = 0 OR on_hold_reason IS NULL) AND (LENGTH(caserelease_ts::text) = 0 OR caserelease_ts IS NULL) AND BATCH_NUMBER = '{batch_id}'" 
+            source_view = 'mtl.RELEASE_MAIN_SCREEN_VW'
+            sql_statement = "SELECT * FROM {source} WHERE (LENGTH(on_hold_reason) = 0 OR on_hold_reason IS NULL) AND (LENGTH(caserelease_ts::text) = 0 OR caserelease_ts IS NULL) AND BATCH_NUMBER = %s"
+            sql_params = (batch_id,)
         elif query_type == 'on_hold':
-            sql_statement = f"SELECT * FROM mtl.RELEASE_MAIN_SCREEN_VW WHERE (LENGTH(on_hold_reason) > 1 OR on_hold_reason IS NOT NULL) AND (LENGTH(caserelease_ts::text) = 0 OR caserelease_ts IS NULL) AND BATCH_NUMBER = '{batch_id}'" 
+            source_view = 'mtl.RELEASE_MAIN_SCREEN_VW'
+            sql_statement = "SELECT * FROM {source} WHERE (LENGTH(on_hold_reason) > 1 OR on_hold_reason IS NOT NULL) AND (LENGTH(caserelease_ts::text) = 0 OR caserelease_ts IS NULL) AND BATCH_NUMBER = %s"
+            sql_params = (batch_id,)
         elif query_type == 'released':
-            sql_statement = f"SELECT * FROM mtl.RELEASE_MAIN_SCREEN_VW WHERE (LENGTH(caserelease_ts::text) > 1 OR caserelease_ts IS NOT NULL) AND BATCH_NUMBER = '{batch_id}'"
-        
-        cursor.execute(sql_statement)
+            source_view = 'mtl.RELEASE_MAIN_SCREEN_VW'
+            sql_statement = "SELECT * FROM {source} WHERE (LENGTH(caserelease_ts::text) > 1 OR caserelease_ts IS NOT NULL) AND BATCH_NUMBER = %s"
+            sql_params = (batch_id,)
+
+        source, staleness_seconds = main_screen_views.resolve_source(cursor, source_view, freshness)
+        headers.update(main_screen_views.source_headers(source_view, source, staleness_seconds))
+        cursor.execute(sql_statement.format(source=source), sql_params)
         
 
         # Fetch all results
@@ -86,7 +89,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         conn.close()
 
         # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
+        results_json = instrumentation.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
 
         # Return the records as a JSON response
         return func.HttpResponse(
@@ -1,12 +1,9 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, instrumentation, responses
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -14,6 +11,7 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -46,24 +44,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         sql_statement = "SELECT * FROM mtl.CONTACT_QUERIES WHERE UPPER(QUERY_STATUS) = 'CLOSED' AND end_ts = '9999-12-31'"
 
     try:
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         #Execute SQL
@@ -77,15 +59,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         cursor.close()
         conn.close()
 
-        # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
-
-        # Return the records as a JSON response
-        return func.HttpResponse(
-            body=results_json,
-            status_code=200,
-            headers=headers  
-        )
+        # Return the records as a JSON response, compressed when the client accepts it
+        return responses.json_response(req, results, headers=headers, cls=CustomJSONEncoder)
         
     except Exception as e:
         logging.error(f"Error: {str(e)}")
@@ -1,12 +1,10 @@
+import asyncio
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
-from psycopg2.extras import RealDictCursor
 from datetime import date, datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db_async, instrumentation, responses
+from shared_code.case_filters import build_case_overview_query, InvalidFilterError
 
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -14,7 +12,8 @@ class CustomJSONEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+@instrumentation.instrumented
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
     headers = {
@@ -24,97 +23,33 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Access-Control-Allow-Headers': 'Content-Type'
     }
 
-
+    # Filters: case_id, case_cohort, state, sub_state, email, claim_reference, claim_reference_prefix
     try:
-        QUERY_STRING = req.params
-    except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': headers,
-           'body': json.dumps({
-                'message': 'Bad Request: Missing required query parameter "user"'
-            })
-        }
+        sql_statement, sql_args = build_case_overview_query(req.params)
+    except InvalidFilterError as e:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+            status_code=400,
+            headers=headers
+        )
 
     try:
-        sql_statement = "SELECT CASE_ID, CLAIM_REFERENCE, COHORT, STATE, SUB_STATE, LAST_UPDATED_TS, ASSIGNEDTONAME FROM mtl.CASE_OVERVIEW_VW WHERE 1=1"
-
-        if "case_id" in QUERY_STRING:
-            Case_id = req.params.get('case_id')
-            sql_statement += f" AND case_id = '{Case_id}' "
-            
-        if "case_cohort" in QUERY_STRING:
-            Cohort = req.params.get('case_cohort')
-            sql_statement += f" AND cohort = '{Cohort}' "
-            
-        if "state" in QUERY_STRING:
-            state = req.params.get('state')
-            sql_statement += f" AND state = '{state}' "
-                    
-        if "sub_state" in QUERY_STRING:
-            sub_state = req.params.get('sub_state')
-            sql_statement += f" AND sub_state = '{sub_state}' "
-            
-        if "email" in QUERY_STRING:
-            User = req.params.get('email')
-            sql_statement += f" AND (assignedto = '{User}') "
-
-        if "claim_reference" in QUERY_STRING:
-            claim_ref = req.params.get('claim_reference')
-            sql_statement += f" AND claim_reference = '{claim_ref}' "
-
-        # Retrieve the secret containing the database credentials
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-        # Establish a connection
-        conn = psycopg2.connect(conn_string)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        # Bound parameters and a canonical filter order keep the number of distinct
+        # statements small, so asyncpg's per-connection statement cache reuses the plan
+        results = await db_async.fetch_all(sql_statement, *sql_args)
 
+        # Return the records as a JSON response, compressed when the client accepts it. Compressing
+        # a large body is CPU work, so it runs off the event loop
+        return await asyncio.to_thread(responses.json_response, req, results, headers=headers, cls=CustomJSONEncoder)
 
-        cursor.execute(sql_statement)
-
-        # Fetch all results
-        results = cursor.fetchall()
-
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
-
-        # Convert the results to JSON
-        results_json = json.dumps(results, cls=CustomJSONEncoder)  # Use default=str to handle datetime serialization
-
-        # Return the records as a JSON response
-        return func.HttpResponse(
-            body=results_json,
-            status_code=200,
-            headers=headers  
-        )
-        
     except Exception as e:
         logging.error(f"Error: {str(e)}")
         logging.error("Exception type: %s", type(e).__name__)
         logging.error("Exception message: %s", str(e))
         logging.error("Stack trace:", exc_info=True)
 
-
-
         return func.HttpResponse(
             body=json.dumps({"error": str(e)}),
             status_code=500,
-            headers=headers      
+            headers=headers
         )
-
- 
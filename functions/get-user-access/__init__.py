@@ -1,12 +1,10 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from shared_code import db, instrumentation
 
+@instrumentation.instrumented
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database query function processed a request.')
 
@@ -18,25 +16,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     }
 
     try:
-        # Retrieve the secret containing the database credentials
-        # For Azure, you would use Azure Key Vault to store and retrieve secrets
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-        # For this example, we'll use environment variables
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
         # Establish a connection
-        conn = psycopg2.connect(conn_string)
+        conn = db.connect()
         cursor = conn.cursor(cursor_factory=RealDictCursor)
 
         sql_statement = 'SELECT A.*, B.ACCESS_LEVEL_DESCRIPTION FROM mtl.USER_ACCESS A INNER JOIN mtl.ACCESS_LEVEL B ON A.ACCESS_LEVEL_ID = B.ACCESS_LEVEL_ID'
@@ -51,7 +32,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         conn.close()
 
         # Convert the results to JSON
-        results_json = json.dumps(results, default=str)  # Use default=str to handle datetime serialization
+        results_json = instrumentation.dumps(results, default=str)  # Use default=str to handle datetime serialization
 
         # Return the records as a JSON response
         return func.HttpResponse(
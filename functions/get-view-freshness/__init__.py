@@ -0,0 +1,51 @@
+import azure.functions as func
+import logging
+import json
+from contextlib import closing
+from decimal import Decimal
+from psycopg2.extras import RealDictCursor
+from datetime import date, datetime
+from shared_code import db, instrumentation, main_screen_views
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+        elif isinstance(obj, Decimal):  # Convert Decimal to float
+            return float(obj)
+        return super().default(obj)
+
+@instrumentation.instrumented
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database query function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type'
+    }
+
+    try:
+        # Staleness, pending writes and last refresh outcome for each materialized main-screen view
+        with closing(db.connect()) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                results = main_screen_views.staleness_metrics(cursor)
+
+        return func.HttpResponse(
+            body=instrumentation.dumps(results, cls=CustomJSONEncoder),
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
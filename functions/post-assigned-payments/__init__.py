@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, idempotency, instrumentation
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database post-assigned-payments function processed a request.')
 
@@ -28,21 +27,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             headers={'Content-Type': 'application/json'}
         )
 
-    # Retrieve the secret containing the database credentials
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 for update_case in request_body:
                     print(update_case)
@@ -0,0 +1,75 @@
+import azure.functions as func
+import logging
+import json
+import math
+from datetime import date
+from shared_code import auto_allocation, case_events, db, idempotency, instrumentation, main_screen_views
+
+@instrumentation.instrumented
+@idempotency.idempotent
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database post-auto-allocation function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+    }
+
+    try:
+        # Parse the JSON body from the request
+        request_body = req.get_json()
+        start_date = date.fromisoformat(request_body['start_date'])
+        end_date = date.fromisoformat(request_body['end_date'])
+        cohorts = request_body.get('cohorts') or None
+        handling_hours = {str(cohort): float(hours) for cohort, hours in (request_body.get('handling_hours') or {}).items()}
+        # Nothing is written unless the caller asks for it
+        dry_run = request_body.get('dry_run', True) is not False
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: JSON body needs "start_date" and "end_date" (YYYY-MM-DD); '
+                                        '"cohorts", "handling_hours" and "dry_run" are optional'}),
+            status_code=400,
+            headers=headers
+        )
+
+    if end_date < start_date or any(not math.isfinite(hours) or hours <= 0 for hours in handling_hours.values()):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: end_date is before start_date or a handling time is not a positive number'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        with db.pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                problem = auto_allocation.load_problem(cursor, start_date, end_date, cohorts, handling_hours)
+                assignment, summary = auto_allocation.plan(problem)
+                summary['dry_run'] = dry_run
+
+                if not dry_run:
+                    applied = auto_allocation.apply(cursor, problem, assignment)
+                    summary['applied'] = len(applied)
+                    if applied:
+                        # Let the main screen view refresher know these screens changed
+                        main_screen_views.mark_dirty(cursor, 'post-auto-allocation')
+                        # Tell subscribed screens to refetch once this commits
+                        case_events.publish(cursor, 'post-auto-allocation', applied, ['fr', 'assigned'])
+
+        return func.HttpResponse(
+            body=instrumentation.dumps(summary),
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
@@ -1,12 +1,82 @@
 import azure.functions as func
 import logging
+import base64
 import json
-import psycopg2
-import os
+from azure.core.exceptions import ResourceNotFoundError
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import blob_storage, db, idempotency, instrumentation
 
+# Records a document uploaded straight to storage with a get-blob-sas URL. Size and
+# checksum come from the blob itself, and the unique blob_name index makes a retried
+# confirmation return the existing row rather than insert a second one.
+CONFIRM_UPLOAD = """INSERT INTO mtl.UPLOADED_FILES (case_id, file_name, file_description, upload_user, blob_name, size_bytes, content_md5, confirmed_ts)
+                     VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                     ON CONFLICT (blob_name) WHERE blob_name IS NOT NULL DO NOTHING
+                     RETURNING blob_name, size_bytes, content_md5"""
+
+
+def confirm_upload(request_body, headers):
+    case_id = request_body['case_id']
+    blob_name = request_body['blob_name']
+    if not blob_storage.is_case_document(case_id, blob_name):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: blob_name does not belong to case_id'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        properties = blob_storage.blob_properties(blob_name)
+    except ResourceNotFoundError:
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Upload not found'}),
+            status_code=404,
+            headers=headers
+        )
+
+    stored_md5 = properties.content_settings.content_md5
+    if not stored_md5:
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Upload has no Content-MD5; set x-ms-blob-content-md5 when uploading'}),
+            status_code=409,
+            headers=headers
+        )
+    content_md5 = base64.b64encode(bytes(stored_md5)).decode()
+
+    if request_body.get('content_md5') and request_body['content_md5'] != content_md5:
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Checksum mismatch', 'content_md5': content_md5}),
+            status_code=409,
+            headers=headers
+        )
+
+    file_name = request_body.get('file_name') or blob_name.rsplit('/', 1)[-1]
+    with db.connect() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(CONFIRM_UPLOAD, (
+                case_id, file_name, request_body['file_description'], request_body['user_name'],
+                blob_name, properties.size, content_md5
+            ))
+            document = cursor.fetchone()
+            if document is None:
+                cursor.execute("SELECT blob_name, size_bytes, content_md5 FROM mtl.UPLOADED_FILES WHERE blob_name = %s", (blob_name,))
+                document = cursor.fetchone()
+                if document['content_md5'] != content_md5:
+                    return func.HttpResponse(
+                        body=json.dumps({'message': 'Blob was already confirmed with a different checksum'}),
+                        status_code=409,
+                        headers=headers
+                    )
+
+    return func.HttpResponse(
+        body=json.dumps(dict(document)),
+        status_code=200,
+        headers=headers
+    )
+
+
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database post-fr-bulk-allocation function processed a request.')
 
@@ -14,7 +84,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -22,7 +92,10 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         request_body = req.get_json()
 
         # Ensure we have all necessary fields in the request body
-        required_fields = ['case_id', 'file_name', 'file_description', 'user_name']
+        if 'blob_name' in request_body:
+            required_fields = ['case_id', 'blob_name', 'file_description', 'user_name']
+        else:
+            required_fields = ['case_id', 'file_name', 'file_description', 'user_name']
         if not all(field in request_body for field in required_fields):
             return func.HttpResponse(
                 body=json.dumps({'message': 'Bad Request: Missing required fields'}),
@@ -37,17 +110,9 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             headers=headers
         )
     
-    # Retrieve the secret containing the database credentials
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
+    # Retrieve the database credentials
     try:
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
+        db.get_db_settings()
     except Exception as e:
         return func.HttpResponse(
             body=json.dumps({'error': f'Error retrieving secrets: {str(e)}'}),
@@ -55,11 +120,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             headers=headers
         )
 
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        if 'blob_name' in request_body:
+            return confirm_upload(request_body, headers)
+
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 # Directly extract values from the single request_body dictionary
                 sql_statement = """INSERT INTO mtl.UPLOADED_FILES (case_id, file_name, file_description, upload_user) 
@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import case_events, db, idempotency, instrumentation, main_screen_views
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database post-fr-bulk-allocation function processed a request.')
 
@@ -21,16 +20,6 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     try:
         # Parse the JSON body from the request
         request_body = req.get_json()
-        if request_body:
-            common_email = request_body[0]['email']
-        else:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json'},
-                'body': json.dumps({
-                    'message': 'Bad Request: No cases provided.'
-                })
-            }
     except ValueError as e:
         return func.HttpResponse(
             body=json.dumps({'message': 'Bad Request: Missing or invalid JSON body payload'}),
@@ -38,29 +27,35 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             headers={'Content-Type': 'application/json'}
         )
 
-    # Retrieve the secret containing the database credentials
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
+    if not isinstance(request_body, list) or not request_body:
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: No cases provided.'}),
+            status_code=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    if not all(isinstance(case, dict) and case.get('case_id') for case in request_body):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: Every case needs a case_id.'}),
+            status_code=400,
+            headers={'Content-Type': 'application/json'}
+        )
+    common_email = request_body[0].get('email')
 
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                sql_values = ", ".join(f"('{case['case_id']}', '{common_email}', false)" for case in request_body)
-                sql_statement = f"INSERT INTO mtl.BULK_CASE_RELEASE (case_id, caserelease_by, case_released) VALUES {sql_values};"
+                # Stream the released cases in with COPY; one statement and transaction whatever the batch size
+                rows = ((case['case_id'], common_email, False) for case in request_body)
+                db.copy_rows(cursor, 'mtl.BULK_CASE_RELEASE', ('case_id', 'caserelease_by', 'case_released'), rows)
 
-                cursor.execute(sql_statement)
+                # Let the main screen view refresher know these screens changed
+                main_screen_views.mark_dirty(cursor, 'post-case-release')
+                # Tell subscribed screens to refetch once this commits
+                case_events.publish(cursor, 'post-case-release', [case['case_id'] for case in request_body], ['release'])
+        conn.close()
 
         return func.HttpResponse(
-            body=json.dumps({"message": "Update executed successfully."}),
+            body=json.dumps({"message": "Update executed successfully.", "cases": len(request_body)}),
             status_code=200,
             headers={'Content-Type': 'application/json'}
         )
@@ -1,13 +1,12 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from shared_code import contact_writes, db, idempotency, instrumentation, row_versions, table_columns
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database insert function processed a request.')
 
@@ -15,7 +14,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -31,24 +30,6 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        # Retrieve the secret containing the database credentials
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-        logging.info('Key Vault client initialized.')
-
-        # Retrieve database credentials from Azure Key Vault
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-        logging.info('Database credentials retrieved from Key Vault.')
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-        logging.info('Database connection string constructed.')
-
         # Get Query Type
         try:
             query_type = req.params.get('query-type')
@@ -88,6 +69,18 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         ACTUAL_CONTACT_TIME = dt.isoformat() + "Z"
         contact_tracker_sk = int(address_data.get('contact_tracker_sk'))
         update_user = address_data.get('update_user')
+
+        # The row_version of the contact tracker row the user loaded; the save is rejected if it has been saved since
+        try:
+            row_version = row_versions.parse_sk(address_data.pop('row_version', None))
+        except (TypeError, ValueError):
+            return func.HttpResponse(
+                body=json.dumps({'message': 'Bad Request: row_version must be an integer'}),
+                status_code=400,
+                headers=headers
+            )
+        if row_version is None and row_versions.versions_required():
+            return row_versions.missing_version_response('row_version', headers)
         
         address_data.pop('contact_tracker_sk', None)
         address_data.pop('contact_type', None)
@@ -101,81 +94,49 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         address_data.pop('payment_type', None)
         address_data.pop('customer_info_confirmed', None)
 
-        columns = list(address_data.keys())
-        values = [None if v == "" else v for v in address_data.values()]
-
-        with psycopg2.connect(conn_string) as conn:
+        address = {col: (None if value == "" else value) for col, value in address_data.items()}
+        deceased_address = None
+        if deceased_address_data:
+            deceased_address = {col: (None if value == "" else value) for col, value in deceased_address_data.items()}
+
+        params = {
+            'case_id': CASE_ID, 'contact_tracker_sk': contact_tracker_sk, 'row_version': row_version, 'outcome': OUTCOME,
+            'contact_actual_ts': ACTUAL_CONTACT_TIME, 'tl_rejection_reason': TL_REJECTION_REASON,
+            'sc_approval_required': sc_approval_required, 'audit_log': audit_log, 'update_user': update_user,
+            'recalc_reason': recalc_reason, 'payment_type': payment_type, 'customer_info_confirmed': customer_info_confirmed,
+        }
+        reject = audit_log == "Approval Contact Screen - Outcome: " + "Reject"
+
+        # Pooled so the prepared statement for this set of address fields is reused; the whole
+        # approval is one statement, so it commits on its own in a single round trip
+        with db.pooled_connection(autocommit=True) as conn:
+            statement, params = contact_writes.contact_approval(conn, params, reject, address, deceased_address)
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 logging.info('Database connection established.')
 
                 logging.info(query_type)
 
-                if audit_log == "Approval Contact Screen - Outcome: " + "Reject":
-                    # Insert TL approval audit log into the contact tracker 
-                    contact_tracker_insert = """
-                    INSERT INTO mtl.contact_tracker (case_id, outcome, contact_type, contact_channel, contact_actual_ts, start_ts, end_ts, tl_rejection_reason, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed)
-                    VALUES(%s, %s, 'TL Approval', 'MTL Tool', %s, NOW(), NOW(), %s, %s, %s, 'No' %s, %s, %s);
-                    """
-                    cursor.execute(contact_tracker_insert, (CASE_ID, OUTCOME, ACTUAL_CONTACT_TIME, TL_REJECTION_REASON, update_user, audit_log, recalc_reason, payment_type, customer_info_confirmed))
-                    logging.info('Contact tracker updated.')
-
-                    # Update the contact tracker
-                    contact_tracker_update = """
-                    UPDATE mtl.contact_tracker
-                    SET sc_approval_required = NULL, tl_rejection_reason = %s
-                    WHERE case_id = %s AND contact_tracker_sk = %s AND end_ts = '9999-12-31 00:00:00';
-                    """
-                    cursor.execute(contact_tracker_update, (TL_REJECTION_REASON, CASE_ID, contact_tracker_sk))
-
-                else:
-                    # Update the contact tracker
-                    contact_tracker_update = """
-                    UPDATE mtl.contact_tracker
-                    SET outcome = %s, sc_approval_required = %s
-                    WHERE case_id = %s AND contact_tracker_sk = %s AND end_ts = '9999-12-31 00:00:00';
-                    """
-                    cursor.execute(contact_tracker_update, (OUTCOME, f"Approved by: {update_user}",CASE_ID, contact_tracker_sk))
-                    logging.info('Contact tracker updated.')    
-
-                    # Insert TL approval audit log into the contact tracker 
-                    contact_tracker_insert = """
-                    INSERT INTO mtl.contact_tracker (case_id, outcome, contact_type, contact_channel, contact_actual_ts, start_ts, end_ts, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed)
-                    VALUES(%s, %s, 'TL Approval', 'MTL Tool', %s, NOW(), NOW(), %s, %s, %s, %s, %s, %s);
-                    """
-                    cursor.execute(contact_tracker_insert, (CASE_ID, OUTCOME, ACTUAL_CONTACT_TIME, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed))
-                    logging.info('Contact tracker updated.')
-
-                    # Update the existing address record
-                    update_existing = f"UPDATE mtl.address SET end_ts = CURRENT_TIMESTAMP WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00'"
-                    cursor.execute(update_existing, (CASE_ID,))
-                    logging.info('Existing address record updated.')
-
-                    # Insert the new address record
-                    insert_new_address = f"INSERT INTO mtl.address ({', '.join(columns)}, start_ts, end_ts) VALUES ({', '.join(['%s'] * len(columns))}, CURRENT_TIMESTAMP, '9999-12-31 00:00:00')"
-                    cursor.execute(insert_new_address, values)
-                    logging.info('New address record inserted.')
-
-                    if deceased_address_data:
-                        deceased_columns = list(deceased_address_data.keys())
-                        deceased_values = [None if v == "" else v for v in deceased_address_data.values()]
-
-                        # Update the existing deceased address record
-                        update_existing_deceased = f"UPDATE mtl.deceased_address SET end_ts = CURRENT_TIMESTAMP WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00'"
-                        cursor.execute(update_existing_deceased, (CASE_ID,))
-                        logging.info('Existing deceased address record updated.')
-
-                        # Insert the new deceased address record
-                        insert_new_deceased_address = f"INSERT INTO mtl.deceased_address ({', '.join(deceased_columns)}, start_ts, end_ts) VALUES ({', '.join(['%s'] * len(deceased_columns))}, CURRENT_TIMESTAMP, '9999-12-31 00:00:00')"
-                        cursor.execute(insert_new_deceased_address, deceased_values)
-                        logging.info('New deceased address record inserted.')
+                # Only saves against the contact tracker row and row_version the user loaded; 409 if it has moved on or is being saved
+                saved = contact_writes.run(cursor, statement, params)
+                logging.info('Contact tracker updated.')
 
         # Return a success response
         return func.HttpResponse(
-            body=json.dumps({"message": "Update executed for all cases."}),
+            body=json.dumps({"message": "Update executed for all cases.", **saved}),
             status_code=200,
             headers=headers
         )
 
+    except row_versions.VersionConflict as conflict:
+        return row_versions.conflict_response(conflict, headers)
+
+    except table_columns.InvalidColumns as invalid:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {invalid}'}),
+            status_code=400,
+            headers=headers
+        )
+
     except Exception as e:
         logging.error(f"Error: {str(e)}")
         logging.error("Exception type: %s", type(e).__name__)
@@ -1,13 +1,12 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
 from datetime import datetime
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from shared_code import contact_writes, db, idempotency, instrumentation, row_versions, table_columns
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database insert function processed a request.')
 
@@ -15,7 +14,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -31,24 +30,6 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        # Retrieve the secret containing the database credentials
-        credential = DefaultAzureCredential()
-        key_vault_url = os.getenv('key_vault_name')
-        secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-        logging.info('Key Vault client initialized.')
-
-        # Retrieve database credentials from Azure Key Vault
-        db_host = secret_client.get_secret('db-host').value
-        db_port = secret_client.get_secret('db-port').value
-        db_name = secret_client.get_secret('db-name').value
-        db_user = secret_client.get_secret('db-username').value
-        db_password = secret_client.get_secret('db-password').value
-        logging.info('Database credentials retrieved from Key Vault.')
-
-        # Construct the connection string with the retrieved credentials
-        conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-        logging.info('Database connection string constructed.')
-
         # Get Query Type
         try:
             query_type = req.params.get('query-type')
@@ -93,6 +74,18 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         ACTUAL_CONTACT_TIME = dt.isoformat() + "Z"
         contact_tracker_sk = int(address_data.get('contact_tracker_sk'))
         update_user = address_data.get('update_user')
+
+        # The row_version of the contact tracker row the user loaded; the save is rejected if it has been saved since
+        try:
+            row_version = row_versions.parse_sk(address_data.pop('row_version', None))
+        except (TypeError, ValueError):
+            return func.HttpResponse(
+                body=json.dumps({'message': 'Bad Request: row_version must be an integer'}),
+                status_code=400,
+                headers=headers
+            )
+        if row_version is None and row_versions.versions_required():
+            return row_versions.missing_version_response('row_version', headers)
         
         address_data.pop('contact_tracker_sk', None)
         address_data.pop('contact_type', None)
@@ -110,97 +103,51 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         address_data.pop('payment_type', None)
         address_data.pop('customer_info_confirmed', None)
 
-        if sc_approval_required == "Yes":
-            #exclude_columns = ['title', 'forename', 'middle_name', 'surname']
-            exclude_columns = []
-
-            columns = [col for col in address_data.keys() if col not in exclude_columns]
-            values = [address_data[col] if address_data.get(col) != "" else None for col in columns]
-
-            if deceased_address_data:
-                deceased_columns = [col for col in deceased_address_data.keys() if col not in exclude_columns]
-                deceased_values = [deceased_address_data[col] if deceased_address_data.get(col) != "" else None for col in deceased_columns]
-        else:
-            columns = list(address_data.keys())
-            values = [address_data[col] if address_data.get(col) != "" else None for col in columns]
-
-            if deceased_address_data:
-                deceased_columns = list(deceased_address_data.keys())
-                deceased_values = [deceased_address_data[col] if deceased_address_data.get(col) != "" else None for col in deceased_columns]
-
-
-        with psycopg2.connect(conn_string) as conn:
+        # Unknown address fields are rejected with a 400 when the statement is built
+        address = {col: (None if value == "" else value) for col, value in address_data.items()}
+        deceased_address = None
+        if deceased_address_data:
+            deceased_address = {col: (None if value == "" else value) for col, value in deceased_address_data.items()}
+
+        params = {
+            'case_id': CASE_ID, 'contact_tracker_sk': contact_tracker_sk, 'row_version': row_version, 'outcome': OUTCOME,
+            'contact_type': CONTACT_TYPE, 'call_summary': CALL_SUMMARY, 'contact_actual_ts': ACTUAL_CONTACT_TIME,
+            'proposed_title': PROPOSED_TITLE, 'proposed_forename': PROPOSED_FORENAME,
+            'proposed_middle_name': PROPOSED_MIDDLE_NAME, 'proposed_surname': PROPOSED_SURNAME,
+            'sc_approval_required': sc_approval_required, 'audit_log': audit_log, 'update_user': update_user,
+            'recalc_reason': recalc_reason, 'payment_type': payment_type, 'customer_info_confirmed': customer_info_confirmed,
+        }
+
+        # Pooled so the prepared statement for this set of address fields is reused; the whole
+        # save is one statement, so it commits on its own in a single round trip
+        with db.pooled_connection(autocommit=True) as conn:
+            statement, params = contact_writes.contact_update(conn, params, query_type, address, deceased_address)
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 logging.info('Database connection established.')
 
                 logging.info(query_type)
 
-                if sc_approval_required == "Yes":
-                    # Update the contact tracker
-                    contact_tracker_update = """
-                    UPDATE mtl.contact_tracker
-                    SET proposed_title_change = %s, proposed_forename_change = %s, proposed_middle_name_change = %s, proposed_surname_change = %s, tl_rejection_reason = NULL, recalc_reason = %s, payment_type = %s, customer_info_confirmed = %s
-                    WHERE case_id = %s AND contact_tracker_sk = %s AND end_ts = '9999-12-31 00:00:00';
-                    """
-                    cursor.execute(contact_tracker_update, (PROPOSED_TITLE, PROPOSED_FORENAME, PROPOSED_MIDDLE_NAME, PROPOSED_SURNAME, recalc_reason, payment_type, customer_info_confirmed, CASE_ID, contact_tracker_sk))
-                    logging.info('Contact tracker updated.')
-
-                if query_type == "outbound_call":
-                    # Update the contact tracker
-                    contact_tracker_update = """
-                    UPDATE mtl.contact_tracker
-                    SET contact_actual_ts = %s::timestamp, outcome = %s, contact_type = %s, call_summary = %s, update_user = %s, sc_approval_required = %s, audit_log = %s, recalc_reason = %s, payment_type = %s, customer_info_confirmed = %s
-                    WHERE case_id = %s AND contact_tracker_sk = %s AND end_ts = '9999-12-31 00:00:00';
-                    """
-                    cursor.execute(contact_tracker_update, (ACTUAL_CONTACT_TIME, OUTCOME, CONTACT_TYPE, CALL_SUMMARY, update_user, sc_approval_required, audit_log, recalc_reason, payment_type, customer_info_confirmed, CASE_ID, contact_tracker_sk))
-                    logging.info('Contact tracker updated.')
-
-                elif query_type == "inbound_call":
-                    # Update the contact tracker
-                    contact_tracker_update = """
-                    UPDATE mtl.contact_tracker
-                    SET outcome = %s, contact_type = %s, update_user = %s, call_summary = %s, sc_approval_required = %s, audit_log = %s, recalc_reason = %s, payment_type = %s, customer_info_confirmed = %s
-                    WHERE case_id = %s AND contact_tracker_sk = %s AND end_ts = '9999-12-31 00:00:00';
-                    """
-                    cursor.execute(contact_tracker_update, (OUTCOME, CONTACT_TYPE, update_user, CALL_SUMMARY, sc_approval_required, audit_log, recalc_reason, payment_type, customer_info_confirmed, CASE_ID, contact_tracker_sk))
-                    logging.info('Contact tracker updated.')    
-
-                    # Insert inbound call into the contact tracker 
-                    contact_tracker_insert = """
-                    INSERT INTO mtl.contact_tracker (case_id, outcome, contact_type, contact_channel, call_summary, contact_actual_ts, start_ts, end_ts, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed)
-                    VALUES(%s, %s, 'Inbound Call', 'Call', %s, %s, NOW(), NOW(), %s, %s, %s, %s, %s, %s);
-                    """
-                    cursor.execute(contact_tracker_insert, (CASE_ID, OUTCOME, CALL_SUMMARY, ACTUAL_CONTACT_TIME, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed))
-                    logging.info('Contact tracker updated.')
-
-                # Update the existing address record
-                update_existing = """UPDATE mtl.address SET end_ts = CURRENT_TIMESTAMP WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00'"""
-                cursor.execute(update_existing, (CASE_ID,))
-                logging.info('Existing address record updated.')
-
-                # Insert the new address record
-                insert_new_address = f"INSERT INTO mtl.address ({', '.join(columns)}, start_ts, end_ts) VALUES ({', '.join(['%s'] * len(columns))}, CURRENT_TIMESTAMP, '9999-12-31 00:00:00')"
-                cursor.execute(insert_new_address, values)
-                logging.info('New address record inserted.')
-
-                if deceased_address_data:
-                    # Update the existing deceased address record
-                    update_existing_deceased = f"UPDATE mtl.deceased_address SET end_ts = CURRENT_TIMESTAMP WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00'"
-                    cursor.execute(update_existing_deceased, (CASE_ID,))
-                    logging.info('Existing deceased address record updated.')
-
-                    # Insert the new deceased address record
-                    insert_new_deceased_address = f"INSERT INTO mtl.deceased_address ({', '.join(deceased_columns)}, start_ts, end_ts) VALUES ({', '.join(['%s'] * len(deceased_columns))}, CURRENT_TIMESTAMP, '9999-12-31 00:00:00')"
-                    cursor.execute(insert_new_deceased_address, deceased_values)
-                    logging.info('New deceased address record inserted.')
+                # Only saves against the contact tracker row and row_version the user loaded; 409 if it has moved on or is being saved
+                saved = contact_writes.run(cursor, statement, params)
+                logging.info('Contact tracker and address records saved.')
 
         # Return a success response
         return func.HttpResponse(
-            body=json.dumps({"message": "Update executed for all cases."}),
+            body=json.dumps({"message": "Update executed for all cases.", **saved}),
             status_code=200,
             headers=headers
         )
 
+    except row_versions.VersionConflict as conflict:
+        return row_versions.conflict_response(conflict, headers)
+
+    except table_columns.InvalidColumns as invalid:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {invalid}'}),
+            status_code=400,
+            headers=headers
+        )
+
     except Exception as e:
         logging.error(f"Error: {str(e)}")
         logging.error("Exception type: %s", type(e).__name__)
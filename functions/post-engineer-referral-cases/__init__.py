@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, idempotency, inbox, instrumentation, main_screen_views
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database post-fr-bulk-allocation function processed a request.')
 
@@ -14,7 +13,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -35,31 +34,14 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         }
     
    
-    # Retrieve the secret containing the database credentials
-    # For Azure, you would use Azure Key Vault to store and retrieve secrets
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-    # For this example, we'll use environment variables
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                         if ENGINEER_APPROVAL == 'accepted':
                             for update_case in request_body['case_id']:
                                 sql_statement_accepted = f"UPDATE mtl.CASE_ALLOCATION SET casestatuser = 'NEW', casestatusqc = NULL, assignedtoer = %s, assignedtoername = %s, engineer_referral = 'Accepted' WHERE case_id = %s"
                                 cursor.execute(sql_statement_accepted, (ENGINEER_EMAIL, ENGINEER_NAME, update_case)) 
+                                inbox.sync(cursor, [update_case])
                                 conn.commit()
 
                             
@@ -128,6 +110,11 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                                     (%s, 'Review', 'Case Review In Progress', CURRENT_TIMESTAMP, '9999-12-31 00:00:00', 'function: engineer-referral-rejected', %s)
                                 """
                                 cursor.execute(sql_insert_tracker, (CASE_ID, UPDATE_USER))
+
+                            inbox.sync(cursor, [CASE_ID])
+
+                        # Let the main screen view refresher know these screens changed
+                        main_screen_views.mark_dirty(cursor, 'post-engineer-referral-cases')
    
         # Return a success response
         return func.HttpResponse(
@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import case_events, db, idempotency, inbox, instrumentation, main_screen_views
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database post-fr-bulk-allocation function processed a request.')
 
@@ -14,7 +13,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -47,6 +46,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             AND POPULATION_COHORT = '{cohort}' 
             AND END_TS = '9999-12-31 00:00:00' 
             LIMIT {amount})
+        RETURNING CASE_ID
         """
         
     elif allocation_type == "allocated":
@@ -66,30 +66,20 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             AND END_TS = '9999-12-31 00:00:00' 
             AND POPULATION_COHORT = '{cohort}' 
             LIMIT {amount})
+        RETURNING CASE_ID
         """
 
-    # Retrieve the secret containing the database credentials
-    # For Azure, you would use Azure Key Vault to store and retrieve secrets
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-    # For this example, we'll use environment variables
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(sql_statement)
+                case_ids = [row['case_id'] for row in cursor.fetchall()]
+                inbox.sync(cursor, case_ids)
+
+                # Let the main screen view refresher know these screens changed
+                main_screen_views.mark_dirty(cursor, 'post-fr-bulk-allocation')
+                # Tell subscribed screens to refetch once this commits
+                case_events.publish(cursor, 'post-fr-bulk-allocation', case_ids, ['fr', 'assigned'])
 
    
         # Return a success response
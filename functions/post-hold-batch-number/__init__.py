@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import db, idempotency, instrumentation, main_screen_views
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database insert function processed a request.')
 
@@ -14,7 +13,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
     
     try:
@@ -30,26 +29,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             })
         }
 
-        # Retrieve the secret containing the database credentials
-    # For Azure, you would use Azure Key Vault to store and retrieve secrets
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-    # For this example, we'll use environment variables
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 for update_case in request_body:
                     on_hold_reason = update_case['on_hold_reason']
@@ -57,6 +38,9 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                     # Construct the SQL statement using parameters from the request body
                     sql_statement = f"UPDATE mtl.CASE_ALLOCATION SET ON_HOLD_REASON = %s, ON_HOLD_TS = CURRENT_TIMESTAMP WHERE case_id = %s"
                     cursor.execute(sql_statement, (on_hold_reason, case_id,))
+
+                # Let the main screen view refresher know these screens changed
+                main_screen_views.mark_dirty(cursor, 'post-hold-batch-number')
           
 
 
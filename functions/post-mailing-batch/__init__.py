@@ -0,0 +1,70 @@
+import azure.functions as func
+import logging
+import json
+from shared_code import case_events, db, idempotency, instrumentation, mailing_batches, main_screen_views
+
+@instrumentation.instrumented
+@idempotency.idempotent
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database post-mailing-batch function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+    }
+
+    try:
+        # Parse the JSON body from the request
+        request_body = req.get_json()
+        email = request_body['email']
+        size = int(request_body['batch_size'])
+        cohorts = request_body.get('cohorts') or None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: JSON body needs "email" and "batch_size"'}),
+            status_code=400,
+            headers=headers
+        )
+
+    if size <= 0:
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: batch_size must be positive'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        with db.pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                batch_number, case_ids = mailing_batches.create_batch(cursor, email, size, cohorts)
+                if batch_number is not None:
+                    # Let the main screen view refresher know these screens changed
+                    main_screen_views.mark_dirty(cursor, 'post-mailing-batch')
+                    # Tell subscribed screens to refetch once this commits
+                    case_events.publish(cursor, 'post-mailing-batch', case_ids, ['mailing'], [batch_number])
+
+        if batch_number is None:
+            return func.HttpResponse(
+                body=json.dumps({'message': 'No released cases are waiting for a mailing batch', 'mailing_batch_number': None}),
+                status_code=404,
+                headers=headers
+            )
+
+        return func.HttpResponse(
+            body=instrumentation.dumps({'mailing_batch_number': batch_number, 'cases': len(case_ids), 'case_ids': case_ids}),
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
@@ -0,0 +1,87 @@
+import azure.functions as func
+import logging
+import json
+from psycopg2.extras import RealDictCursor
+from datetime import date, datetime
+from shared_code import case_events, case_sections, db, idempotency, instrumentation, main_screen_views, work_queue
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+        return super().default(obj)
+
+
+@instrumentation.instrumented
+@idempotency.idempotent
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database next case function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+    }
+
+    try:
+        # Parse the JSON body from the request
+        request_body = req.get_json()
+        role = request_body['role']
+        email = request_body['email'].lower()
+        name = request_body['name']
+        cohort = request_body.get('cohort')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: JSON body needs "role", "email" and "name"'}),
+            status_code=400,
+            headers=headers
+        )
+
+    if role not in work_queue.QUEUES:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: role must be one of {", ".join(work_queue.QUEUES)}'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        # Claim and commit first, so the row lock is released before the bundle is read
+        with db.pooled_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                case_id = work_queue.claim_next(cursor, role, email, name, cohort)
+                if case_id is not None:
+                    # Let the main screen view refresher know these screens changed
+                    main_screen_views.mark_dirty(cursor, 'post-next-case')
+                    # Tell subscribed screens to refetch once this commits
+                    case_events.publish(cursor, 'post-next-case', [case_id], [role, 'assigned'])
+
+        if case_id is None:
+            return func.HttpResponse(
+                body=json.dumps({'message': f'No {role} cases are waiting', 'case_id': None}),
+                status_code=404,
+                headers=headers
+            )
+
+        with db.pooled_connection(autocommit=True) as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                bundle = case_sections.fetch_bundle(cursor, case_id)
+
+        # Return the claimed case with its case screen sections
+        return func.HttpResponse(
+            body=instrumentation.dumps({'case_id': case_id, 'role': role, **bundle}, cls=CustomJSONEncoder),
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
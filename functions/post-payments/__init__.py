@@ -1,74 +1,113 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
 import os
-from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from psycopg2.extras import RealDictCursor, execute_values
+from shared_code import db, idempotency, instrumentation
 
+# Applies a whole payment run in one statement. Only rows whose flag actually changes are
+# touched, so a retried batch leaves completion dates alone and reports those cases as
+# unchanged. The status comes back in the order the cases were sent.
+COMPLETE_PAYMENTS = """
+    WITH input (position, case_id, completed) AS (VALUES %s),
+    updated AS (
+        UPDATE mtl.master_payment mp
+        SET payment_completed_by_analyst = input.completed,
+            payment_completed_by_analyst_date = CASE WHEN input.completed THEN CURRENT_DATE END
+        FROM input
+        WHERE mp.case_id = input.case_id
+          AND mp.payment_completed_by_analyst IS DISTINCT FROM input.completed
+        RETURNING mp.case_id
+    )
+    SELECT input.case_id, input.completed,
+           CASE WHEN EXISTS (SELECT 1 FROM updated WHERE updated.case_id = input.case_id) THEN 'updated'
+                WHEN EXISTS (SELECT 1 FROM mtl.master_payment mp WHERE mp.case_id = input.case_id) THEN 'unchanged'
+                ELSE 'not_found' END AS status
+    FROM input
+    ORDER BY input.position
+"""
+
+
+def max_batch_size():
+    return int(os.getenv('payment_batch_max', '1000'))
+
+
+def parse_payments(request_body):
+    # Accepts {"payments": [{"case_id": ..., "completed": true}, ...]} or the original single {"case_id": ...}
+    if isinstance(request_body, dict) and 'payments' in request_body:
+        items = request_body['payments']
+    else:
+        items = [request_body]
+    if not isinstance(items, list) or not items:
+        raise ValueError('payments must be a non-empty list')
+    if len(items) > max_batch_size():
+        raise ValueError(f'At most {max_batch_size()} payments per request')
+
+    # One entry per case; if a case is sent twice the last flag wins
+    payments = {}
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('case_id'), str) or not item['case_id']:
+            raise ValueError('Every payment needs a case_id')
+        completed = item.get('completed', True)
+        if not isinstance(completed, bool):
+            raise ValueError(f'completed must be true or false for {item["case_id"]}')
+        payments.pop(item['case_id'], None)
+        payments[item['case_id']] = completed
+    return [(position, case_id, completed) for position, (case_id, completed) in enumerate(payments.items())]
+
+
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database insert function processed a request.')
 
     headers = {
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
-        'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
-    
+
     try:
         # Parse the JSON body from the request
         request_body = req.get_json()
+    except ValueError:
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: Missing or invalid JSON body payload'}),
+            status_code=400,
+            headers=headers
+        )
 
-    except KeyError:
-        return {
-            'statusCode': 400,
-            'headers': headers,
-            'body': json.dumps({
-                'message': 'Bad Request: Missing JSON body payload'
-            })
-        }
-    
-    # Extract parameters from the request body
-    completed = True
-
-    case_id = request_body.get('case_id')
-
-        # Retrieve the secret containing the database credentials
-    # For Azure, you would use Azure Key Vault to store and retrieve secrets
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-    # For this example, we'll use environment variables
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
+    try:
+        payments = parse_payments(request_body)
+    except ValueError as e:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {str(e)}'}),
+            status_code=400,
+            headers=headers
+        )
 
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                # Construct the SQL statement using parameters from the request body
-                sql = f"UPDATE mtl.master_payment SET payment_completed_by_analyst = %s, payment_completed_by_analyst_date = CURRENT_DATE WHERE case_id = %s"
-                cursor.execute(sql, (completed, case_id))
-
+                results = execute_values(
+                    cursor, COMPLETE_PAYMENTS, payments,
+                    template='(%s, %s, %s::boolean)', page_size=len(payments), fetch=True
+                )
+        conn.close()
 
+        updated = sum(1 for result in results if result['status'] == 'updated')
 
         # Return a success response
         return func.HttpResponse(
-            body=json.dumps({"message": "Update executed for {case_id}."}),
+            body=instrumentation.dumps({
+                'message': f'Update executed for {len(results)} case(s), {updated} changed.',
+                'results': results
+            }),
             status_code=200,
-            headers={'Content-Type': 'application/json'}   
+            headers=headers
         )
-        
+
     except Exception as e:
         logging.error(f"Error: {str(e)}")
         logging.error("Exception type: %s", type(e).__name__)
@@ -77,5 +116,5 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(
             body=json.dumps({"error": str(e)}),
             status_code=500,
-            headers={'Content-Type': 'application/json'}      
+            headers=headers
         )
@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import case_events, db, idempotency, inbox, instrumentation, main_screen_views
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database insert function processed a request.')
 
@@ -14,7 +13,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -34,27 +33,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     RESET_TYPE = request_body['reset_type']
     EMAIL = request_body['userEmail']
 
-    # Retrieve the secret containing the database credentials
-    # For Azure, you would use Azure Key Vault to store and retrieve secrets
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-    # For this example, we'll use environment variables
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        with db.connect() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
 
                 # Construct the SQL statement using parameters from the request body
@@ -111,10 +91,12 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 cursor.execute(sql_logging_statement, (CASE_ID, EMAIL, REASON,))
                 if RESET_TYPE == 'fr' or RESET_TYPE == 'qc' or RESET_TYPE == 'qa' or RESET_TYPE == 'descope':
                     cursor.execute(sql_tracker_update, (CASE_ID,))
-                    cursor.execute(sql_tracker_insert, (CASE_ID, EMAIL,))    
-                        if RESET_TYPE == 'descope':
-                            cursor.execute(sql_descope_reason_update, (CASE_ID,))
-                            cursor.execute(sql_descope_reason_insert, (CASE_ID, EMAIL, REASON))
+                    cursor.execute(sql_tracker_insert, (CASE_ID, EMAIL,))
+                    if RESET_TYPE == 'descope':
+                        cursor.execute(sql_descope_reason_update, (CASE_ID,))
+                        cursor.execute(sql_descope_reason_insert, (CASE_ID, EMAIL, REASON))
+                    # Returned or descoped cases leave the inboxes of the roles that were cleared
+                    inbox.sync(cursor, [CASE_ID])
                 elif RESET_TYPE == 'reset':
                     cursor.execute(sql_tracker_update, (CASE_ID,))
                     cursor.execute(sql_tracker_insert, (EMAIL, CASE_ID,))
@@ -123,9 +105,14 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                 elif RESET_TYPE == 'unconstrain':
                     cursor.execute(sql_constraint_update, (CASE_ID,))
 
+                # Let the main screen view refresher know these screens changed
+                main_screen_views.mark_dirty(cursor, 'post-reset-case')
+                # Tell subscribed screens to refetch once this commits
+                case_events.publish(cursor, 'post-reset-case', [CASE_ID], case_events.SCREENS)
+
         # Return a success response
         return func.HttpResponse(
-            body=json.dumps({"Update executed for all cases."}),
+            body=json.dumps({"message": "Update executed for all cases."}),
             status_code=200,
             headers=headers   
         )
@@ -0,0 +1,85 @@
+import azure.functions as func
+import logging
+import json
+import secrets
+from shared_code import case_events, db, idempotency, instrumentation, main_screen_views, sampling
+
+@instrumentation.instrumented
+@idempotency.idempotent
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Database post-sample-cases function processed a request.')
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
+    }
+
+    try:
+        # Parse the JSON body from the request
+        request_body = req.get_json()
+        role = request_body['role']
+        email = request_body['email']
+        rate = float(request_body['rate'])
+        checkers = [{'email': str(checker['email']), 'name': str(checker['name'])} for checker in request_body['checkers']]
+        # Without a seed a new one is drawn and returned, so the sample can be drawn again
+        seed = request_body.get('seed')
+        seed = secrets.randbelow(2 ** 31) if seed is None else seed
+        cohort_rates = {str(cohort): float(value) for cohort, value in (request_body.get('cohort_rates') or {}).items()}
+        analyst_rates = {str(analyst): float(value) for analyst, value in (request_body.get('analyst_rates') or {}).items()}
+        minimum = int(request_body.get('minimum', 1))
+        cohorts = request_body.get('cohorts') or None
+        criteria = request_body.get('case_selection_criteria')
+        dry_run = request_body.get('dry_run', False) is True
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: JSON body needs "role", "email", "rate" and "checkers" '
+                                        '([{"email", "name"}])'}),
+            status_code=400,
+            headers=headers
+        )
+
+    rates = [rate, *cohort_rates.values(), *analyst_rates.values()]
+    if role not in sampling.SAMPLINGS or not checkers or minimum < 0 or any(not 0 <= value <= 1 for value in rates):
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: role must be one of {", ".join(sampling.SAMPLINGS)}, '
+                                        'rates between 0 and 1 and at least one checker given'}),
+            status_code=400,
+            headers=headers
+        )
+
+    try:
+        with db.pooled_connection() as conn:
+            with conn.cursor() as cursor:
+                sample, strata = sampling.draw(
+                    cursor, role, checkers, seed, email, rate, cohort_rates=cohort_rates, checked_by_rates=analyst_rates,
+                    minimum=minimum, cohorts=cohorts, criteria=criteria
+                )
+                if dry_run:
+                    # The same sample again with the same seed, but nothing is allocated
+                    conn.rollback()
+                elif sample:
+                    # Let the main screen view refresher know these screens changed
+                    main_screen_views.mark_dirty(cursor, 'post-sample-cases')
+                    # Tell subscribed screens to refetch once this commits
+                    case_events.publish(cursor, 'post-sample-cases', [case['case_id'] for case in sample], [role, 'assigned'])
+
+        # Only the sample is returned; the population stays in the database
+        return func.HttpResponse(
+            body=instrumentation.dumps({'role': role, 'seed': seed, 'dry_run': dry_run, 'sampled': len(sample),
+                                        'strata': strata, 'cases': sample}),
+            status_code=200,
+            headers=headers
+        )
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
+        return func.HttpResponse(
+            body=json.dumps({"error": str(e)}),
+            status_code=500,
+            headers=headers
+        )
@@ -0,0 +1,42 @@
+import azure.functions as func
+import logging
+from contextlib import closing
+from psycopg2.extras import RealDictCursor
+from shared_code import db, instrumentation, main_screen_views
+
+# Runs every 30 seconds. Each materialized main-screen view is refreshed when writes
+# have gone quiet for mv_debounce_seconds (or have been pending for mv_max_wait_seconds),
+# and unconditionally once it is older than mv_max_age_seconds.
+@instrumentation.instrumented
+def main(mytimer: func.TimerRequest) -> None:
+    logging.info('Materialized view refresh function triggered.')
+
+    if mytimer.past_due:
+        logging.info('The refresh timer is past due.')
+
+    try:
+        with closing(db.connect()) as conn:
+            conn.autocommit = True
+            results = main_screen_views.refresh_due_views(conn)
+
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                for row in main_screen_views.staleness_metrics(cursor):
+                    # Structured fields so staleness can be charted per view in Application Insights
+                    logging.info(
+                        'Materialized view staleness',
+                        extra={'custom_dimensions': {
+                            'materialized_view': row['materialized_view'],
+                            'staleness_seconds': float(row['staleness_seconds']) if row['staleness_seconds'] is not None else None,
+                            'pending_writes': row['pending_writes'],
+                            'last_refresh_ms': row['last_refresh_ms'],
+                        }}
+                    )
+
+        refreshed = [result['view'] for result in results if result.get('refreshed')]
+        logging.info('Refreshed views: %s', ', '.join(refreshed) or 'none')
+
+    except Exception as e:
+        logging.error(f"Error: {str(e)}")
+        logging.error("Exception type: %s", type(e).__name__)
+        logging.error("Exception message: %s", str(e))
+        logging.error("Stack trace:", exc_info=True)
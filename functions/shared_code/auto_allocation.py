@@ -0,0 +1,203 @@
+import math
+import os
+import time
+import numpy as np
+from shared_code import inbox, instrumentation
+
+# Capacity-aware FR allocation for post-auto-allocation. The unallocated backlog is taken
+# oldest first until it fills the hours the reviewers have free over the period (their
+# file_reviewer_availability hours less the expected hours of the cases they already
+# hold). Every reviewer then gets the same share of each cohort, in proportion to their
+# free hours, so the team fills up evenly and nobody is given more than they have time
+# for. Hours the shares leave unused are then filled, oldest case first, until no reviewer
+# has room for any case still waiting. The solve is plain NumPy over arrays of cases and
+# reviewers; the result is applied with one UPDATE.
+
+CURRENT = "'9999-12-31 00:00:00'"
+
+UNALLOCATED_CASES = f"""
+SELECT case_id, population_cohort FROM mtl.CASE_ALLOCATION
+WHERE end_ts = {CURRENT} AND casestatusanalyst = 'NEW' AND COALESCE(assignedtoanalyst, '') = ''
+{{cohort_filter}}
+ORDER BY start_ts, case_id
+"""
+
+REVIEWER_HOURS = """
+SELECT lower(a.reviewer_id) AS email, COALESCE(max(ua.user_name), max(a.reviewer_id)) AS name, sum(a.available_hours) AS hours
+FROM mtl.file_reviewer_availability a
+LEFT JOIN mtl.USER_ACCESS ua ON lower(ua.user_email) = lower(a.reviewer_id)
+WHERE a.date BETWEEN %(start_date)s AND %(end_date)s
+GROUP BY lower(a.reviewer_id)
+HAVING sum(a.available_hours) > 0
+ORDER BY 1
+"""
+
+OPEN_WORKLOAD = f"""
+SELECT lower(assignedtoanalyst), population_cohort, count(*)
+FROM mtl.CASE_ALLOCATION
+WHERE end_ts = {CURRENT} AND casestatusanalyst IN ('NEW', 'IN_PROGRESS') AND lower(assignedtoanalyst) = ANY(%s)
+GROUP BY 1, 2
+"""
+
+HANDLING_HOURS = "SELECT population_cohort, expected_hours FROM mtl.COHORT_HANDLING_TIME"
+
+# Only cases that are still unallocated are taken, so a concurrent manual allocation wins
+APPLY = f"""
+UPDATE mtl.CASE_ALLOCATION ca SET assignedtoanalyst = v.email, assignedtoanalystname = v.name
+FROM unnest(%s::text[], %s::text[], %s::text[]) AS v (case_id, email, name)
+WHERE ca.case_id = v.case_id AND ca.end_ts = {CURRENT}
+AND ca.casestatusanalyst = 'NEW' AND COALESCE(ca.assignedtoanalyst, '') = ''
+RETURNING ca.case_id
+"""
+
+
+def default_case_hours():
+    return float(os.getenv('allocation_default_case_hours', '2'))
+
+
+def solve(case_cohorts, cohort_hours, capacity):
+    # case_cohorts: cohort index of each case, oldest first. cohort_hours: expected hours per
+    # cohort index. capacity: free hours per reviewer. Returns the reviewer index for each
+    # case, -1 where it does not fit.
+    case_cohorts = np.asarray(case_cohorts, dtype=np.int64)
+    cohort_hours = np.asarray(cohort_hours, dtype=np.float64)
+    capacity = np.clip(np.asarray(capacity, dtype=np.float64), 0, None)
+    assignment = np.full(len(case_cohorts), -1, dtype=np.int64)
+    total = capacity.sum()
+    if len(case_cohorts) == 0 or total <= 0:
+        return assignment
+
+    # The oldest cases that fit in the team's free hours, counted per cohort
+    selected = np.cumsum(cohort_hours[case_cohorts]) <= total + 1e-9
+    demand = np.bincount(case_cohorts[selected], minlength=len(cohort_hours))
+
+    # Each reviewer's share of every cohort; rounding down can never exceed their hours
+    quota = demand[:, None] * (capacity / total)[None, :]
+    counts = np.floor(quota).astype(np.int64)
+    slack = capacity - cohort_hours @ counts
+
+    # At most one leftover case per cohort and reviewer, by largest remainder, where it still fits
+    remainder = quota - counts
+    for cohort in np.argsort(-cohort_hours, kind='stable'):
+        left = demand[cohort] - counts[cohort].sum()
+        if left <= 0:
+            continue
+        order = np.argsort(-remainder[cohort], kind='stable')
+        takers = order[slack[order] >= cohort_hours[cohort] - 1e-9][:left]
+        counts[cohort, takers] += 1
+        slack[takers] -= cohort_hours[cohort]
+
+    # Then fill what is left, a case per cohort and reviewer a round with the freest reviewers
+    # first, until no reviewer has room for any case still waiting
+    waiting = np.bincount(case_cohorts, minlength=len(cohort_hours)) - counts.sum(axis=1)
+    placed = True
+    while placed:
+        placed = False
+        for cohort in np.argsort(-cohort_hours, kind='stable'):
+            if waiting[cohort] <= 0:
+                continue
+            order = np.argsort(-slack, kind='stable')
+            takers = order[slack[order] >= cohort_hours[cohort] - 1e-9][:waiting[cohort]]
+            if len(takers) == 0:
+                continue
+            counts[cohort, takers] += 1
+            slack[takers] -= cohort_hours[cohort]
+            waiting[cohort] -= len(takers)
+            placed = True
+
+    for cohort, reviewer_counts in enumerate(counts):
+        allocated = reviewer_counts.sum()
+        if allocated == 0:
+            continue
+        # The oldest cases of the cohort; the share above took them from the front as well
+        cases = np.flatnonzero(case_cohorts == cohort)[:allocated]
+        # Spread each reviewer's cases over the age range instead of handing out blocks
+        reviewers = np.repeat(np.arange(len(capacity)), reviewer_counts)
+        slot = np.arange(allocated) - np.repeat(np.cumsum(reviewer_counts) - reviewer_counts, reviewer_counts)
+        position = (slot + 0.5) / np.repeat(reviewer_counts, reviewer_counts)
+        assignment[cases] = reviewers[np.argsort(position, kind='stable')]
+    return assignment
+
+
+def load_problem(cursor, start_date, end_date, cohorts=None, handling_hours=None):
+    # Cases, reviewers and hours as arrays, ready for solve()
+    cohort_filter = "AND population_cohort = ANY(%(cohorts)s)" if cohorts else ""
+    cursor.execute(UNALLOCATED_CASES.format(cohort_filter=cohort_filter), {'cohorts': cohorts})
+    case_rows = cursor.fetchall()
+    case_ids = [row[0] for row in case_rows]
+    cohort_names, case_cohorts = np.unique(np.array([row[1] or '' for row in case_rows], dtype=object), return_inverse=True)
+    cohort_names = [str(name) for name in cohort_names]
+
+    cursor.execute(HANDLING_HOURS)
+    # A NaN or non-positive configured time would break the solve; those cohorts use the default
+    hours_by_cohort = {cohort: float(hours) for cohort, hours in cursor.fetchall()
+                       if hours is not None and math.isfinite(hours) and hours > 0}
+    hours_by_cohort.update({cohort: float(hours) for cohort, hours in (handling_hours or {}).items()})
+
+    cursor.execute(REVIEWER_HOURS, {'start_date': start_date, 'end_date': end_date})
+    reviewers = [{'email': email, 'name': name, 'available_hours': float(hours)} for email, name, hours in cursor.fetchall()]
+
+    # Cases the reviewers already hold use up part of their hours
+    held_hours = dict.fromkeys((reviewer['email'] for reviewer in reviewers), 0.0)
+    cursor.execute(OPEN_WORKLOAD, (list(held_hours),))
+    for email, cohort, cases in cursor.fetchall():
+        held_hours[email] += cases * hours_by_cohort.get(cohort, default_case_hours())
+    for reviewer in reviewers:
+        reviewer['held_hours'] = held_hours[reviewer['email']]
+
+    return {
+        'case_ids': case_ids,
+        'case_cohorts': case_cohorts.astype(np.int64),
+        'cohorts': cohort_names,
+        'cohort_hours': np.array([hours_by_cohort.get(cohort, default_case_hours()) for cohort in cohort_names]),
+        'reviewers': reviewers,
+        'capacity': np.array([reviewer['available_hours'] - reviewer['held_hours'] for reviewer in reviewers]),
+    }
+
+
+def plan(problem):
+    # Solves the problem and summarises the result per reviewer and per cohort
+    started = time.perf_counter()
+    with instrumentation.phase('solve'):
+        assignment = solve(problem['case_cohorts'], problem['cohort_hours'], problem['capacity'])
+    solve_ms = (time.perf_counter() - started) * 1000
+
+    allocated = assignment >= 0
+    reviewer_count = len(problem['reviewers'])
+    cases_per_reviewer = np.bincount(assignment[allocated], minlength=reviewer_count)
+    hours_per_reviewer = np.bincount(
+        assignment[allocated], weights=problem['cohort_hours'][problem['case_cohorts'][allocated]], minlength=reviewer_count
+    )
+    backlog = np.bincount(problem['case_cohorts'], minlength=len(problem['cohorts']))
+    allocated_per_cohort = np.bincount(problem['case_cohorts'][allocated], minlength=len(problem['cohorts']))
+
+    summary = {
+        'cases': len(problem['case_ids']),
+        'allocated': int(allocated.sum()),
+        'solve_ms': round(solve_ms, 1),
+        'reviewers': [
+            {**reviewer, 'free_hours': round(float(free), 2), 'allocated_cases': int(cases), 'allocated_hours': round(float(hours), 2)}
+            for reviewer, free, cases, hours in zip(problem['reviewers'], problem['capacity'], cases_per_reviewer, hours_per_reviewer)
+        ],
+        'cohorts': [
+            {'population_cohort': cohort, 'expected_hours': float(hours), 'backlog': int(waiting), 'allocated': int(taken)}
+            for cohort, hours, waiting, taken in zip(problem['cohorts'], problem['cohort_hours'], backlog, allocated_per_cohort)
+        ],
+    }
+    return assignment, summary
+
+
+def apply(cursor, problem, assignment):
+    # Writes the allocation in one statement and returns the case ids that were still free
+    allocated = np.flatnonzero(assignment >= 0)
+    if len(allocated) == 0:
+        return []
+    reviewers = problem['reviewers']
+    cursor.execute(APPLY, (
+        [problem['case_ids'][i] for i in allocated],
+        [reviewers[assignment[i]]['email'] for i in allocated],
+        [reviewers[assignment[i]]['name'] for i in allocated],
+    ))
+    applied = [row[0] for row in cursor.fetchall()]
+    inbox.sync(cursor, applied)
+    return applied
@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from azure.storage.blob import BlobBlock, BlobSasPermissions, BlobServiceClient, ContentSettings, generate_blob_sas
+from shared_code import db, instrumentation
+
+# Cached per worker process; the connection string comes from Key Vault unless
+# blob_connection_string is set (e.g. 'UseDevelopmentStorage=true' for Azurite)
+_blob_service_client = None
+
+CASE_DOCUMENTS_CONTAINER = os.getenv('case_documents_container', 'case-documents')
+
+_UNSAFE_FILE_NAME_CHARS = re.compile(r'[^A-Za-z0-9._ -]')
+
+
+def get_connection_string():
+    return os.getenv('blob_connection_string') or db.get_secret_client().get_secret('DataConnectionString').value
+
+
+def get_blob_service_client():
+    global _blob_service_client
+    if _blob_service_client is None:
+        _blob_service_client = BlobServiceClient.from_connection_string(get_connection_string())
+    return _blob_service_client
+
+
+def set_blob_service_client(client):
+    # Lets local benchmarks swap in a fake or emulator-backed client
+    global _blob_service_client
+    _blob_service_client = client
+
+
+def safe_file_name(file_name):
+    # Keep the original name readable in the portal but never let it change the blob path
+    name = _UNSAFE_FILE_NAME_CHARS.sub('_', os.path.basename(file_name or '')).strip(' .')
+    if not name:
+        raise ValueError('file_name is required')
+    return name[:200]
+
+
+def new_case_document_name(case_id, file_name):
+    # case_id/<uuid>/<file name>: unique per upload and scoped to the case
+    return f'{case_id}/{uuid.uuid4().hex}/{safe_file_name(file_name)}'
+
+
+def is_case_document(case_id, blob_name):
+    return bool(case_id) and blob_name.startswith(f'{case_id}/') and '..' not in blob_name
+
+
+def sas_url(container, blob_name, permission, minutes, **sas_options):
+    service = get_blob_service_client()
+    expires_on = datetime.now(timezone.utc) + timedelta(minutes=minutes)
+    token = generate_blob_sas(
+        account_name=service.account_name,
+        container_name=container,
+        blob_name=blob_name,
+        account_key=service.credential.account_key,
+        permission=permission,
+        # Allow for clock skew between storage and the browser
+        start=datetime.now(timezone.utc) - timedelta(minutes=5),
+        expiry=expires_on,
+        protocol='https' if service.url.startswith('https') else 'https,http',
+        **sas_options
+    )
+    blob_url = service.get_blob_client(container=container, blob=blob_name).url
+    return f'{blob_url}?{token}', expires_on
+
+
+def upload_sas_url(blob_name, container=CASE_DOCUMENTS_CONTAINER):
+    # Create/write only: the holder can upload this one blob but cannot read or list anything
+    minutes = float(os.getenv('sas_upload_minutes', '15'))
+    return sas_url(container, blob_name, BlobSasPermissions(create=True, write=True), minutes)
+
+
+def download_sas_url(blob_name, file_name, container=CASE_DOCUMENTS_CONTAINER):
+    minutes = float(os.getenv('sas_download_minutes', '5'))
+    return sas_url(
+        container, blob_name, BlobSasPermissions(read=True), minutes,
+        content_disposition=f'attachment; filename="{safe_file_name(file_name)}"'
+    )
+
+
+def blob_properties(blob_name, container=CASE_DOCUMENTS_CONTAINER):
+    return get_blob_service_client().get_blob_client(container=container, blob=blob_name).get_blob_properties()
+
+
+def delete_blob(container, blob_name):
+    get_blob_service_client().get_blob_client(container=container, blob=blob_name).delete_blob()
+
+
+def iter_chunks(source, chunk_size):
+    # Accepts a file-like object or any iterable of bytes and yields chunk_size pieces
+    if hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        pending = bytearray()
+        for piece in source:
+            pending.extend(piece)
+            while len(pending) >= chunk_size:
+                yield bytes(pending[:chunk_size])
+                del pending[:chunk_size]
+        if pending:
+            yield bytes(pending)
+
+
+def upload_stream(container, blob_name, source, content_type=None, block_size_mb=None, max_concurrency=None):
+    # Stages blocks in parallel while reading the source, so at most max_concurrency blocks
+    # are held in memory. Each Put Block carries its own MD5 (validate_content) and the
+    # whole-object MD5 is set on commit, so storage rejects corrupted blocks and readers can
+    # verify the result.
+    block_size = int(float(block_size_mb or os.getenv('blob_block_size_mb', '8')) * 1024 * 1024)
+    max_concurrency = int(max_concurrency or os.getenv('blob_max_concurrency', '4'))
+    blob_client = get_blob_service_client().get_blob_client(container=container, blob=blob_name)
+
+    digest = hashlib.md5()
+    blocks = []
+    total_bytes = 0
+    started = time.perf_counter()
+    with instrumentation.phase('blob_upload'), ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        in_flight = set()
+        for index, chunk in enumerate(iter_chunks(source, block_size)):
+            digest.update(chunk)
+            total_bytes += len(chunk)
+            # Block ids must be the same length for every block in a blob
+            block_id = base64.b64encode(f'{index:08d}'.encode()).decode()
+            blocks.append(BlobBlock(block_id=block_id))
+            if len(in_flight) >= max_concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(blob_client.stage_block, block_id, chunk, validate_content=True))
+        for future in in_flight:
+            future.result()
+
+        content_md5 = digest.digest()
+        blob_client.commit_block_list(
+            blocks,
+            content_settings=ContentSettings(content_type=content_type, content_md5=bytearray(content_md5))
+        )
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'container': container,
+        'blob_name': blob_name,
+        'bytes': total_bytes,
+        'blocks': len(blocks),
+        'block_size_mb': block_size / (1024 * 1024),
+        'max_concurrency': max_concurrency,
+        'seconds': round(elapsed, 3),
+        'mb_per_sec': round(total_bytes / (1024 * 1024) / elapsed, 2) if elapsed else None,
+        'content_md5': base64.b64encode(content_md5).decode(),
+    }
+    logging.info('blob_transfer %s', json.dumps(result), extra={'custom_dimensions': result})
+    return result
+
+
+def verify_blob(container, blob_name, expected_md5, max_concurrency=None):
+    # Downloads and re-hashes the blob; for checks and benchmarks rather than the request path
+    max_concurrency = int(max_concurrency or os.getenv('blob_max_concurrency', '4'))
+    blob_client = get_blob_service_client().get_blob_client(container=container, blob=blob_name)
+    digest = hashlib.md5()
+    started = time.perf_counter()
+    downloader = blob_client.download_blob(max_concurrency=max_concurrency)
+    for chunk in downloader.chunks():
+        digest.update(chunk)
+    elapsed = time.perf_counter() - started
+    actual_md5 = base64.b64encode(digest.digest()).decode()
+    return {
+        'matches': actual_md5 == expected_md5,
+        'content_md5': actual_md5,
+        'bytes': downloader.size,
+        'seconds': round(elapsed, 3),
+        'mb_per_sec': round(downloader.size / (1024 * 1024) / elapsed, 2) if elapsed else None,
+    }
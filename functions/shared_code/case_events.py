@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import deque, namedtuple
+import psycopg2
+from shared_code import db
+
+# Case change events for get-case-events. Write paths publish() a compact event in their
+# own transaction; Postgres delivers NOTIFY only on commit, so rolled back writes send
+# nothing. Each worker process keeps one LISTEN connection (Listener) and a short buffer of
+# recent events, and long-poll requests wait on that buffer rather than on the database.
+# Waiting is async: the listener thread wakes each waiting request's event loop, so a
+# waiting client holds no worker thread.
+#
+# Events carry seq, the id of the writing transaction. A sync token is the snapshot a
+# response was built in, as pg_current_snapshot() prints it (xmin:xmax:xip). The client
+# gets the buffered events of exactly the transactions that snapshot could not see: seq at
+# or above xmax, or listed in xip as still running. A long transaction holds xmin back but
+# not xmax, so events already delivered do not match the next token again. Events can
+# repeat; clients only use them as a cue to refetch. A worker can only answer for tokens
+# whose unseen transactions were all still to commit when its LISTEN took effect, and
+# none of whose events it has dropped from its buffer; other tokens get resync instead.
+
+CHANNEL = 'mtl_case_events'
+
+# Screens an event can be addressed to; clients subscribe to one or more
+SCREENS = ('fr', 'qc', 'qa', 'ctc', 'release', 'mailing', 'assigned')
+
+# Case ids beyond this are only counted, keeping the payload well under NOTIFY's 8000 bytes
+MAX_EVENT_CASES = 50
+
+PUBLISH = """
+SELECT pg_notify(%(channel)s, json_build_object(
+    'seq', pg_current_xact_id()::text::bigint, 'source', %(source)s, 'screens', %(screens)s::text[],
+    'batches', %(batches)s::text[], 'cases', %(cases)s::text[], 'count', %(count)s
+)::text)
+"""
+
+CURRENT_TOKEN = "SELECT pg_current_snapshot()::text AS token"
+
+Snapshot = namedtuple('Snapshot', 'xmin xmax xip')
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def buffer_size():
+    return int(os.getenv('case_events_buffer_size', '10000'))
+
+
+def max_wait_seconds():
+    return float(os.getenv('case_events_max_wait_seconds', '25'))
+
+
+def publish(cursor, source, case_ids, screens, batches=()):
+    # Runs in the caller's transaction and is sent when it commits
+    case_ids = [str(case_id) for case_id in case_ids]
+    cursor.execute(PUBLISH, {
+        'channel': CHANNEL,
+        'source': source,
+        'screens': list(screens),
+        'batches': [str(batch) for batch in batches if batch],
+        'cases': case_ids[:MAX_EVENT_CASES],
+        'count': len(case_ids),
+    })
+
+
+def current_token(cursor):
+    cursor.execute(CURRENT_TOKEN)
+    row = cursor.fetchone()
+    return row['token'] if isinstance(row, dict) else row[0]
+
+
+def parse_token(token):
+    # The Snapshot the token was taken in
+    try:
+        xmin, xmax, xip = token.split(':')
+        snapshot = Snapshot(int(xmin), int(xmax), frozenset(int(xid) for xid in xip.split(',') if xid))
+    except (AttributeError, ValueError):
+        raise InvalidToken(f'Not a sync token: {token!r}')
+    if not 0 <= snapshot.xmin <= snapshot.xmax or any(not snapshot.xmin <= xid < snapshot.xmax for xid in snapshot.xip):
+        raise InvalidToken(f'Not a sync token: {token!r}')
+    return snapshot
+
+
+def sees(snapshot, seq):
+    # Whether transaction seq had committed when the snapshot was taken
+    return seq < snapshot.xmax and seq not in snapshot.xip
+
+
+def matches(event, screens, batches):
+    return bool(set(event['screens']) & screens or set(event['batches']) & batches)
+
+
+class Listener:
+    def __init__(self):
+        self.events = deque()
+        # Snapshot taken just after LISTEN; None while disconnected
+        self.listen_snapshot = None
+        # Highest seq dropped from the buffer, the seqs of the most recent buffer_size()
+        # drops, and the highest seq forgotten from those in turn
+        self.dropped_seq = -1
+        self.dropped = {}
+        self.forgotten_seq = -1
+        self.lock = threading.Lock()
+        # (event loop, asyncio.Event) of every request waiting for a change
+        self.waiters = set()
+        self.thread = threading.Thread(target=self.run, name='case-events-listener', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        # Reconnects after any failure; events sent while disconnected are lost, so the
+        # buffer is cleared and clients with older tokens are told to resync
+        while True:
+            try:
+                conn = psycopg2.connect(db.get_conn_string() + " application_name='mtl:case-events-listener'")
+                conn.autocommit = True
+                try:
+                    self.listen(conn)
+                finally:
+                    conn.close()
+            except Exception as e:
+                logging.warning('Case event listener disconnected: %s', str(e))
+            with self.lock:
+                self.listen_snapshot = None
+                self.dropped_seq = -1
+                self.dropped.clear()
+                self.forgotten_seq = -1
+                self.events.clear()
+                self.wake()
+            time.sleep(5)
+
+    def listen(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+            # Every transaction not yet visible now will notify this connection
+            listen_snapshot = parse_token(current_token(cursor))
+            with self.lock:
+                self.listen_snapshot = listen_snapshot
+                self.wake()
+        # Notifies that arrived during those statements are already read off the socket
+        self.drain(conn)
+        while True:
+            if select.select([conn], [], [], 60) == ([], [], []):
+                # Idle; a trivial round trip notices a dropped connection
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            else:
+                conn.poll()
+            # select() only wakes for new data, so whatever execute() queued is taken now
+            self.drain(conn)
+
+    def drain(self, conn):
+        received = []
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            try:
+                received.append(json.loads(notify.payload))
+            except ValueError:
+                logging.warning('Ignoring malformed case event: %s', notify.payload[:200])
+        if received:
+            self.add(received)
+
+    def wake(self):
+        # Called with the lock held, from the listener thread
+        for loop, woken in self.waiters:
+            loop.call_soon_threadsafe(woken.set)
+
+    def add(self, received):
+        with self.lock:
+            self.events.extend(received)
+            while len(self.events) > buffer_size():
+                # Whatever is dropped can no longer be replayed
+                seq = self.events.popleft()['seq']
+                self.dropped_seq = max(self.dropped_seq, seq)
+                self.dropped[seq] = True
+            while len(self.dropped) > buffer_size():
+                seq = next(iter(self.dropped))
+                del self.dropped[seq]
+                self.forgotten_seq = max(self.forgotten_seq, seq)
+            self.wake()
+
+    def covers(self, snapshot):
+        # Whether every event the snapshot could not see is, or will be, in the buffer
+        if self.listen_snapshot is None or snapshot.xmax < self.listen_snapshot.xmax:
+            return False
+        if any(sees(self.listen_snapshot, xid) for xid in snapshot.xip):
+            return False
+        # Events arrive in commit order, not seq order, so the running transactions are
+        # checked one by one; those older than what is remembered count as dropped
+        return (self.dropped_seq < snapshot.xmax
+                and not any(xid in self.dropped or xid <= self.forgotten_seq for xid in snapshot.xip))
+
+    async def wait(self, token, screens, batches, timeout):
+        # Returns (events, resync) once matching events are buffered or the timeout passes
+        snapshot = parse_token(token)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            woken = asyncio.Event()
+            with self.lock:
+                if self.listen_snapshot is not None:
+                    if not self.covers(snapshot):
+                        return [], True
+                    found = [event for event in self.events
+                             if not sees(snapshot, event['seq']) and matches(event, screens, batches)]
+                    if found:
+                        return found, False
+                self.waiters.add((loop, woken))
+            try:
+                await asyncio.wait_for(woken.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                return [], False
+            finally:
+                with self.lock:
+                    self.waiters.discard((loop, woken))
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    # One per worker process, started by the first request that waits for events
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = Listener()
+    return _listener
+
@@ -0,0 +1,65 @@
+from functools import lru_cache
+
+CASE_OVERVIEW_SELECT = "SELECT CASE_ID, CLAIM_REFERENCE, COHORT, STATE, SUB_STATE, LAST_UPDATED_TS, ASSIGNEDTONAME FROM mtl.CASE_OVERVIEW_VW"
+
+# Supported filters in canonical order: (query parameter, column, operator).
+# Filters are always emitted in this order, so every request with the same set of
+# filters produces the same SQL text and reuses the same prepared statement.
+CASE_OVERVIEW_FILTERS = (
+    ('case_id', 'case_id', '='),
+    ('case_cohort', 'cohort', '='),
+    ('state', 'state', '='),
+    ('sub_state', 'sub_state', '='),
+    ('email', 'assignedto', '='),
+    ('claim_reference', 'claim_reference', '='),
+    ('claim_reference_prefix', 'claim_reference', 'LIKE'),
+)
+
+MAX_FILTER_LENGTH = 320
+
+
+class InvalidFilterError(ValueError):
+    pass
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+@lru_cache(maxsize=None)
+def statement_for_shape(shape):
+    # shape is a tuple of the query parameter names in use, in canonical order
+    conditions = []
+    for position, name in enumerate(shape, start=1):
+        column, operator = next((col, op) for param, col, op in CASE_OVERVIEW_FILTERS if param == name)
+        if operator == 'LIKE':
+            conditions.append(f"{column} LIKE ${position} ESCAPE '\\'")
+        else:
+            conditions.append(f"{column} {operator} ${position}")
+
+    if not conditions:
+        return CASE_OVERVIEW_SELECT
+    return f"{CASE_OVERVIEW_SELECT} WHERE {' AND '.join(conditions)}"
+
+
+def build_case_overview_query(params):
+    # Returns (sql, args) with every value bound; raises InvalidFilterError for bad input
+    if 'claim_reference' in params and 'claim_reference_prefix' in params:
+        raise InvalidFilterError('Use either claim_reference or claim_reference_prefix, not both')
+
+    shape = []
+    args = []
+    for name, column, operator in CASE_OVERVIEW_FILTERS:
+        if name not in params:
+            continue
+        value = params.get(name)
+        if value is None or len(value) > MAX_FILTER_LENGTH:
+            raise InvalidFilterError(f'Invalid value for filter "{name}"')
+        if operator == 'LIKE':
+            if not value:
+                raise InvalidFilterError('claim_reference_prefix must not be empty')
+            value = escape_like(value) + '%'
+        shape.append(name)
+        args.append(value)
+
+    return statement_for_shape(tuple(shape)), args
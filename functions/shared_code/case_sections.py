@@ -0,0 +1,16 @@
+# Sections of the case screen, as asyncpg statements ($1 is the case id). get-case-details
+# serves them singly or as a "bundle"; post-next-case returns the bundle for a claimed case.
+CASE_SECTIONS = {
+    "details": "SELECT * FROM mtl.CASE_DETAILS_VW WHERE CASE_ID = $1",
+    "history": "SELECT * FROM mtl.CASE_TRACKER WHERE CASE_ID = $1 ORDER BY end_ts",
+    "contact": "SELECT * FROM mtl.CONTACT_TRACKER WHERE CASE_ID = $1",
+}
+
+
+def fetch_bundle(cursor, case_id):
+    # Every section over a psycopg2 cursor, which takes %s placeholders
+    bundle = {}
+    for section, sql_statement in CASE_SECTIONS.items():
+        cursor.execute(sql_statement.replace('$1', '%s'), (case_id,))
+        bundle[section] = cursor.fetchall()
+    return bundle
@@ -0,0 +1,64 @@
+import os
+
+# Delta sync for the list screens (get-changes). A sync token is the xmin of the snapshot
+# the previous feed was read in: every transaction that was not yet visible then has an id
+# at or above it, so the rows it wrote carry change_seq >= token (sql/tables/change_feed.sql).
+# A feed can repeat rows the client already has, never miss one; clients upsert by key.
+# A sync that has fallen too far behind gets TooManyChanges and reloads the screen instead.
+
+FEEDS = {
+    'case_allocation': 'mtl.CASE_ALLOCATION',
+    'case_tracker': 'mtl.CASE_TRACKER',
+}
+
+# All reads of one feed see the same snapshot, the one the new token is taken from
+BEGIN = "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+
+CURRENT_TOKEN = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint AS token"
+
+CHANGED_ROWS = "SELECT * FROM {table} WHERE change_seq >= %s ORDER BY change_seq LIMIT %s"
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class TooManyChanges(Exception):
+    pass
+
+
+def max_rows():
+    return int(os.getenv('change_feed_max_rows', '5000'))
+
+
+def parse_token(token):
+    try:
+        value = int(token)
+    except (TypeError, ValueError):
+        raise InvalidToken(f'Not a sync token: {token!r}')
+    if value < 0:
+        raise InvalidToken(f'Not a sync token: {token!r}')
+    return value
+
+
+def current_token(cursor):
+    cursor.execute(CURRENT_TOKEN)
+    row = cursor.fetchone()
+    return str(row['token'] if isinstance(row, dict) else row[0])
+
+
+def changes(cursor, token, feeds=FEEDS):
+    # Returns (new token, {feed: rows}) for the rows written since token. Must be the first
+    # thing run in its transaction, so the token matches the snapshot the rows came from.
+    since = parse_token(token)
+    limit = max_rows()
+    cursor.execute(BEGIN)
+    new_token = current_token(cursor)
+
+    rows = {}
+    for feed in feeds:
+        cursor.execute(CHANGED_ROWS.format(table=FEEDS[feed]), (since, limit + 1))
+        rows[feed] = cursor.fetchall()
+        if len(rows[feed]) > limit:
+            raise TooManyChanges(f'More than {limit} {feed} rows changed since the sync token')
+    return new_token, rows
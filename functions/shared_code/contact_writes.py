@@ -0,0 +1,186 @@
+from psycopg2 import errors
+from shared_code import db, row_versions, table_columns
+
+# post-contact-updates and post-contact-approval each write the contact tracker, the
+# address and the deceased address. Every workflow is built as one data-modifying CTE, so
+# the whole save is a single statement: one round trip, atomic on an autocommit
+# connection, with no separate COMMIT. Every step is chained off the locked contact
+# tracker row, so if that row is no longer current, has been saved since the client
+# loaded its row_version, or another save holds it, nothing is written. The row is
+# updated in place, so every save moves its row_version on by one. Address columns are checked against the table and put in table order, so
+# each workflow and set of fields is one prepared statement per connection.
+
+CURRENT = "'9999-12-31 00:00:00'"
+
+LOCKED = f"""locked AS (
+    SELECT contact_tracker_sk FROM mtl.contact_tracker
+    WHERE contact_tracker_sk = %(contact_tracker_sk)s AND case_id = %(case_id)s AND end_ts = {CURRENT}
+    AND (%(row_version)s::integer IS NULL OR row_version = %(row_version)s::integer)
+    FOR UPDATE NOWAIT
+)"""
+
+CURRENT_VERSION = f"""
+SELECT contact_tracker_sk, row_version FROM mtl.contact_tracker
+WHERE case_id = %(case_id)s AND end_ts = {CURRENT}
+ORDER BY contact_tracker_sk DESC LIMIT 1
+"""
+
+# Tables whose current row is replaced by a new version on every save: (table, key column, CTE prefix)
+ADDRESS = ('address', 'address_sk', 'address')
+DECEASED_ADDRESS = ('deceased_address', 'deceased_address_sk', 'deceased_address')
+
+
+def _if(flag, value, column):
+    # Sets column to value only when the workflow flag is on; a row can only be updated once per statement
+    return f"{column} = CASE WHEN %({flag})s THEN {value} ELSE {column} END"
+
+
+def _replace_current(conn, table_spec, row, params):
+    table, key_column, prefix = table_spec
+    columns, values = table_columns.canonical(conn, table, row)
+    placeholders = []
+    for position, (column, value) in enumerate(zip(columns, values)):
+        params[f'{prefix}_{position}'] = value
+        # INSERT ... SELECT does not type its parameters from the target columns
+        placeholders.append(f'%({prefix}_{position})s::{table_columns.column_type(conn, table, column)}')
+    return [
+        f"""{prefix}_closed AS (
+    UPDATE mtl.{table} SET end_ts = CURRENT_TIMESTAMP
+    WHERE case_id = %(case_id)s AND end_ts = {CURRENT} AND EXISTS (SELECT 1 FROM locked)
+)""",
+        f"""{prefix}_new AS (
+    INSERT INTO mtl.{table} ({', '.join(columns)}, start_ts, end_ts)
+    SELECT {', '.join(placeholders)}, CURRENT_TIMESTAMP, {CURRENT} FROM locked
+    RETURNING {key_column}
+)""",
+    ]
+
+
+def _statement(ctes, outputs):
+    selects = ['(SELECT contact_tracker_sk FROM locked) AS contact_tracker_sk']
+    selects += [f'(SELECT {column} FROM {cte}) AS {alias}' for cte, column, alias in outputs]
+    return 'WITH ' + ',\n'.join([LOCKED] + ctes) + '\nSELECT ' + ', '.join(selects)
+
+
+def _addresses(conn, ctes, outputs, params, address, deceased_address):
+    ctes += _replace_current(conn, ADDRESS, address, params)
+    outputs.append(('address_new', 'address_sk', 'address_sk'))
+    if deceased_address:
+        ctes += _replace_current(conn, DECEASED_ADDRESS, deceased_address, params)
+        outputs.append(('deceased_address_new', 'deceased_address_sk', 'deceased_address_sk'))
+
+
+def contact_update(conn, params, query_type, address, deceased_address=None):
+    # params: case_id, contact_tracker_sk, row_version (None skips the version check),
+    # sc_approval_required and the call fields. address and
+    # deceased_address are {column: value}. Returns (sql, params) for post-contact-updates;
+    # raises table_columns.InvalidColumns for unknown address fields.
+    params = dict(params, proposed=params['sc_approval_required'] == 'Yes',
+                  outbound=query_type == 'outbound_call', inbound=query_type == 'inbound_call')
+    params['call'] = params['outbound'] or params['inbound']
+
+    tracker_sets = [
+        _if('proposed', '%(proposed_title)s', 'proposed_title_change'),
+        _if('proposed', '%(proposed_forename)s', 'proposed_forename_change'),
+        _if('proposed', '%(proposed_middle_name)s', 'proposed_middle_name_change'),
+        _if('proposed', '%(proposed_surname)s', 'proposed_surname_change'),
+        _if('proposed', 'NULL', 'tl_rejection_reason'),
+        "recalc_reason = CASE WHEN %(proposed)s OR %(call)s THEN %(recalc_reason)s ELSE recalc_reason END",
+        "payment_type = CASE WHEN %(proposed)s OR %(call)s THEN %(payment_type)s ELSE payment_type END",
+        "customer_info_confirmed = CASE WHEN %(proposed)s OR %(call)s THEN %(customer_info_confirmed)s ELSE customer_info_confirmed END",
+        _if('outbound', '%(contact_actual_ts)s::timestamp', 'contact_actual_ts'),
+        _if('call', '%(outcome)s', 'outcome'),
+        _if('call', '%(contact_type)s', 'contact_type'),
+        _if('call', '%(call_summary)s', 'call_summary'),
+        _if('call', '%(update_user)s', 'update_user'),
+        _if('call', '%(sc_approval_required)s', 'sc_approval_required'),
+        _if('call', '%(audit_log)s', 'audit_log'),
+        # A row can only be updated once per statement, so the version moves on here on every save
+        "row_version = row_version + 1",
+    ]
+    ctes = [
+        f"""tracker AS (
+    UPDATE mtl.contact_tracker SET {', '.join(tracker_sets)}
+    WHERE contact_tracker_sk IN (SELECT contact_tracker_sk FROM locked)
+    RETURNING row_version
+)""",
+        # Inbound calls are also logged as their own, already closed, contact tracker row
+        """inbound AS (
+    INSERT INTO mtl.contact_tracker (case_id, outcome, contact_type, contact_channel, call_summary, contact_actual_ts, start_ts, end_ts, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed)
+    SELECT %(case_id)s, %(outcome)s, 'Inbound Call', 'Call', %(call_summary)s, %(contact_actual_ts)s::timestamp, NOW(), NOW(), %(update_user)s, %(audit_log)s, %(sc_approval_required)s, %(recalc_reason)s, %(payment_type)s, %(customer_info_confirmed)s
+    FROM locked WHERE %(inbound)s
+    RETURNING contact_tracker_sk
+)""",
+    ]
+    outputs = [('tracker', 'row_version', 'row_version'), ('inbound', 'contact_tracker_sk', 'inbound_contact_tracker_sk')]
+    _addresses(conn, ctes, outputs, params, address, deceased_address)
+    return _statement(ctes, outputs), params
+
+
+def contact_approval(conn, params, reject, address, deceased_address=None):
+    # Team leader approval: a rejection only records the decision, an approval also replaces
+    # the addresses. Returns (sql, params) for post-contact-approval.
+    params = dict(params, approved_by=f"Approved by: {params['update_user']}")
+    if reject:
+        ctes = [
+            """audit AS (
+    INSERT INTO mtl.contact_tracker (case_id, outcome, contact_type, contact_channel, contact_actual_ts, start_ts, end_ts, tl_rejection_reason, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed)
+    SELECT %(case_id)s, %(outcome)s, 'TL Approval', 'MTL Tool', %(contact_actual_ts)s::timestamp, NOW(), NOW(), %(tl_rejection_reason)s, %(update_user)s, %(audit_log)s, 'No', %(recalc_reason)s, %(payment_type)s, %(customer_info_confirmed)s
+    FROM locked
+    RETURNING contact_tracker_sk
+)""",
+            """tracker AS (
+    UPDATE mtl.contact_tracker SET sc_approval_required = NULL, tl_rejection_reason = %(tl_rejection_reason)s,
+        row_version = row_version + 1
+    WHERE contact_tracker_sk IN (SELECT contact_tracker_sk FROM locked)
+    RETURNING row_version
+)""",
+        ]
+        outputs = [('tracker', 'row_version', 'row_version'), ('audit', 'contact_tracker_sk', 'audit_contact_tracker_sk')]
+        return _statement(ctes, outputs), params
+
+    ctes = [
+        """tracker AS (
+    UPDATE mtl.contact_tracker SET outcome = %(outcome)s, sc_approval_required = %(approved_by)s,
+        row_version = row_version + 1
+    WHERE contact_tracker_sk IN (SELECT contact_tracker_sk FROM locked)
+    RETURNING row_version
+)""",
+        """audit AS (
+    INSERT INTO mtl.contact_tracker (case_id, outcome, contact_type, contact_channel, contact_actual_ts, start_ts, end_ts, update_user, audit_log, sc_approval_required, recalc_reason, payment_type, customer_info_confirmed)
+    SELECT %(case_id)s, %(outcome)s, 'TL Approval', 'MTL Tool', %(contact_actual_ts)s::timestamp, NOW(), NOW(), %(update_user)s, %(audit_log)s, %(sc_approval_required)s, %(recalc_reason)s, %(payment_type)s, %(customer_info_confirmed)s
+    FROM locked
+    RETURNING contact_tracker_sk
+)""",
+    ]
+    outputs = [('tracker', 'row_version', 'row_version'), ('audit', 'contact_tracker_sk', 'audit_contact_tracker_sk')]
+    _addresses(conn, ctes, outputs, params, address, deceased_address)
+    return _statement(ctes, outputs), params
+
+
+def current_version(cursor, case_id):
+    # (contact_tracker_sk, row_version) of the case's current contact tracker row
+    cursor.execute(CURRENT_VERSION, {'case_id': case_id})
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    return (row['contact_tracker_sk'], row['row_version']) if isinstance(row, dict) else tuple(row)
+
+
+def run(cursor, sql_statement, params):
+    # Executes a statement from this module; raises row_versions.VersionConflict when the
+    # contact tracker row is locked by another save, is no longer current or has been
+    # saved since the client loaded it
+    try:
+        db.execute_prepared(cursor, sql_statement, params)
+    except errors.LockNotAvailable:
+        raise row_versions.VersionConflict('contact_tracker', params['contact_tracker_sk'], params['contact_tracker_sk'],
+                                           'The case is being saved by another user',
+                                           params['row_version'], params['row_version'])
+    result = cursor.fetchone()
+    if result['contact_tracker_sk'] is None:
+        current_sk, current_row_version = current_version(cursor, params['case_id'])
+        raise row_versions.VersionConflict('contact_tracker', params['contact_tracker_sk'], current_sk,
+                                           'The case was changed by another user since it was loaded',
+                                           params['row_version'], current_row_version)
+    return result
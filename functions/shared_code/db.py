@@ -0,0 +1,316 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+import psycopg2
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+from azure.identity import DefaultAzureCredential
+from azure.keyvault.secrets import SecretClient
+from shared_code import instrumentation
+
+# Key Vault secret names for each psycopg2 / asyncpg connection setting
+DB_SECRET_NAMES = {
+    'host': 'db-host',
+    'port': 'db-port',
+    'dbname': 'db-name',
+    'user': 'db-username',
+    'password': 'db-password',
+}
+
+# Cached per worker process so warm invocations skip the Key Vault round trips
+_secret_client = None
+_db_settings = None
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_secret_client():
+    global _secret_client
+    if _secret_client is None:
+        credential = DefaultAzureCredential()
+        key_vault_url = os.getenv('key_vault_name')
+        _secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
+    return _secret_client
+
+
+def set_secret_client(client):
+    # Lets local benchmarks swap in a fake Key Vault client
+    global _secret_client
+    _secret_client = client
+
+
+def set_db_settings(settings):
+    # Used by the async path and local benchmarks to prime the settings cache
+    global _db_settings
+    _db_settings = dict(settings)
+
+
+def cached_db_settings():
+    return _db_settings
+
+
+def get_db_settings():
+    global _db_settings
+    if _db_settings is None:
+        with instrumentation.phase('secret_fetch'):
+            secret_client = get_secret_client()
+            _db_settings = {key: secret_client.get_secret(name).value for key, name in DB_SECRET_NAMES.items()}
+    return _db_settings
+
+
+def get_conn_string():
+    settings = get_db_settings()
+    return f"host='{settings['host']}' port='{settings['port']}' dbname='{settings['dbname']}' user='{settings['user']}' password='{settings['password']}'"
+
+
+def application_name():
+    # Tags the session with the calling function so pg_stat_activity shows which endpoint holds or waits on locks
+    function_name = instrumentation.current_function_name()
+    return f'mtl:{function_name}' if function_name else 'mtl'
+
+
+def session_conn_string():
+    conn_string = get_conn_string()
+    if instrumentation.current_function_name():
+        conn_string += f" application_name='{application_name()}'"
+    return conn_string
+
+
+def tag_session(conn):
+    # Pooled connections serve every function in the worker, so a checkout renames the
+    # session after its caller
+    name = application_name()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        # A plain cursor, so the round trip is timed with the checkout rather than as one of
+        # the request's statements
+        with psycopg2.extensions.cursor(conn) as cursor:
+            cursor.execute("SET application_name = %s", (name,))
+    finally:
+        conn.autocommit = autocommit
+    conn.application_name = name
+
+
+def connect():
+    conn_string = session_conn_string()
+    with instrumentation.phase('connect'):
+        return psycopg2.connect(conn_string, connection_factory=instrumentation.InstrumentedConnection)
+
+
+class GatedConnectionPool(ThreadedConnectionPool):
+    # ThreadedConnectionPool raises PoolError as soon as every connection is out. Here a
+    # semaphore counts the connections in use, so getconn can wait for one to come back.
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        super().__init__(minconn, maxconn, *args, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # psycopg2 keeps only minconn connections idle and closes the rest as they come
+        # back, so concurrent requests would reconnect every time. minconn is only opened
+        # up front; from here on every connection the pool has made is kept.
+        self.minconn = maxconn
+
+    def getconn(self, key=None, timeout=None):
+        # Waits up to timeout seconds (0 to not wait, None for db_pool_wait_seconds) for a
+        # free connection, then raises PoolError
+        # The wait for a free connection and any check of it count as the request's pool_checkout
+        with instrumentation.phase('pool_checkout'):
+            if not self._slots.acquire(timeout=pool_wait_seconds() if timeout is None else timeout):
+                raise PoolError('connection pool exhausted')
+            try:
+                return self._checkout(key)
+            except Exception:
+                self._slots.release()
+                raise
+
+    def _checkout(self, key):
+        # A connection that was dropped while idle in the pool is replaced, once, with a
+        # fresh one. Naming the session is the round trip that notices a drop, made when the
+        # caller differs from the last one or the connection has been idle a while.
+        conn = super().getconn(key)
+        try:
+            if not conn.closed:
+                idle = time.monotonic() - getattr(conn, 'returned_at', float('-inf'))
+                if getattr(conn, 'application_name', None) != application_name() or idle > pool_check_idle_seconds():
+                    tag_session(conn)
+                return conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            logging.warning('Replacing a dropped pooled connection: %s', str(e))
+        super().putconn(conn, key, close=True)
+        conn = super().getconn(key)
+        try:
+            tag_session(conn)
+        except Exception:
+            super().putconn(conn, key, close=True)
+            raise
+        return conn
+
+    def putconn(self, conn=None, key=None, close=False):
+        conn.returned_at = time.monotonic()
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+def get_pool():
+    # Thread-safe pool kept per worker process, shared by every sync handler in it and by
+    # handlers that run several queries at once. Created once under a lock, so threads
+    # starting together cannot each build one.
+    global _pool
+    if _pool is None or _pool.closed:
+        with _pool_lock:
+            if _pool is None or _pool.closed:
+                with instrumentation.phase('connect'):
+                    # No application_name here; tag_session sets it per checkout
+                    _pool = GatedConnectionPool(
+                        1, pool_max_connections(), get_conn_string(),
+                        connection_factory=instrumentation.InstrumentedConnection
+                    )
+    return _pool
+
+
+def max_connections():
+    # The connections a worker process holds open, set with db_max_connections: one for the
+    # case event listener, then a third of the rest (at least one) for the asyncpg pool of
+    # the async handlers and the remainder for this pool. Handlers that connect() for
+    # themselves close their connection before they return and are not counted.
+    return max(3, int(os.getenv('db_max_connections', '7')))
+
+
+def async_pool_max_connections():
+    return max(1, (max_connections() - 1) // 3)
+
+
+def pool_max_connections():
+    return max_connections() - 1 - async_pool_max_connections()
+
+
+def pool_wait_seconds():
+    return float(os.getenv('db_pool_wait_seconds', '30'))
+
+
+def pool_check_idle_seconds():
+    # Pooled connections idle longer than this are checked before reuse
+    return float(os.getenv('db_pool_check_idle_seconds', '1'))
+
+
+def prepared_statement_max():
+    return int(os.getenv('db_prepared_statement_max', '100'))
+
+
+@contextmanager
+def pooled_connection(autocommit=False):
+    # A connection from the worker pool for one unit of work, so session state such as
+    # prepared statements outlives the request. Commits on success and rolls back on error.
+    # Falls back to a fresh connection when every pooled one is in use.
+    try:
+        pool = get_pool()
+        conn = pool.getconn(timeout=0)
+    except PoolError:
+        pool = None
+        conn = connect()
+    conn.autocommit = autocommit
+    prepared_before = len(getattr(conn, 'prepared_statements', ()))
+
+    try:
+        yield conn
+        if not autocommit:
+            conn.commit()
+    except Exception:
+        if not conn.closed and not autocommit:
+            conn.rollback()
+            # Statements prepared in a rolled back transaction are not trusted to still exist
+            if len(getattr(conn, 'prepared_statements', ())) != prepared_before:
+                with conn.cursor() as cursor:
+                    cursor.execute("DEALLOCATE ALL")
+                conn.prepared_statements.clear()
+        raise
+    finally:
+        if pool is None:
+            conn.close()
+        else:
+            if not conn.closed:
+                conn.autocommit = False
+            pool.putconn(conn, close=bool(conn.closed))
+
+
+_NAMED_PARAMETER = re.compile(r'%\((\w+)\)s')
+
+
+def execute_prepared(cursor, statement, params):
+    # Runs a %(name)s statement as a server-side prepared statement kept on the connection:
+    # the first call PREPAREs it, later calls with the same text only EXECUTE. Connections
+    # that cannot carry the cache (plain psycopg2 ones) just execute the statement.
+    conn = cursor.connection
+    prepared = getattr(conn, 'prepared_statements', None)
+    if prepared is None:
+        try:
+            conn.prepared_statements = prepared = OrderedDict()
+        except AttributeError:
+            cursor.execute(statement, params)
+            return
+
+    name = 'stmt_' + hashlib.md5(statement.encode()).hexdigest()[:16]
+    names = prepared.get(name)
+    if names is None:
+        names = []
+
+        def position(match):
+            if match.group(1) not in names:
+                names.append(match.group(1))
+            return f'${names.index(match.group(1)) + 1}'
+
+        body = _NAMED_PARAMETER.sub(position, statement).replace('%%', '%')
+        if len(prepared) >= prepared_statement_max():
+            oldest, _ = prepared.popitem(last=False)
+            cursor.execute(f"DEALLOCATE {oldest}")
+        cursor.execute(f"PREPARE {name} AS {body}")
+        prepared[name] = names
+    else:
+        prepared.move_to_end(name)
+
+    if names:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(names))})", [params[key] for key in names])
+    else:
+        cursor.execute(f"EXECUTE {name}")
+
+
+class CopySource(io.TextIOBase):
+    # File-like view of an iterable of rows in COPY csv format; rows are encoded only as
+    # COPY reads them, so large batches are never built up as one string
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            self._pending += self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+def copy_rows(cursor, table, columns, rows):
+    # Streams rows into table with COPY FROM STDIN in the cursor's transaction. Values go
+    # through the csv encoder, never the SQL text; None is written as NULL.
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    cursor.copy_expert(statement, CopySource(rows))
+    return cursor.rowcount
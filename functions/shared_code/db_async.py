@@ -0,0 +1,99 @@
+import asyncio
+import os
+import time
+import asyncpg
+from azure.identity.aio import DefaultAzureCredential
+from azure.keyvault.secrets.aio import SecretClient
+
+from shared_code import db, instrumentation
+
+# One asyncpg pool per worker process, shared by every async handler on the event loop
+_pool = None
+_pool_lock = asyncio.Lock()
+
+
+async def fetch_db_settings():
+    cached = db.cached_db_settings()
+    if cached is not None:
+        return cached
+
+    # Fetch all connection secrets concurrently rather than one round trip at a time
+    credential = DefaultAzureCredential()
+    try:
+        with instrumentation.phase('secret_fetch'):
+            async with SecretClient(vault_url=os.getenv('key_vault_name'), credential=credential) as secret_client:
+                secrets = await asyncio.gather(*(secret_client.get_secret(name) for name in db.DB_SECRET_NAMES.values()))
+    finally:
+        await credential.close()
+
+    settings = {key: secret.value for key, secret in zip(db.DB_SECRET_NAMES.keys(), secrets)}
+    db.set_db_settings(settings)
+    return settings
+
+
+async def get_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                settings = await fetch_db_settings()
+                _pool = await asyncpg.create_pool(
+                    host=settings['host'],
+                    port=int(settings['port']),
+                    database=settings['dbname'],
+                    user=settings['user'],
+                    password=settings['password'],
+                    # Shares the worker's db_max_connections with the psycopg2 pool
+                    min_size=1,
+                    max_size=db.async_pool_max_connections(),
+                    reset=reset_session,
+                )
+    return _pool
+
+
+async def reset_session(conn):
+    # asyncpg's reset on release ends in RESET ALL, which would clear the session's name. The
+    # releasing function's name is put back in the same round trip, so the next request of
+    # that function needs no tag_session round trip of its own.
+    name = db.application_name().replace("'", "''")
+    await conn.execute(conn.get_reset_query() + f"\nSELECT set_config('application_name', '{name}', false);")
+
+
+async def tag_session(conn):
+    # As db.tag_session: the session is named after the calling function, with a round trip
+    # only when that differs from the name the server last reported for it
+    name = db.application_name()
+    if getattr(conn.get_settings(), 'application_name', None) != name:
+        await conn.execute("SELECT set_config('application_name', $1, false)", name)
+
+
+async def fetch_all(sql_statement, *args):
+    # asyncpg uses $1, $2 ... placeholders rather than psycopg2's %s
+    pool = await get_pool()
+    with instrumentation.phase('pool_checkout'):
+        conn = await pool.acquire()
+        try:
+            await tag_session(conn)
+        except Exception:
+            await pool.release(conn)
+            raise
+    try:
+        started = time.perf_counter()
+        rows = await conn.fetch(sql_statement, *args)
+        instrumentation.record_statement(sql_statement, time.perf_counter() - started, len(rows))
+    finally:
+        await pool.release(conn)
+    with instrumentation.phase('fetch'):
+        return [dict(row) for row in rows]
+
+
+async def fetch_concurrently(*statements):
+    # Each statement is a (sql, args) tuple and runs on its own pooled connection
+    return await asyncio.gather(*(fetch_all(sql_statement, *args) for sql_statement, args in statements))
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,201 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import azure.functions as func
+from shared_code import db, instrumentation
+
+# Idempotency-Key support for the mutating endpoints. The first request with a key claims
+# it in mtl.IDEMPOTENCY_KEYS; when it finishes, its response is stored there and in a small
+# per-worker cache, and later requests with the same key get that response back without
+# the handler running again. Keys are scoped to the function and stored hashed, and bodies
+# are compressed, so rows stay small. A claim is released for a retry only when the
+# request committed no writes (see instrumentation.committed_writes); once something is
+# committed, even an error response is kept and replayed.
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+CLAIM = """INSERT INTO mtl.IDEMPOTENCY_KEYS (key_hash, function_name, request_hash, expires_ts)
+           VALUES (%(key_hash)s, %(function_name)s, %(request_hash)s, now() + make_interval(secs => %(lease)s))
+           ON CONFLICT (key_hash) DO UPDATE
+               SET request_hash = EXCLUDED.request_hash, status_code = NULL, response = NULL,
+                   created_ts = now(), expires_ts = EXCLUDED.expires_ts
+               WHERE IDEMPOTENCY_KEYS.expires_ts < now()
+           RETURNING key_hash"""
+
+EXISTING = "SELECT request_hash, status_code, response FROM mtl.IDEMPOTENCY_KEYS WHERE key_hash = %s"
+
+COMPLETE = """UPDATE mtl.IDEMPOTENCY_KEYS
+              SET status_code = %(status_code)s, response = %(response)s,
+                  expires_ts = now() + make_interval(secs => %(ttl)s)
+              WHERE key_hash = %(key_hash)s"""
+
+RELEASE = "DELETE FROM mtl.IDEMPOTENCY_KEYS WHERE key_hash = %s AND status_code IS NULL"
+
+EVICT = """DELETE FROM mtl.IDEMPOTENCY_KEYS
+           WHERE key_hash IN (SELECT key_hash FROM mtl.IDEMPOTENCY_KEYS WHERE expires_ts < now() LIMIT 1000)"""
+
+
+def ttl_seconds():
+    # How long a completed response is replayed for
+    return float(os.getenv('idempotency_ttl_hours', '24')) * 3600
+
+
+def lease_seconds():
+    # How long an unfinished claim blocks retries if its worker dies mid-request
+    return float(os.getenv('idempotency_lease_minutes', '10')) * 60
+
+
+class ResponseCache:
+    # Per-worker LRU of completed responses with TTL eviction; saves the key table round
+    # trip when the retry lands on the same worker, which it usually does
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash):
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+            return entry[1]
+
+    def put(self, key_hash, stored, ttl):
+        with self._lock:
+            self._entries[key_hash] = (time.monotonic() + ttl, stored)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_cache = ResponseCache(int(os.getenv('idempotency_cache_size', '1000')))
+
+
+def request_hash(req):
+    # A key reused with a different request is a client bug, not a replay
+    digest = hashlib.sha256()
+    digest.update(req.method.encode())
+    digest.update(json.dumps(sorted(dict(req.params).items())).encode())
+    digest.update(req.get_body() or b'')
+    return digest.hexdigest()
+
+
+def pack(response):
+    headers = {key: value for key, value in response.headers.items() if key.lower() != 'content-length'}
+    return zlib.compress(json.dumps({'headers': headers, 'body': (response.get_body() or b'').decode('utf-8')}).encode())
+
+
+def replay(status_code, packed):
+    stored = json.loads(zlib.decompress(packed))
+    stored['headers']['Idempotent-Replayed'] = 'true'
+    return func.HttpResponse(body=stored['body'], status_code=status_code, headers=stored['headers'])
+
+
+def error_response(status_code, message):
+    return func.HttpResponse(
+        body=json.dumps({'message': message}),
+        status_code=status_code,
+        headers={'Content-Type': 'application/json'}
+    )
+
+
+def _execute(statement, params, fetch=False):
+    with db.pooled_connection(autocommit=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(statement, params)
+            return cursor.fetchone() if fetch else None
+
+
+def response_failed(response):
+    return not isinstance(response, func.HttpResponse) or response.status_code >= 500
+
+
+def _committed(writes_before):
+    # Outside an instrumented handler nothing is counted, so assume the worst
+    writes_after = instrumentation.committed_writes()
+    return writes_before is None or writes_after is None or writes_after != writes_before
+
+
+def idempotent(main):
+    # Decorator for a mutating function's main; requests without the header run as before.
+    # Failed requests (5xx or an exception) that committed nothing release the key so the
+    # client can retry them.
+    function_name = instrumentation.handler_name(main)
+
+    @functools.wraps(main)
+    def wrapper(req, *args, **kwargs):
+        key = req.headers.get(HEADER)
+        if not key:
+            return main(req, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return error_response(400, f'Bad Request: {HEADER} must be at most {MAX_KEY_LENGTH} characters')
+
+        key_hash = hashlib.sha256(f'{function_name}:{key}'.encode()).hexdigest()
+        this_request = request_hash(req)
+
+        with instrumentation.phase('idempotency'):
+            cached = _cache.get(key_hash)
+            if cached is None:
+                claimed = _execute(CLAIM, {
+                    'key_hash': key_hash, 'function_name': function_name,
+                    'request_hash': this_request, 'lease': lease_seconds()
+                }, fetch=True)
+                if claimed is None:
+                    existing = _execute(EXISTING, (key_hash,), fetch=True)
+                    if existing is not None and existing[1] is None:
+                        return error_response(409, f'A request with this {HEADER} is still being processed')
+                    if existing is not None:
+                        cached = (existing[0], existing[1], bytes(existing[2]))
+                        _cache.put(key_hash, cached, ttl_seconds())
+            if cached is not None:
+                if cached[0] != this_request:
+                    return error_response(422, f'{HEADER} was already used for a different request')
+                return replay(cached[1], cached[2])
+
+            if random.random() < 0.01:
+                _execute(EVICT, None)
+
+        writes_before = instrumentation.committed_writes()
+        try:
+            response = main(req, *args, **kwargs)
+        except BaseException:
+            if not _committed(writes_before):
+                _execute(RELEASE, (key_hash,))
+            else:
+                # Retrying would repeat the committed writes; the claim blocks retries until its lease ends
+                logging.warning('%s failed after committing; keeping its idempotency claim', function_name)
+            raise
+
+        with instrumentation.phase('idempotency'):
+            committed = _committed(writes_before)
+            if response_failed(response) and not committed:
+                _execute(RELEASE, (key_hash,))
+            elif not isinstance(response, func.HttpResponse):
+                # A few handlers still return plain dicts on some error paths; those cannot be
+                # replayed, so the claim is left to its lease
+                logging.warning('%s returned %s after committing; keeping its idempotency claim',
+                                function_name, type(response).__name__)
+            else:
+                packed = pack(response)
+                try:
+                    _execute(COMPLETE, {'key_hash': key_hash, 'status_code': response.status_code,
+                                        'response': packed, 'ttl': ttl_seconds()})
+                    _cache.put(key_hash, (this_request, response.status_code, packed), ttl_seconds())
+                except Exception:
+                    # The change is already committed; a lost record only means a retry runs again
+                    logging.warning('Could not store idempotent response for %s', function_name, exc_info=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,44 @@
+# Personal work inbox (mtl.USER_INBOX): one row per (user, role, case) the user is
+# assigned on CASE_ALLOCATION, so get-assigned-cases is a single index range scan instead
+# of a five-way OR over the assignee columns. The allocation and status-change endpoints
+# call sync() for the cases they touched, in their own transaction, so the inbox commits
+# or rolls back with the allocation itself.
+
+# Inbox role -> (assignee column, status column) on CASE_ALLOCATION
+ROLE_COLUMNS = {
+    'analyst': ('assignedtoanalyst', 'casestatusanalyst'),
+    'qc': ('assignedtoqc', 'casestatusqc'),
+    'qa': ('assignedtoqa', 'casestatusqa'),
+    'ctc': ('assignedtoctc', 'casestatusctc'),
+    'er': ('assignedtoer', 'casestatuser'),
+}
+
+ROLE_ROWS = ', '.join(
+    f"('{role}', ca.{assignee}, ca.{status})" for role, (assignee, status) in ROLE_COLUMNS.items()
+)
+
+# Replaces the inbox rows of the given cases with what CASE_ALLOCATION now says, in one round trip
+SYNC = f"""
+DELETE FROM mtl.USER_INBOX WHERE case_id = ANY(%(case_ids)s);
+INSERT INTO mtl.USER_INBOX (user_email, role, case_id, status)
+SELECT r.user_email, r.role, ca.case_id, r.status
+FROM mtl.CASE_ALLOCATION ca
+CROSS JOIN LATERAL (VALUES {ROLE_ROWS}) AS r (role, user_email, status)
+WHERE ca.case_id = ANY(%(case_ids)s) AND ca.end_ts = '9999-12-31 00:00:00' AND COALESCE(r.user_email, '') <> ''
+ON CONFLICT DO NOTHING
+"""
+
+# Every case a user is assigned to, in any role, with its current tags
+ASSIGNED_CASES = """
+SELECT ca.*, ct.case_tags
+FROM mtl.CASE_ALLOCATION ca
+LEFT JOIN mtl.CASE_TAGS ct ON ca.case_id = ct.case_id AND ct.end_ts = '9999-12-31 00:00:00'
+WHERE ca.end_ts = '9999-12-31 00:00:00'
+AND ca.case_id IN (SELECT case_id FROM mtl.USER_INBOX WHERE user_email = %s)
+"""
+
+
+def sync(cursor, case_ids):
+    case_ids = sorted({str(case_id) for case_id in case_ids if case_id is not None})
+    if case_ids:
+        cursor.execute(SYNC, {'case_ids': case_ids})
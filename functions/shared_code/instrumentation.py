@@ -0,0 +1,248 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+
+# Per-request metrics; contextvars keeps concurrent async requests apart and is
+# inherited by tasks started with asyncio.gather inside a request
+_current_request = contextvars.ContextVar('request_metrics', default=None)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+_READ_ONLY = re.compile(r"\s*(SELECT|SHOW|SET)\b", re.IGNORECASE)
+
+
+class RequestMetrics:
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.statements = 0
+        self.rows = 0
+        self.fields = {}
+        # Transactions with writes that this request committed, counting each autocommit write
+        self.committed_writes = 0
+
+    def add(self, phase_name, seconds):
+        self.phases[phase_name] = self.phases.get(phase_name, 0.0) + seconds
+
+
+def slow_query_threshold_ms():
+    return float(os.getenv('slow_query_ms', '500'))
+
+
+@contextmanager
+def phase(phase_name):
+    # Adds the elapsed time to the current request; a no-op outside an instrumented handler
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = _current_request.get()
+        if metrics is not None:
+            metrics.add(phase_name, time.perf_counter() - started)
+
+
+def annotate(**fields):
+    # Extra fields for this request's request_metrics line; a no-op outside an instrumented handler
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.fields.update(fields)
+
+
+def committed_writes():
+    # How many writes the current request has committed so far; None outside an instrumented handler
+    metrics = _current_request.get()
+    return metrics.committed_writes if metrics is not None else None
+
+
+def _note_committed_write():
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.committed_writes += 1
+
+
+def is_read_only(sql_statement):
+    # A single SELECT, SHOW or SET; anything else (WITH ... UPDATE, EXECUTE, several statements) may write
+    if isinstance(sql_statement, bytes):
+        sql_statement = sql_statement.decode('utf-8', 'replace')
+    sql_statement = str(sql_statement)
+    return bool(_READ_ONLY.match(sql_statement)) and ';' not in sql_statement.strip().rstrip(';')
+
+
+def current_function_name():
+    metrics = _current_request.get()
+    return metrics.function_name if metrics is not None else None
+
+
+def dumps(obj, **kwargs):
+    with phase('serialize'):
+        return json.dumps(obj, **kwargs)
+
+
+def normalize_sql(sql_statement):
+    # Strip literal values so the same statement shape groups together in the slow query log
+    if isinstance(sql_statement, bytes):
+        sql_statement = sql_statement.decode('utf-8', 'replace')
+    sql_statement = _STRING_LITERAL.sub('?', str(sql_statement))
+    sql_statement = _NUMBER_LITERAL.sub('?', sql_statement)
+    return _WHITESPACE.sub(' ', sql_statement).strip()
+
+
+def record_statement(sql_statement, seconds, rowcount):
+    metrics = _current_request.get()
+    if metrics is not None:
+        metrics.add('execute', seconds)
+        metrics.statements += 1
+        if rowcount and rowcount > 0:
+            metrics.rows += rowcount
+
+    elapsed_ms = seconds * 1000
+    if elapsed_ms >= slow_query_threshold_ms():
+        fields = {
+            'function': metrics.function_name if metrics else None,
+            'duration_ms': round(elapsed_ms, 1),
+            'rows': rowcount,
+            'sql': normalize_sql(sql_statement),
+        }
+        logging.warning('slow_query %s', json.dumps(fields), extra={'custom_dimensions': fields})
+
+
+class TimedCursorMixin:
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        finally:
+            # psycopg2.sql compositions log as the statement actually sent
+            statement = query if isinstance(query, (str, bytes)) else (self.query or str(query))
+            record_statement(statement, time.perf_counter() - started, self.rowcount)
+        if not is_read_only(statement):
+            self.connection.note_write()
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            result = super().copy_expert(sql, file, size)
+        finally:
+            record_statement(sql, time.perf_counter() - started, self.rowcount)
+        self.connection.note_write()
+        return result
+
+    def fetchone(self):
+        with phase('fetch'):
+            return super().fetchone()
+
+    def fetchmany(self, size=None):
+        with phase('fetch'):
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+
+    def fetchall(self):
+        with phase('fetch'):
+            return super().fetchall()
+
+
+@functools.lru_cache(maxsize=None)
+def timed_cursor_class(base):
+    return type(f'Timed{base.__name__}', (TimedCursorMixin, base), {})
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    # Wraps whatever cursor_factory the handler asks for (e.g. RealDictCursor) with timing,
+    # and counts the request's committed writes (see committed_writes)
+    pending_write = False
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+    def note_write(self):
+        if self.autocommit:
+            _note_committed_write()
+        else:
+            self.pending_write = True
+
+    def commit(self):
+        super().commit()
+        if self.pending_write:
+            self.pending_write = False
+            _note_committed_write()
+
+    def rollback(self):
+        self.pending_write = False
+        super().rollback()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # `with conn:` commits, or rolls back on an exception, without calling commit()
+        pending_write, self.pending_write = self.pending_write, False
+        result = super().__exit__(exc_type, exc_value, traceback)
+        if pending_write and exc_type is None:
+            _note_committed_write()
+        return result
+
+
+def emit(metrics, response):
+    fields = {
+        'function': metrics.function_name,
+        'status_code': getattr(response, 'status_code', None),
+        'total_ms': round((time.perf_counter() - metrics.started) * 1000, 1),
+        'statements': metrics.statements,
+        'rows': metrics.rows,
+    }
+    for phase_name, seconds in metrics.phases.items():
+        fields[f'{phase_name}_ms'] = round(seconds * 1000, 1)
+    fields.update(metrics.fields)
+
+    get_body = getattr(response, 'get_body', None)
+    if get_body is not None:
+        fields['response_bytes'] = len(get_body() or b'')
+
+    # JSON in the message for log queries; custom_dimensions for Application Insights exporters
+    logging.info('request_metrics %s', json.dumps(fields), extra={'custom_dimensions': fields})
+
+
+def handler_name(main):
+    # The function folder name, looking through any other decorators on main
+    return os.path.basename(os.path.dirname(os.path.abspath(inspect.unwrap(main).__code__.co_filename)))
+
+
+def instrumented(main):
+    # Decorator for a function's main; works for both def and async def handlers
+    function_name = handler_name(main)
+
+    if inspect.iscoroutinefunction(main):
+        @functools.wraps(main)
+        async def async_wrapper(*args, **kwargs):
+            metrics = RequestMetrics(function_name)
+            token = _current_request.set(metrics)
+            response = None
+            try:
+                response = await main(*args, **kwargs)
+                return response
+            finally:
+                _current_request.reset(token)
+                emit(metrics, response)
+        return async_wrapper
+
+    @functools.wraps(main)
+    def wrapper(*args, **kwargs):
+        metrics = RequestMetrics(function_name)
+        token = _current_request.set(metrics)
+        response = None
+        try:
+            response = main(*args, **kwargs)
+            return response
+        finally:
+            _current_request.reset(token)
+            emit(metrics, response)
+    return wrapper
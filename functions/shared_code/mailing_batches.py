@@ -0,0 +1,155 @@
+# QC mailing batches. post-mailing-batch cuts a batch from the released cases in one
+# statement, and post-mailing-review applies each kind of review (approve, remove, reset)
+# to all of its cases in one statement, whatever the number of cases. Each review statement
+# also moves the batch's readiness counters in mtl.MAILING_BATCH (sql/tables/mailing_batches.sql)
+# by the cases it changed, so batch progress (QC_MAILING_STATS_VW) is read from one row per
+# batch. Cases added to a batch, here or elsewhere, are counted by a trigger on QC_MAILING.
+
+CURRENT = "'9999-12-31 00:00:00'"
+
+
+def state(alias):
+    # Where a QC_MAILING row stands, as counted on MAILING_BATCH
+    return (f"CASE WHEN COALESCE({alias}.case_reset, FALSE) THEN 'reset' WHEN {alias}.qc_mailing_ready THEN 'ready' "
+            f"WHEN {alias}.qc_reason_remove_batch IS NOT NULL THEN 'removed' ELSE 'pending' END")
+
+
+CREATE_BATCH = f"""
+WITH candidates AS (
+    SELECT ca.case_id FROM mtl.CASE_ALLOCATION ca
+    WHERE ca.end_ts = {CURRENT} AND ca.caserelease_ts IS NOT NULL {{cohort_filter}}
+    AND NOT EXISTS (SELECT 1 FROM mtl.QC_MAILING qm WHERE qm.case_id = ca.case_id AND NOT COALESCE(qm.case_reset, FALSE))
+    ORDER BY ca.caserelease_ts, ca.case_id
+    LIMIT %(size)s
+    FOR UPDATE OF ca SKIP LOCKED
+), batch AS (
+    SELECT 'MB' || lpad(nextval('mtl.MAILING_BATCH_SEQ')::text, 6, '0') AS mailing_batch_number
+), mailing AS (
+    INSERT INTO mtl.QC_MAILING (case_id, mailing_batch_number)
+    SELECT candidates.case_id, batch.mailing_batch_number FROM candidates CROSS JOIN batch
+    RETURNING case_id, mailing_batch_number
+), counters AS (
+    INSERT INTO mtl.MAILING_BATCH (mailing_batch_number, created_by)
+    SELECT DISTINCT mailing_batch_number, %(email)s FROM mailing
+)
+SELECT mailing_batch_number, case_id FROM mailing ORDER BY case_id
+"""
+
+# Review action -> SET list applied to the action's QC_MAILING rows
+REVIEW_SETTERS = {
+    'pass': "qc_mailing_ready = TRUE, qc_user_email = targets.email, qc_insert_ts = CURRENT_TIMESTAMP",
+    'fail': ("qc_reason_remove_batch = targets.reason, qc_mailing_ready = FALSE, qc_user_email = targets.email, "
+             "qc_insert_ts = CURRENT_TIMESTAMP"),
+    'reset': "case_reset = TRUE",
+}
+
+# A reset case goes back to review: it is no longer released and its tracker restarts
+RESET_CASES = f""",
+released AS (
+    UPDATE mtl.CASE_ALLOCATION SET caserelease_ts = NULL
+    WHERE case_id IN (SELECT case_id FROM changed) AND end_ts = {CURRENT}
+), tracker_closed AS (
+    UPDATE mtl.CASE_TRACKER SET end_ts = CURRENT_TIMESTAMP
+    WHERE case_id IN (SELECT case_id FROM changed) AND end_ts = {CURRENT}
+), tracker AS (
+    INSERT INTO mtl.CASE_TRACKER (case_id, state, sub_state, start_ts, end_ts, audit_log, update_user)
+    SELECT DISTINCT ON (case_id) case_id, 'Review', 'Case Review Unallocated', CURRENT_TIMESTAMP, {CURRENT},
+           'FUNCTION: post-mailing-review', email
+    FROM targets WHERE case_id IN (SELECT case_id FROM changed)
+    ORDER BY case_id
+)"""
+
+ACTIVE_REASONS = "SELECT removal_reason FROM mtl.METADATA_MAILING_REMOVAL WHERE active = TRUE"
+
+# The view is defined over MAILING_BATCH (sql/views/qc_mailing_stats_vw.sql), so reading
+# it costs one row per batch
+READINESS = """
+SELECT * FROM mtl.QC_MAILING_STATS_VW
+{batch_filter}
+ORDER BY mailing_batch_number
+"""
+
+
+class InvalidReview(ValueError):
+    pass
+
+
+def review_statement(action):
+    return f"""
+WITH targets AS (
+    SELECT qm.case_id, qm.mailing_batch_number, r.email, r.reason, {state('qm')} AS old_state
+    FROM mtl.QC_MAILING qm
+    JOIN unnest(%(case_ids)s::text[], %(batch_numbers)s::text[], %(emails)s::text[], %(reasons)s::text[])
+        AS r (case_id, mailing_batch_number, email, reason) USING (case_id, mailing_batch_number)
+    FOR UPDATE OF qm
+), changed AS (
+    UPDATE mtl.QC_MAILING qm SET {REVIEW_SETTERS[action]}
+    FROM targets
+    WHERE qm.case_id = targets.case_id AND qm.mailing_batch_number = targets.mailing_batch_number
+    RETURNING qm.case_id, qm.mailing_batch_number, targets.old_state, {state('qm')} AS new_state
+), counted AS (
+    UPDATE mtl.MAILING_BATCH b
+    SET ready = b.ready + delta.ready, removed = b.removed + delta.removed, reset = b.reset + delta.reset,
+        updated_ts = CURRENT_TIMESTAMP
+    FROM (
+        SELECT mailing_batch_number,
+               count(*) FILTER (WHERE new_state = 'ready') - count(*) FILTER (WHERE old_state = 'ready') AS ready,
+               count(*) FILTER (WHERE new_state = 'removed') - count(*) FILTER (WHERE old_state = 'removed') AS removed,
+               count(*) FILTER (WHERE new_state = 'reset') - count(*) FILTER (WHERE old_state = 'reset') AS reset
+        FROM changed GROUP BY mailing_batch_number
+    ) AS delta
+    WHERE b.mailing_batch_number = delta.mailing_batch_number
+){RESET_CASES if action == 'reset' else ''}
+SELECT case_id, mailing_batch_number FROM changed
+"""
+
+
+def create_batch(cursor, email, size, cohorts=None):
+    # Cuts a batch of up to `size` released cases not already in a live batch, oldest
+    # release first. Returns (batch number, case ids), or (None, []) with nothing to mail.
+    # The batch row is created here; the QC_MAILING trigger counts its cases.
+    cohort_filter = "AND ca.population_cohort = ANY(%(cohorts)s)" if cohorts else ""
+    cursor.execute(CREATE_BATCH.format(cohort_filter=cohort_filter), {'size': size, 'email': email, 'cohorts': cohorts})
+    rows = cursor.fetchall()
+    if not rows:
+        return None, []
+    return rows[0][0], [row[1] for row in rows]
+
+
+def review(cursor, reviews):
+    # Applies the post-mailing-review body, one statement per action, in the caller's
+    # transaction. The last review of a case in a batch wins. Returns the number of cases
+    # changed per action. Raises InvalidReview for unknown actions or removal reasons.
+    by_action = {}
+    for item in reviews:
+        action = item['mailing_check']
+        if action not in REVIEW_SETTERS:
+            raise InvalidReview(f'Unknown mailing_check: {action}')
+        reason = item.get('removal_reason') if action == 'fail' else None
+        if action == 'fail' and not reason:
+            raise InvalidReview(f"A removal_reason is needed to remove case {item['case_id']}")
+        by_action.setdefault(action, {})[(item['case_id'], item['batch_number'])] = (item['userEmail'], reason)
+
+    if 'fail' in by_action:
+        cursor.execute(ACTIVE_REASONS)
+        active = {row[0] for row in cursor.fetchall()}
+        unknown = sorted({reason for _, reason in by_action['fail'].values()} - active)
+        if unknown:
+            raise InvalidReview(f"Not an active mailing removal reason: {', '.join(unknown)}")
+
+    changed = {}
+    for action, items in by_action.items():
+        cursor.execute(review_statement(action), {
+            'case_ids': [case_id for case_id, _ in items],
+            'batch_numbers': [batch_number for _, batch_number in items],
+            'emails': [email for email, _ in items.values()],
+            'reasons': [reason for _, reason in items.values()],
+        })
+        changed[action] = len(cursor.fetchall())
+    return changed
+
+
+def readiness_query(batch_number=None):
+    # (statement, params) for the readiness of every batch, or of one
+    batch_filter = "WHERE mailing_batch_number = %(batch_number)s" if batch_number else ""
+    return READINESS.format(batch_filter=batch_filter), {'batch_number': batch_number}
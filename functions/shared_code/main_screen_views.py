@@ -0,0 +1,175 @@
+import logging
+import os
+from datetime import datetime, timezone
+
+# Live view -> materialized copy kept current by the refresh-main-screen-views timer
+MAIN_SCREEN_VIEWS = {
+    'mtl.QC_MAIN_SCREEN_VW': 'mtl.QC_MAIN_SCREEN_MV',
+    'mtl.QA_MAIN_SCREEN_VW': 'mtl.QA_MAIN_SCREEN_MV',
+    'mtl.CTC_MAIN_SCREEN_VW': 'mtl.CTC_MAIN_SCREEN_MV',
+    'mtl.RELEASE_MAIN_SCREEN_VW': 'mtl.RELEASE_MAIN_SCREEN_MV',
+}
+
+FRESHNESS_OPTIONS = ('fresh', 'cached')
+
+# Only one function instance refreshes at a time
+REFRESH_LOCK_KEY = 728190001
+
+
+def setting(name, default):
+    return float(os.getenv(name, default))
+
+
+def parse_freshness(req):
+    # fresh (default) reads the live view, cached reads the materialized copy when it is usable
+    freshness = (req.params.get('freshness') or 'fresh').lower()
+    if freshness not in FRESHNESS_OPTIONS:
+        raise ValueError(f'freshness must be one of {", ".join(FRESHNESS_OPTIONS)}')
+    return freshness
+
+
+def mark_dirty(cursor, source):
+    # Append-only so concurrent writers never contend on a shared status row.
+    # Runs in the caller's transaction, so rolled back writes leave no event. The savepoint
+    # keeps the caller's write intact if the event table is unavailable.
+    try:
+        cursor.execute("SAVEPOINT mv_write_event; INSERT INTO mtl.MV_WRITE_EVENTS (source) VALUES (%s); RELEASE SAVEPOINT mv_write_event", (source,))
+    except Exception as e:
+        logging.warning('Could not record main screen write event: %s', str(e))
+        cursor.execute("ROLLBACK TO SAVEPOINT mv_write_event")
+
+
+def resolve_source(cursor, live_view, freshness):
+    # Returns (relation to select from, staleness in seconds or None when reading live)
+    if freshness != 'cached':
+        return live_view, None
+
+    try:
+        cursor.execute(
+            """SELECT s.data_as_of_ts, m.ispopulated,
+                      EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - s.data_as_of_ts)) AS staleness_seconds
+               FROM mtl.MV_REFRESH_STATUS s
+               JOIN pg_matviews m ON m.schemaname || '.' || m.matviewname = lower(s.materialized_view)
+               WHERE s.materialized_view = %s""",
+            (MAIN_SCREEN_VIEWS[live_view],)
+        )
+        status = cursor.fetchone()
+    except Exception as e:
+        # e.g. refresh tables not deployed yet; clear the failed transaction and read live
+        logging.warning('Could not read refresh status for %s: %s', live_view, str(e))
+        cursor.connection.rollback()
+        return live_view, None
+    max_staleness = setting('mv_max_staleness_seconds', '600')
+
+    # Fall back to the live view if the copy was never populated or is too old
+    if not status or not status['ispopulated'] or status['data_as_of_ts'] is None:
+        logging.warning('Materialized view for %s unavailable, reading live view', live_view)
+        return live_view, None
+    if float(status['staleness_seconds']) > max_staleness:
+        logging.warning('Materialized view for %s is %.0fs stale, reading live view', live_view, status['staleness_seconds'])
+        return live_view, None
+
+    return MAIN_SCREEN_VIEWS[live_view], float(status['staleness_seconds'])
+
+
+def source_headers(live_view, source, staleness_seconds):
+    headers = {'X-Data-Source': 'live' if source == live_view else 'cached'}
+    if staleness_seconds is not None:
+        headers['X-Data-Staleness-Seconds'] = f'{staleness_seconds:.0f}'
+    return headers
+
+
+def staleness_metrics(cursor):
+    cursor.execute(
+        """SELECT s.materialized_view, s.live_view, s.data_as_of_ts, s.last_refresh_ms, s.last_error,
+                  s.refresh_count, m.ispopulated,
+                  EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - s.data_as_of_ts)) AS staleness_seconds,
+                  (SELECT COUNT(*) FROM mtl.MV_WRITE_EVENTS e WHERE e.event_id > s.refreshed_through_event_id) AS pending_writes
+           FROM mtl.MV_REFRESH_STATUS s
+           LEFT JOIN pg_matviews m ON m.schemaname || '.' || m.matviewname = lower(s.materialized_view)
+           ORDER BY s.materialized_view"""
+    )
+    return cursor.fetchall()
+
+
+def refresh_is_due(status, events, now, force):
+    if force or not status['ispopulated'] or status['data_as_of_ts'] is None:
+        return True
+
+    age = (now - status['data_as_of_ts']).total_seconds()
+    if age >= setting('mv_max_age_seconds', '900'):
+        return True
+
+    if events['last_event_id'] is None or events['last_event_id'] <= status['refreshed_through_event_id']:
+        return False
+
+    # Debounce: wait for writes to go quiet, but never longer than mv_max_wait_seconds
+    quiet_for = (now - events['last_event_ts']).total_seconds()
+    waiting_for = (now - events['first_event_ts']).total_seconds()
+    return quiet_for >= setting('mv_debounce_seconds', '20') or waiting_for >= setting('mv_max_wait_seconds', '120')
+
+
+def refresh_due_views(conn, force=False):
+    # conn must be in autocommit mode so each refresh and status update commits on its own
+    results = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (REFRESH_LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            logging.info('Another instance is refreshing the main screen views, skipping.')
+            return results
+
+        try:
+            for materialized_view in MAIN_SCREEN_VIEWS.values():
+                results.append(refresh_view(cursor, materialized_view, force))
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (REFRESH_LOCK_KEY,))
+
+        # Events already reflected in every materialized view are no longer needed
+        cursor.execute("DELETE FROM mtl.MV_WRITE_EVENTS WHERE event_id <= (SELECT MIN(refreshed_through_event_id) FROM mtl.MV_REFRESH_STATUS)")
+    return results
+
+
+def refresh_view(cursor, materialized_view, force):
+    now = datetime.now(timezone.utc)
+    cursor.execute(
+        """SELECT s.data_as_of_ts, s.refreshed_through_event_id, m.ispopulated
+           FROM mtl.MV_REFRESH_STATUS s
+           JOIN pg_matviews m ON m.schemaname || '.' || m.matviewname = lower(s.materialized_view)
+           WHERE s.materialized_view = %s""",
+        (materialized_view,)
+    )
+    row = cursor.fetchone()
+    status = {'data_as_of_ts': row[0], 'refreshed_through_event_id': row[1], 'ispopulated': row[2]}
+
+    cursor.execute("SELECT MAX(event_id), MIN(event_ts), MAX(event_ts) FROM mtl.MV_WRITE_EVENTS WHERE event_id > %s", (status['refreshed_through_event_id'],))
+    last_event_id, first_event_ts, last_event_ts = cursor.fetchone()
+    events = {'last_event_id': last_event_id, 'first_event_ts': first_event_ts, 'last_event_ts': last_event_ts}
+
+    if not refresh_is_due(status, events, now, force):
+        return {'view': materialized_view, 'refreshed': False}
+
+    # Capture the watermark and timestamp before refreshing: anything written later is still pending.
+    # A writer that commits an older event id after this point is picked up by mv_max_age_seconds.
+    cursor.execute("SELECT COALESCE(MAX(event_id), 0), CURRENT_TIMESTAMP FROM mtl.MV_WRITE_EVENTS")
+    through_event_id, started_ts = cursor.fetchone()
+
+    try:
+        # CONCURRENTLY needs an already populated view; the first refresh takes the blocking path
+        concurrently = 'CONCURRENTLY ' if status['ispopulated'] else ''
+        started = datetime.now(timezone.utc)
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{materialized_view}")
+        elapsed_ms = int((datetime.now(timezone.utc) - started).total_seconds() * 1000)
+    except Exception as e:
+        logging.error('Refresh of %s failed: %s', materialized_view, str(e))
+        cursor.execute("UPDATE mtl.MV_REFRESH_STATUS SET last_error = %s WHERE materialized_view = %s", (str(e), materialized_view))
+        return {'view': materialized_view, 'refreshed': False, 'error': str(e)}
+
+    cursor.execute(
+        """UPDATE mtl.MV_REFRESH_STATUS
+           SET data_as_of_ts = %s, refreshed_through_event_id = GREATEST(refreshed_through_event_id, %s),
+               last_refresh_ms = %s, last_error = NULL, refresh_count = refresh_count + 1
+           WHERE materialized_view = %s""",
+        (started_ts, through_event_id, elapsed_ms, materialized_view)
+    )
+    logging.info('Refreshed %s in %sms', materialized_view, elapsed_ms)
+    return {'view': materialized_view, 'refreshed': True, 'refresh_ms': elapsed_ms}
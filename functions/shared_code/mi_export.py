@@ -0,0 +1,201 @@
+import contextvars
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import Workbook
+from psycopg2 import sql
+from shared_code import db, instrumentation
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Excel limits sheet titles to 31 characters
+MAX_SHEET_TITLE = 31
+
+
+# Advisory lock class for claiming an object's export window; the object name is the second key
+EXPORT_LOCK_KEY = 728190002
+
+
+def fetch_batch_size():
+    return int(os.getenv('mi_export_fetch_rows', '5000'))
+
+
+def watermark_lag_minutes():
+    # Rows written by transactions still open at export time can carry an earlier
+    # timestamp than ones already committed, so the window stops short of now()
+    return float(os.getenv('mi_export_watermark_lag_minutes', '5'))
+
+
+def claim_export(cursor, object_name):
+    # Session-level, so it holds across the commits of a run; taken before the definitions
+    # are read, so two runs can never export the same watermark window. False if another
+    # run of the object holds it.
+    cursor.execute("SELECT pg_try_advisory_lock(%s, hashtext(%s)) AS claimed", [EXPORT_LOCK_KEY, object_name])
+    return cursor.fetchone()['claimed']
+
+
+def release_export(cursor, object_name):
+    cursor.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", [EXPORT_LOCK_KEY, object_name])
+
+
+def load_definitions(cursor, object_name, tab_name=None):
+    # Every active tab for the object, or just the one requested
+    query = "SELECT * FROM MTL.MI_METADATA_EXPORT WHERE object_name = %s AND object_active = true"
+    params = [object_name]
+    if tab_name:
+        query += " AND tab_name = %s"
+        params.append(tab_name)
+    cursor.execute(query + " ORDER BY tab_name", params)
+    return cursor.fetchall()
+
+
+def is_incremental(definition):
+    return bool(definition.get('watermark_column'))
+
+
+def export_upper_bound(cursor):
+    # Taken from the database clock so it is comparable with the stored timestamps
+    cursor.execute("SELECT (now() - make_interval(secs => %s))::timestamp AS upper_bound", [watermark_lag_minutes() * 60])
+    return cursor.fetchone()['upper_bound']
+
+
+def definition_sql(definition):
+    # The stored SQL as it can be embedded: a trailing ';' would end the statement early,
+    # inside the incremental wrapper or the server-side cursor's DECLARE
+    return definition['sql'].strip().rstrip(';').rstrip()
+
+
+def tab_query(definition, upper_bound=None, full=False):
+    # Incremental definitions export only rows whose watermark falls in
+    # (last_watermark, upper_bound]; the first run, or a forced full run, starts from the beginning
+    if not is_incremental(definition):
+        return definition_sql(definition), None
+    # Unquoted column names fold to lower case, so the watermark is matched the same way
+    watermark = sql.Identifier(definition['watermark_column'].lower())
+    # Executed with parameters, so a literal % in the stored SQL (LIKE 'x%') must be doubled
+    query = sql.SQL("SELECT * FROM ({definition_sql}) AS mi WHERE mi.{watermark} <= %s").format(
+        definition_sql=sql.SQL(definition_sql(definition).replace('%', '%%')), watermark=watermark)
+    params = [upper_bound]
+    if definition.get('last_watermark') and not full:
+        query += sql.SQL(" AND mi.{watermark} > %s").format(watermark=watermark)
+        params.append(definition['last_watermark'])
+    return query + sql.SQL(" ORDER BY mi.{watermark}").format(watermark=watermark), params
+
+
+def save_watermarks(cursor, definitions, upper_bound, full=False):
+    # Only moves the watermark on if nobody else exported the same window meanwhile;
+    # returns the tabs whose watermark was already moved by a concurrent run
+    conflicts = []
+    for definition in definitions:
+        if not is_incremental(definition):
+            continue
+        cursor.execute(
+            "UPDATE MTL.MI_METADATA_EXPORT SET last_watermark = %s, last_exported_ts = now() "
+            "WHERE object_name = %s AND tab_name = %s AND (%s OR last_watermark IS NOT DISTINCT FROM %s)",
+            [upper_bound, definition['object_name'], definition['tab_name'], full, definition['last_watermark']]
+        )
+        if cursor.rowcount == 0:
+            conflicts.append(definition['tab_name'])
+    return conflicts
+
+
+def _put(out, item, cancelled):
+    # Blocks while the writer is behind, but gives up once the export has failed
+    while not cancelled.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _run_tab(pool, index, query, params, out, cancelled, batch_size):
+    started = time.perf_counter()
+    try:
+        # The pool is shared with the worker's other requests; waits for a free connection
+        conn = pool.getconn()
+    except Exception as e:
+        _put(out, (index, 'error', e), cancelled)
+        return
+    try:
+        # A server-side cursor streams the rows so no tab is ever held in memory in full
+        with conn.cursor(name=f'mi_export_{index}') as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, params)
+            rows = cursor.fetchmany(batch_size)
+            header = [column.name for column in cursor.description]
+            if not _put(out, (index, 'header', header), cancelled):
+                return
+            while rows:
+                if not _put(out, (index, 'rows', rows), cancelled):
+                    return
+                rows = cursor.fetchmany(batch_size)
+        _put(out, (index, 'done', time.perf_counter() - started), cancelled)
+    except Exception as e:
+        _put(out, (index, 'error', e), cancelled)
+    finally:
+        if not conn.closed:
+            conn.rollback()
+        pool.putconn(conn)
+
+
+def build_workbook(definitions, upper_bound=None, full=False):
+    # Runs each tab's SQL on its own pooled connection and streams the rows into its own
+    # sheet of one write-only workbook. openpyxl is not thread safe, so the query threads
+    # only fetch; this thread does all the writing. Tabs wait for connections that other
+    # requests on the worker are using rather than failing. Returns a temporary file
+    # positioned at the start, plus per-tab row counts and query times.
+    pool = db.get_pool()
+    max_workers = min(len(definitions), db.pool_max_connections())
+    batch_size = fetch_batch_size()
+    out = queue.Queue(maxsize=max_workers * 4)
+    cancelled = threading.Event()
+
+    wb = Workbook(write_only=True)
+    sheets = [wb.create_sheet(title=definition['tab_name'][:MAX_SHEET_TITLE]) for definition in definitions]
+    stats = []
+    for definition in definitions:
+        tab = {'tab_name': definition['tab_name'], 'rows': 0, 'query_ms': None, 'incremental': is_incremental(definition)}
+        if tab['incremental']:
+            tab['watermark_from'] = None if full or not definition['last_watermark'] else definition['last_watermark'].isoformat()
+            tab['watermark_to'] = upper_bound.isoformat()
+        stats.append(tab)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, definition in enumerate(definitions):
+            # Copy the request context so the worker's statements count towards this request
+            context = contextvars.copy_context()
+            query, params = tab_query(definition, upper_bound, full)
+            executor.submit(context.run, _run_tab, pool, index, query, params, out, cancelled, batch_size)
+
+        try:
+            remaining = len(definitions)
+            while remaining:
+                index, kind, payload = out.get()
+                if kind == 'error':
+                    raise payload
+                if kind == 'done':
+                    stats[index]['query_ms'] = round(payload * 1000, 1)
+                    remaining -= 1
+                    continue
+                with instrumentation.phase('workbook'):
+                    if kind == 'header':
+                        sheets[index].append(payload)
+                    else:
+                        for row in payload:
+                            sheets[index].append(row)
+                        stats[index]['rows'] += len(payload)
+        except BaseException:
+            cancelled.set()
+            raise
+
+    output = tempfile.TemporaryFile()
+    with instrumentation.phase('workbook'):
+        wb.save(output)
+    output.seek(0)
+    return output, stats
+
@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+# Columns returned to the payments screen, in display order
+PAYMENT_COLUMNS = (
+    'case_id', 'payment_reference', 'first_name', 'last_name', 'net_redress_value',
+    'payment_method', 'scheduled_payment_date', 'assignedtoanalyst',
+    'payment_completed_by_analyst', 'payment_completed_by_analyst_date',
+    'total_redress', 'interest', 'withheld_tax', 'address_line_1', 'address_line_2',
+    'address_line_3', 'address_line_4', 'address_line_5', 'postcode',
+)
+
+PAYMENT_SOURCE = "FROM mtl.master_payment_analyst_vw WHERE end_ts = '9999-12-31 00:00:00'"
+
+# Allocation filters for get-payments. Each predicate is written exactly as the
+# matching partial index in sql/indexes/master_payment_reads.sql so the planner can
+# prove the index applies; keep the two in step.
+TEAM_ALLOCATIONS = {
+    'unallocated': "assignedtoanalyst IS NULL",
+    'allocated': "assignedtoanalyst IS NOT NULL AND NOT payment_completed_by_analyst",
+    'completed': "payment_completed_by_analyst",
+}
+
+ANALYST_ALLOCATIONS = {
+    'allocated': "assignedtoanalyst = %(analyst_email)s AND NOT payment_completed_by_analyst",
+    'completed': "assignedtoanalyst = %(analyst_email)s AND payment_completed_by_analyst",
+}
+
+# 'na' asks for the whole team's payments rather than one analyst's
+ALL_ANALYSTS = 'na'
+
+DUE_ONLY = "scheduled_payment_date <= CURRENT_DATE"
+
+
+def payment_mode(analyst_email, allocation):
+    # Any other combination falls back to every current payment, as the screen always did
+    if analyst_email == ALL_ANALYSTS:
+        return ('team', allocation) if allocation in TEAM_ALLOCATIONS else ('team', 'all')
+    return ('analyst', allocation) if allocation in ANALYST_ALLOCATIONS else ('analyst', 'all')
+
+
+@lru_cache(maxsize=None)
+def statement_for_mode(scope, allocation, include_future_payments):
+    # One fixed SQL text per mode, so every request for the same mode reuses its plan
+    conditions = []
+    if not include_future_payments:
+        conditions.append(DUE_ONLY)
+    allocations = TEAM_ALLOCATIONS if scope == 'team' else ANALYST_ALLOCATIONS
+    if allocation in allocations:
+        conditions.append(allocations[allocation])
+
+    statement = f"SELECT {', '.join(PAYMENT_COLUMNS)} {PAYMENT_SOURCE}"
+    if conditions:
+        statement += " AND " + " AND ".join(conditions)
+    return statement
+
+
+def build_payments_query(analyst_email, allocation, include_future_payments):
+    # Returns (sql, params) for get-payments with every value bound
+    scope, allocation = payment_mode(analyst_email, allocation)
+    statement = statement_for_mode(scope, allocation, include_future_payments == 'true')
+    params = {'analyst_email': analyst_email} if '%(analyst_email)s' in statement else {}
+    return statement, params
+
+
+def build_analyst_payments_query(analyst_email):
+    # Every current payment assigned to the analyst, all columns (get-payments-all-columns)
+    return f"SELECT * {PAYMENT_SOURCE} AND assignedtoanalyst = %(analyst_email)s", {'analyst_email': analyst_email}
@@ -0,0 +1,98 @@
+import json
+import os
+import azure.functions as func
+from psycopg2 import errors
+
+# Optimistic concurrency for the case save endpoints. The client sends back the surrogate
+# key of the row it loaded (input_file_review_sk / contact_tracker_sk); the save only goes
+# ahead if that row is still the current version and nobody else is saving it right now.
+# contact_tracker rows are updated in place, so their saves also send back row_version.
+# Otherwise the endpoint answers 409 at once instead of queueing behind the other
+# writer's row locks and then overwriting their changes.
+
+VERSIONED_TABLES = {
+    'input_file_review': 'input_file_review_sk',
+    'contact_tracker': 'contact_tracker_sk',
+}
+
+
+class VersionConflict(Exception):
+    def __init__(self, table, expected_sk, current_sk, reason, expected_version=None, current_version=None):
+        super().__init__(reason)
+        self.table = table
+        self.expected_sk = expected_sk
+        self.current_sk = current_sk
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+
+def versions_required():
+    # Off while clients are rolled out; saves without a version then behave as before
+    return os.getenv('require_row_versions', 'false').lower() == 'true'
+
+
+def current_sk(cursor, table, case_id):
+    key_column = VERSIONED_TABLES[table]
+    cursor.execute(
+        f"SELECT {key_column} AS sk FROM mtl.{table} WHERE case_id = %s AND end_ts = '9999-12-31 00:00:00' "
+        f"ORDER BY {key_column} DESC LIMIT 1",
+        (case_id,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return row['sk'] if isinstance(row, dict) else row[0]
+
+
+def lock_current(cursor, table, case_id, expected_sk):
+    # Locks the expected row for the rest of the transaction, or raises VersionConflict
+    key_column = VERSIONED_TABLES[table]
+    cursor.execute("SAVEPOINT row_version_lock")
+    try:
+        cursor.execute(
+            f"SELECT {key_column} FROM mtl.{table} "
+            f"WHERE {key_column} = %s AND case_id = %s AND end_ts = '9999-12-31 00:00:00' FOR UPDATE NOWAIT",
+            (expected_sk, case_id)
+        )
+        locked = cursor.fetchone()
+    except errors.LockNotAvailable:
+        cursor.execute("ROLLBACK TO SAVEPOINT row_version_lock")
+        raise VersionConflict(table, expected_sk, expected_sk, 'The case is being saved by another user')
+    cursor.execute("RELEASE SAVEPOINT row_version_lock")
+
+    if locked is None:
+        raise VersionConflict(table, expected_sk, current_sk(cursor, table, case_id),
+                              'The case was changed by another user since it was loaded')
+
+
+def parse_sk(value):
+    # None when the client did not send a version; ValueError for anything but an integer key
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise ValueError('Row version must be an integer')
+    return int(value)
+
+
+def conflict_response(conflict, headers):
+    body = {
+        'message': str(conflict),
+        'table': conflict.table,
+        VERSIONED_TABLES[conflict.table]: conflict.expected_sk,
+        'current_' + VERSIONED_TABLES[conflict.table]: conflict.current_sk,
+    }
+    if conflict.current_version is not None:
+        body.update(row_version=conflict.expected_version, current_row_version=conflict.current_version)
+    return func.HttpResponse(
+        body=json.dumps(body),
+        status_code=409,
+        headers=headers
+    )
+
+
+def missing_version_response(key_column, headers):
+    return func.HttpResponse(
+        body=json.dumps({'message': f'Precondition Required: send the {key_column} that was loaded'}),
+        status_code=428,
+        headers=headers
+    )
@@ -0,0 +1,91 @@
+import json
+from collections import namedtuple
+from shared_code import inbox, work_queue
+
+# Stratified QC/QA sampling for post-sample-cases. The population is the role's work queue
+# (the same rows, and partial index, post-next-case claims from), split into strata by the
+# reviewer whose work is being checked and by population cohort. Every stratum gives up
+# ceil(rate * size) cases, at least `minimum` where its rate is above zero, chosen by the
+# order of md5(seed || case_id): the same seed over the same population always picks the
+# same cases. The sample is allocated round robin over the checkers and its tracker rows
+# moved on in the same statement, so only the sample ever leaves the database.
+
+Sampling = namedtuple('Sampling', 'checked_by criteria')
+
+SAMPLINGS = {
+    'qc': Sampling('assignedtoanalyst', 'case_selection_criteria'),
+    'qa': Sampling('assignedtoqc', 'case_selection_criteria_qa'),
+}
+
+
+def sample_statement(role, cohorts=None):
+    queue = work_queue.QUEUES[role]
+    sampling = SAMPLINGS[role]
+    cohort_filter = "AND population_cohort = ANY(%(cohorts)s)" if cohorts else ""
+    return f"""
+WITH population AS (
+    SELECT case_id, COALESCE(lower({sampling.checked_by}), '') AS checked_by, COALESCE(population_cohort, '') AS cohort,
+           md5(%(seed)s || case_id) AS draw
+    FROM mtl.CASE_ALLOCATION
+    WHERE end_ts = '9999-12-31 00:00:00' AND {queue.status} = 'NEW' AND COALESCE({queue.assignee}, '') = '' {cohort_filter}
+), ranked AS (
+    SELECT population.*,
+           COALESCE((%(checked_by_rates)s::jsonb ->> checked_by)::numeric, (%(cohort_rates)s::jsonb ->> cohort)::numeric,
+                    %(rate)s) AS rate,
+           row_number() OVER (PARTITION BY checked_by, cohort ORDER BY draw) AS pick,
+           count(*) OVER (PARTITION BY checked_by, cohort) AS stratum_size
+    FROM population
+), sample AS (
+    SELECT case_id, checked_by, cohort, rate, stratum_size,
+           row_number() OVER (ORDER BY pick, draw) - 1 AS slot
+    FROM ranked
+    WHERE rate > 0 AND pick <= GREATEST(%(minimum)s, ceil(rate * stratum_size))
+), allocated AS (
+    UPDATE mtl.CASE_ALLOCATION ca
+    SET {queue.assignee} = checker.email, {queue.assignee_name} = checker.name, {sampling.criteria} = %(criteria)s
+    FROM sample
+    JOIN unnest(%(emails)s::text[], %(names)s::text[]) WITH ORDINALITY AS checker (email, name, n)
+        ON checker.n = sample.slot %% cardinality(%(emails)s::text[]) + 1
+    WHERE ca.case_id = sample.case_id AND ca.end_ts = '9999-12-31 00:00:00' AND COALESCE(ca.{queue.assignee}, '') = ''
+    RETURNING ca.case_id, ca.{queue.assignee} AS assigned_to, ca.{queue.assignee_name} AS assigned_to_name
+){work_queue.tracker_ctes(queue, 'allocated', 'post-sample-cases')}
+SELECT sample.case_id, sample.checked_by, sample.cohort, sample.rate, sample.stratum_size,
+       allocated.assigned_to, allocated.assigned_to_name
+FROM sample JOIN allocated USING (case_id)
+ORDER BY sample.slot
+"""
+
+
+def rates_json(rates, key=str):
+    return json.dumps({key(name): float(value) for name, value in (rates or {}).items()})
+
+
+def draw(cursor, role, checkers, seed, email, rate, cohort_rates=None, checked_by_rates=None, minimum=1,
+         cohorts=None, criteria=None):
+    # Samples and allocates in the caller's transaction and returns (sample, strata). A case
+    # allocated by someone else since the population was read is left out of the sample.
+    # Expects a plain tuple cursor.
+    cursor.execute(sample_statement(role, cohorts), {
+        'seed': str(seed),
+        'rate': rate,
+        'cohort_rates': rates_json(cohort_rates),
+        'checked_by_rates': rates_json(checked_by_rates, key=str.lower),
+        'minimum': minimum,
+        'cohorts': cohorts,
+        'emails': [checker['email'].lower() for checker in checkers],
+        'names': [checker['name'] for checker in checkers],
+        'criteria': criteria or f'Stratified sample, rate {rate:g}, seed {seed}',
+        'email': email,
+    })
+
+    sample, strata = [], {}
+    for case_id, checked_by, cohort, case_rate, stratum_size, assigned_to, assigned_to_name in cursor.fetchall():
+        sample.append({'case_id': case_id, 'checked_by': checked_by, 'cohort': cohort,
+                       'assigned_to': assigned_to, 'assigned_to_name': assigned_to_name})
+        stratum = strata.setdefault((checked_by, cohort), {
+            'checked_by': checked_by, 'cohort': cohort, 'rate': float(case_rate), 'population': stratum_size, 'sampled': 0,
+        })
+        stratum['sampled'] += 1
+
+    inbox.sync(cursor, [case['case_id'] for case in sample])
+    return sample, list(strata.values())
@@ -0,0 +1,65 @@
+import threading
+
+# update-case and the contact endpoints insert whatever keys the request body holds. The
+# mtl column list is read from information_schema once per worker process and used to
+# reject unknown keys up front and to put known ones in table order, so every request
+# with the same set of fields produces the same SQL text (and prepared statement).
+
+_columns = None
+_lock = threading.Lock()
+
+
+class InvalidColumns(ValueError):
+    def __init__(self, table, columns, reason='Unknown column'):
+        super().__init__(f"{reason} for {table}: {', '.join(sorted(columns))}")
+        self.table = table
+        self.columns = columns
+
+
+def load(conn):
+    # {table: {column: (position, type)}} for the mtl schema, loaded on first use
+    global _columns
+    if _columns is None:
+        with _lock:
+            if _columns is None:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT table_name, column_name, ordinal_position, udt_schema, udt_name "
+                        "FROM information_schema.columns WHERE table_schema = 'mtl'"
+                    )
+                    columns = {}
+                    for table, column, position, udt_schema, udt_name in cursor.fetchall():
+                        columns.setdefault(table.lower(), {})[column.lower()] = (position, f'{udt_schema}.{udt_name}')
+                _columns = columns
+    return _columns
+
+
+def reset():
+    # Forget the cached columns, e.g. after a migration in a long-running benchmark
+    global _columns
+    _columns = None
+
+
+def canonical(conn, table, row, exclude=()):
+    # (columns, values) for the keys of row in the table's column order; raises InvalidColumns
+    # for keys the table does not have. Keys match case-insensitively, as unquoted SQL names do.
+    known = load(conn).get(table.lower(), {})
+    by_column = {}
+    for key, value in row.items():
+        column = key.lower()
+        if column in exclude:
+            continue
+        if column in by_column:
+            raise InvalidColumns(table, [key], 'Duplicate column')
+        by_column[column] = value
+
+    unknown = [column for column in by_column if column not in known]
+    if unknown:
+        raise InvalidColumns(table, unknown)
+    columns = sorted(by_column, key=lambda column: known[column][0])
+    return columns, [by_column[column] for column in columns]
+
+
+def column_type(conn, table, column):
+    # Type to cast an untyped parameter to, e.g. 'pg_catalog.numeric'
+    return load(conn)[table.lower()][column.lower()][1]
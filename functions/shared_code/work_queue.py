@@ -0,0 +1,69 @@
+from collections import namedtuple
+from shared_code import inbox
+
+# Pull-based allocation for post-next-case. A reviewer asks for the next case of a role
+# and the oldest unassigned case waiting for that role is claimed in one statement. FOR
+# UPDATE SKIP LOCKED means concurrent claimers each step over rows another claimer holds
+# rather than queueing behind it, so hundreds of reviewers can pull at once and no case
+# is handed out twice. Each queue's predicate matches a partial index in
+# sql/indexes/case_allocation_work_queue.sql, ordered by when the case became available.
+#
+# The case tracker moves on as the post-*-assigned-cases endpoints move it: only a case
+# whose current tracker row is at from_sub_state gets a new sub_state row. FR allocation
+# leaves the tracker alone, as post-assigned-cases does.
+
+Queue = namedtuple('Queue', 'assignee assignee_name status waiting_since from_sub_state sub_state')
+
+QUEUES = {
+    'fr': Queue('assignedtoanalyst', 'assignedtoanalystname', 'casestatusanalyst', 'start_ts', None, None),
+    'qc': Queue('assignedtoqc', 'assignedtoqcname', 'casestatusqc', 'fr_complete_date', 'Case Review Completed', 'QC Allocated'),
+    'qa': Queue('assignedtoqa', 'assignedtoqaname', 'casestatusqa', 'qc_complete_ts', 'Case QC Completed', 'QA Allocated'),
+    'ctc': Queue('assignedtoctc', 'assignedtoctcname', 'casestatusctc', 'qa_complete_ts', 'Case QA Completed', 'CTC Allocated'),
+}
+
+
+def tracker_ctes(queue, source, function_name):
+    # CTEs moving the tracker of the case ids in `source` on to the queue's sub_state
+    if queue.sub_state is None:
+        return ""
+    return f""", tracker_closed AS (
+    UPDATE mtl.CASE_TRACKER SET end_ts = CURRENT_TIMESTAMP
+    WHERE case_id IN (SELECT case_id FROM {source}) AND end_ts = '9999-12-31 00:00:00' AND sub_state = '{queue.from_sub_state}'
+    RETURNING case_id
+), tracker AS (
+    INSERT INTO mtl.CASE_TRACKER (case_id, state, sub_state, start_ts, end_ts, audit_log, update_user)
+    SELECT case_id, 'Review', '{queue.sub_state}', CURRENT_TIMESTAMP, '9999-12-31 00:00:00', 'FUNCTION: {function_name}', %(email)s
+    FROM tracker_closed
+)"""
+
+
+def claim_statement(role, cohort=None):
+    queue = QUEUES[role]
+    cohort_filter = "AND population_cohort = %(cohort)s" if cohort else ""
+    return f"""
+WITH next_case AS (
+    SELECT case_id FROM mtl.CASE_ALLOCATION
+    WHERE end_ts = '9999-12-31 00:00:00' AND {queue.status} = 'NEW' AND COALESCE({queue.assignee}, '') = '' {cohort_filter}
+    ORDER BY {queue.waiting_since}, case_id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+), claimed AS (
+    UPDATE mtl.CASE_ALLOCATION ca SET {queue.assignee} = %(email)s, {queue.assignee_name} = %(name)s
+    FROM next_case
+    WHERE ca.case_id = next_case.case_id AND ca.end_ts = '9999-12-31 00:00:00'
+    RETURNING ca.case_id
+){tracker_ctes(queue, 'claimed', 'post-next-case')}
+SELECT case_id FROM claimed
+"""
+
+
+def claim_next(cursor, role, email, name, cohort=None):
+    # Claims and returns the next case id for the role, or None when the queue is empty.
+    # Runs in the caller's transaction; the claim is visible to others once it commits.
+    cursor.execute(claim_statement(role, cohort), {'email': email, 'name': name, 'cohort': cohort})
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    case_id = row['case_id'] if isinstance(row, dict) else row[0]
+    inbox.sync(cursor, [case_id])
+    return case_id
@@ -1,12 +1,11 @@
 import azure.functions as func
 import logging
 import json
-import psycopg2
-import os
 from psycopg2.extras import RealDictCursor
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient 
+from shared_code import case_events, db, idempotency, inbox, instrumentation, main_screen_views, row_versions, table_columns
 
+@instrumentation.instrumented
+@idempotency.idempotent
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Database insert function processed a request.')
 
@@ -14,7 +13,7 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key'
     }
 
     try:
@@ -22,13 +21,23 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         request_body = req.get_json()
 
     except ValueError as e:
-        return {
-            'statusCode': 400,
-            'headers': headers,
-            'body': json.dumps({
-                'message': 'Bad Request: Missing JSON body payload'
-            })
-        }
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: Missing JSON body payload'}),
+            status_code=400,
+            headers=headers
+        )
+
+    # The input_file_review_sk the reviewer loaded; the save is rejected if it is no longer current
+    try:
+        expected_sk = row_versions.parse_sk(request_body.pop('input_file_review_sk', None))
+    except (TypeError, ValueError):
+        return func.HttpResponse(
+            body=json.dumps({'message': 'Bad Request: input_file_review_sk must be an integer'}),
+            status_code=400,
+            headers=headers
+        )
+    if expected_sk is None and row_versions.versions_required():
+        return row_versions.missing_version_response('input_file_review_sk', headers)
 
     case_complete = request_body['iscomplete']
     access_level = request_body['access_level']
@@ -36,19 +45,13 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     update_user = request_body['update_user']
     del request_body['iscomplete'] #delete from request body array so that they are not POSTed to the database
     del request_body['access_level']
-    columns = []
-    placeholders = []
-    sql_params = {}
-
-    # Iterate over the items in the request_body to construct the SQL statement
-    for key, value in request_body.items():
-        columns.append(key)
-        placeholders.append('%s')  # Use placeholders for the values
-        sql_params[key] = value  # Prepare the parameters for the SQL execution
-
-    # Join the columns and placeholders to construct the INSERT statement
-    INSERT_NEW_CASE_ROW = f"""UPDATE mtl.INPUT_FILE_REVIEW SET end_ts = current_timestamp WHERE case_id = '{case_id}' and end_ts = '9999-12-31 00:00:00'; 
-                                INSERT INTO mtl.INPUT_FILE_REVIEW ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"""
+    # Close the version the reviewer loaded (or, without one, whatever is current) and insert the new one
+    if expected_sk is not None:
+        CLOSE_CURRENT_ROW = "UPDATE mtl.INPUT_FILE_REVIEW SET end_ts = current_timestamp WHERE input_file_review_sk = %s"
+        close_params = (expected_sk,)
+    else:
+        CLOSE_CURRENT_ROW = "UPDATE mtl.INPUT_FILE_REVIEW SET end_ts = current_timestamp WHERE case_id = %s and end_ts = '9999-12-31 00:00:00'"
+        close_params = (case_id,)
 
     # UPDATE THE STATUS OF A CASE SO THAT IT ENTERS WIP STATE FOR A FILE REVIEWER
  
@@ -117,28 +120,19 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     sql_case_timestamp = f"UPDATE mtl.FILE_REVIEW_STATS SET END_TS = CURRENT_TIMESTAMP, ACTIVE = FALSE WHERE END_TS IS NULL AND CASE_ID = %s AND USER_EMAIL = %s"
 
-    # Retrieve the secret containing the database credentials
-    # For Azure, you would use Azure Key Vault to store and retrieve secrets
-    credential = DefaultAzureCredential()
-    key_vault_url = os.getenv('key_vault_name')
-    secret_client = SecretClient(vault_url=key_vault_url, credential=credential)
-
-
-    # For this example, we'll use environment variables
-    db_host = secret_client.get_secret('db-host').value
-    db_port = secret_client.get_secret('db-port').value
-    db_name = secret_client.get_secret('db-name').value
-    db_user = secret_client.get_secret('db-username').value
-    db_password = secret_client.get_secret('db-password').value
-
-    # Construct the connection string with the retrieved credentials
-    conn_string = f"host='{db_host}' port='{db_port}' dbname='{db_name}' user='{db_user}' password='{db_password}'"
-
-
     try:
-        with psycopg2.connect(conn_string) as conn:
+        # Pooled so the prepared INSERT for this set of review fields is reused across requests
+        with db.pooled_connection() as conn:
+            # Body keys are checked against INPUT_FILE_REVIEW and put in column order, so the same fields give the same SQL
+            columns, values = table_columns.canonical(conn, 'input_file_review', request_body)
+            INSERT_NEW_CASE_ROW = f"INSERT INTO mtl.INPUT_FILE_REVIEW ({', '.join(columns)}) VALUES ({', '.join(f'%({col})s' for col in columns)}) RETURNING input_file_review_sk"
+
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(INSERT_NEW_CASE_ROW, tuple(sql_params.values()))
+                if expected_sk is not None:
+                    row_versions.lock_current(cursor, 'input_file_review', case_id, expected_sk)
+                cursor.execute(CLOSE_CURRENT_ROW, close_params)
+                db.execute_prepared(cursor, INSERT_NEW_CASE_ROW, dict(zip(columns, values)))
+                new_sk = cursor.fetchone()['input_file_review_sk']
 
                 # QC
                 if case_complete and (access_level == 3 or access_level == 2):
@@ -167,15 +161,33 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
                     cursor.execute(UPDATE_STATUS_IN_CASE_ALLOC, (case_id,))
                     cursor.execute(UPDATE_CASE_TRACKER, (case_id, case_id, update_user, case_id,))
 
+                # The inbox carries each role's status for the case
+                inbox.sync(cursor, [case_id])
+
+                # Let the main screen view refresher know these screens changed
+                main_screen_views.mark_dirty(cursor, 'update-case')
+                # Tell subscribed screens to refetch once this commits
+                case_events.publish(cursor, 'update-case', [case_id], case_events.SCREENS)
 
-            # Commit is called automatically when the block exits if no exceptions occurred
+
+            # Commit is called when the pooled connection block exits if no exceptions occurred
    
-        # Return a success response
+        # Return a success response, with the version to send on the next save
         return func.HttpResponse(
-            body=json.dumps({"message": "Update executed for all cases."}),
+            body=json.dumps({"message": "Update executed for all cases.", "input_file_review_sk": new_sk}),
             status_code=200,
             headers=headers   
         )
+
+    except row_versions.VersionConflict as conflict:
+        return row_versions.conflict_response(conflict, headers)
+
+    except table_columns.InvalidColumns as invalid:
+        return func.HttpResponse(
+            body=json.dumps({'message': f'Bad Request: {invalid}'}),
+            status_code=400,
+            headers=headers
+        )
         
     except Exception as e:
         return func.HttpResponse(
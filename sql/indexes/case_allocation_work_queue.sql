@@ -0,0 +1,25 @@
+-- Work queue indexes for post-next-case (shared_code/work_queue.py).
+--
+-- Each role's queue is the current CASE_ALLOCATION rows waiting for that role
+-- (status NEW, nobody assigned). The partial indexes hold only those rows, in the order
+-- cases are handed out, so a claim reads the first unlocked entry instead of sorting
+-- the backlog. A claimed case drops out of its index as soon as the claim commits.
+--
+-- All statements are safe to run on a live database (CONCURRENTLY, IF NOT EXISTS).
+-- Measure claim throughput with benchmarks/next_case.py.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_fr_queue_idx
+    ON mtl.CASE_ALLOCATION (start_ts, case_id)
+    WHERE end_ts = '9999-12-31 00:00:00' AND casestatusanalyst = 'NEW' AND COALESCE(assignedtoanalyst, '') = '';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_qc_queue_idx
+    ON mtl.CASE_ALLOCATION (fr_complete_date, case_id)
+    WHERE end_ts = '9999-12-31 00:00:00' AND casestatusqc = 'NEW' AND COALESCE(assignedtoqc, '') = '';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_qa_queue_idx
+    ON mtl.CASE_ALLOCATION (qc_complete_ts, case_id)
+    WHERE end_ts = '9999-12-31 00:00:00' AND casestatusqa = 'NEW' AND COALESCE(assignedtoqa, '') = '';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_ctc_queue_idx
+    ON mtl.CASE_ALLOCATION (qa_complete_ts, case_id)
+    WHERE end_ts = '9999-12-31 00:00:00' AND casestatusctc = 'NEW' AND COALESCE(assignedtoctc, '') = '';
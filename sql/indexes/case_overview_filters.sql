@@ -0,0 +1,54 @@
+-- Supporting indexes for get-tl-filtered-cases (mtl.CASE_OVERVIEW_VW filters).
+--
+-- The view is a join over the current (end_ts = '9999-12-31 00:00:00') rows of the
+-- case tables. Each filter exposed by shared_code/case_filters.py maps onto one of the
+-- indexes below so the planner can push the predicate through the view instead of
+-- computing the whole overview and filtering afterwards.
+--
+-- All statements are safe to run on a live database (CONCURRENTLY, IF NOT EXISTS).
+-- Check with EXPLAIN (ANALYZE, BUFFERS) using benchmarks/tl_filtered_cases.py afterwards.
+
+-- case_id = $1: current allocation / tracker row for one case
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_current_case_id_idx
+    ON mtl.case_allocation (case_id)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_tracker_current_case_id_idx
+    ON mtl.case_tracker (case_id)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+-- state = $n [AND sub_state = $m]: leading state column serves both shapes
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_tracker_current_state_idx
+    ON mtl.case_tracker (state, sub_state, case_id)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+-- cohort = $n
+CREATE INDEX CONCURRENTLY IF NOT EXISTS population_master_cohort_idx
+    ON mtl.population_master (cohort, case_id);
+
+-- claim_reference = $n and claim_reference LIKE 'prefix%'
+-- text_pattern_ops lets LIKE prefix searches use the btree regardless of collation
+CREATE INDEX CONCURRENTLY IF NOT EXISTS population_master_claim_reference_idx
+    ON mtl.population_master (claim_reference text_pattern_ops);
+
+-- assignedto = $n: the overview's assignee is the owner of the current stage, so
+-- each assignee column gets a small partial index on current rows
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_current_analyst_idx
+    ON mtl.case_allocation (assignedtoanalyst)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_current_qc_idx
+    ON mtl.case_allocation (assignedtoqc)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_current_qa_idx
+    ON mtl.case_allocation (assignedtoqa)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_current_ctc_idx
+    ON mtl.case_allocation (assignedtoctc)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+ANALYZE mtl.case_allocation;
+ANALYZE mtl.case_tracker;
+ANALYZE mtl.population_master;
@@ -0,0 +1,40 @@
+-- Supporting indexes for get-payments and get-payments-all-columns
+-- (mtl.MASTER_PAYMENT_ANALYST_VW over mtl.master_payment).
+--
+-- Each allocation mode in shared_code/payments.py is one fixed statement. Its predicate
+-- matches one of the partial indexes below, so the index only holds the current rows of
+-- that mode. scheduled_payment_date is the trailing key column, which means the
+-- "due only" filter (scheduled_payment_date <= CURRENT_DATE) becomes a range scan
+-- inside the index.
+--
+-- All statements are safe to run on a live database (CONCURRENTLY, IF NOT EXISTS).
+-- Compare p95 before and after with benchmarks/payment_reads.py.
+
+-- analyst_email=na, allocation=unallocated: the pool waiting to be handed out
+CREATE INDEX CONCURRENTLY IF NOT EXISTS master_payment_current_unallocated_idx
+    ON mtl.master_payment (scheduled_payment_date)
+    WHERE end_ts = '9999-12-31 00:00:00' AND assignedtoanalyst IS NULL;
+
+-- allocation=allocated, for one analyst or (assignedtoanalyst IS NOT NULL) the whole team.
+-- This is the analyst's worklist and is re-read on every refresh of the payments screen,
+-- so it covers every column the screen returns and can be served by an index-only scan.
+-- Payments leave the index as soon as they are completed, so it stays small.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS master_payment_current_open_idx
+    ON mtl.master_payment (assignedtoanalyst, scheduled_payment_date)
+    INCLUDE (case_id, payment_reference, first_name, last_name, net_redress_value, payment_method,
+             payment_completed_by_analyst, payment_completed_by_analyst_date, total_redress, interest,
+             withheld_tax, address_line_1, address_line_2, address_line_3, address_line_4,
+             address_line_5, postcode)
+    WHERE end_ts = '9999-12-31 00:00:00' AND assignedtoanalyst IS NOT NULL AND NOT payment_completed_by_analyst;
+
+-- allocation=completed, for one analyst or the whole team
+CREATE INDEX CONCURRENTLY IF NOT EXISTS master_payment_current_completed_idx
+    ON mtl.master_payment (assignedtoanalyst, scheduled_payment_date)
+    WHERE end_ts = '9999-12-31 00:00:00' AND payment_completed_by_analyst;
+
+-- get-payments-all-columns: every current payment for one analyst
+CREATE INDEX CONCURRENTLY IF NOT EXISTS master_payment_current_analyst_idx
+    ON mtl.master_payment (assignedtoanalyst)
+    WHERE end_ts = '9999-12-31 00:00:00';
+
+ANALYZE mtl.master_payment;
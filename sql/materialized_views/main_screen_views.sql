@@ -0,0 +1,45 @@
+-- Materialized copies of the main-screen views, refreshed by the
+-- refresh-main-screen-views timer function (shared_code/main_screen_views.py).
+--
+-- REFRESH ... CONCURRENTLY needs a unique index covering every row of each copy.
+-- The QC/QA/CTC screens carry one row per case version (case_id, end_ts); the
+-- release screen carries one row per case. Adjust if a view definition changes.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mtl.QC_MAIN_SCREEN_MV AS SELECT * FROM mtl.QC_MAIN_SCREEN_VW WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS qc_main_screen_mv_key ON mtl.QC_MAIN_SCREEN_MV (case_id, end_ts);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mtl.QA_MAIN_SCREEN_MV AS SELECT * FROM mtl.QA_MAIN_SCREEN_VW WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS qa_main_screen_mv_key ON mtl.QA_MAIN_SCREEN_MV (case_id, end_ts);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mtl.CTC_MAIN_SCREEN_MV AS SELECT * FROM mtl.CTC_MAIN_SCREEN_VW WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS ctc_main_screen_mv_key ON mtl.CTC_MAIN_SCREEN_MV (case_id, end_ts);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mtl.RELEASE_MAIN_SCREEN_MV AS SELECT * FROM mtl.RELEASE_MAIN_SCREEN_VW WITH NO DATA;
+CREATE UNIQUE INDEX IF NOT EXISTS release_main_screen_mv_key ON mtl.RELEASE_MAIN_SCREEN_MV (case_id);
+CREATE INDEX IF NOT EXISTS release_main_screen_mv_batch ON mtl.RELEASE_MAIN_SCREEN_MV (batch_number);
+
+-- Append-only log of writes that can change the main screens. Write endpoints insert
+-- one row per transaction; the refresher debounces on it and prunes processed rows.
+CREATE TABLE IF NOT EXISTS mtl.MV_WRITE_EVENTS (
+    event_id BIGSERIAL PRIMARY KEY,
+    source TEXT NOT NULL,
+    event_ts TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per materialized view: what the copy reflects and how the last refresh went
+CREATE TABLE IF NOT EXISTS mtl.MV_REFRESH_STATUS (
+    materialized_view TEXT PRIMARY KEY,
+    live_view TEXT NOT NULL,
+    data_as_of_ts TIMESTAMPTZ,
+    refreshed_through_event_id BIGINT NOT NULL DEFAULT 0,
+    last_refresh_ms INTEGER,
+    last_error TEXT,
+    refresh_count BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO mtl.MV_REFRESH_STATUS (materialized_view, live_view) VALUES
+    ('mtl.QC_MAIN_SCREEN_MV', 'mtl.QC_MAIN_SCREEN_VW'),
+    ('mtl.QA_MAIN_SCREEN_MV', 'mtl.QA_MAIN_SCREEN_VW'),
+    ('mtl.CTC_MAIN_SCREEN_MV', 'mtl.CTC_MAIN_SCREEN_VW'),
+    ('mtl.RELEASE_MAIN_SCREEN_MV', 'mtl.RELEASE_MAIN_SCREEN_VW')
+ON CONFLICT (materialized_view) DO NOTHING;
@@ -0,0 +1,35 @@
+-- Change sequence for get-changes (shared_code/change_feed.py). Every insert and update
+-- of a CASE_ALLOCATION or CASE_TRACKER row, closing a row included, stamps change_seq
+-- with the id of the writing transaction. Transaction ids only grow, so a client that
+-- synced at snapshot xmin N gets everything written since with change_seq >= N, and
+-- nothing committed after its last sync can carry a lower number. Rows written before
+-- this file was applied keep a NULL change_seq and are never in a feed.
+--
+-- The columns are added without a default so no table is rewritten, and the indexes are
+-- built CONCURRENTLY. Needs PostgreSQL 13 or later (pg_current_xact_id). Safe to re-run.
+CREATE OR REPLACE FUNCTION mtl.stamp_change_seq() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.change_seq := pg_current_xact_id()::text::bigint;
+    RETURN NEW;
+END;
+$$;
+
+ALTER TABLE mtl.CASE_ALLOCATION ADD COLUMN IF NOT EXISTS change_seq BIGINT;
+
+ALTER TABLE mtl.CASE_TRACKER ADD COLUMN IF NOT EXISTS change_seq BIGINT;
+
+DROP TRIGGER IF EXISTS case_allocation_change_seq ON mtl.CASE_ALLOCATION;
+
+CREATE TRIGGER case_allocation_change_seq BEFORE INSERT OR UPDATE ON mtl.CASE_ALLOCATION
+    FOR EACH ROW EXECUTE FUNCTION mtl.stamp_change_seq();
+
+DROP TRIGGER IF EXISTS case_tracker_change_seq ON mtl.CASE_TRACKER;
+
+CREATE TRIGGER case_tracker_change_seq BEFORE INSERT OR UPDATE ON mtl.CASE_TRACKER
+    FOR EACH ROW EXECUTE FUNCTION mtl.stamp_change_seq();
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_allocation_change_seq_idx
+    ON mtl.CASE_ALLOCATION (change_seq) WHERE change_seq IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS case_tracker_change_seq_idx
+    ON mtl.CASE_TRACKER (change_seq) WHERE change_seq IS NOT NULL;
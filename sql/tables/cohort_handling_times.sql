@@ -0,0 +1,10 @@
+-- Expected handling time of one FR case per population cohort, used by
+-- post-auto-allocation (shared_code/auto_allocation.py) to turn reviewer hours into
+-- cases. Cohorts without a row use the allocation_default_case_hours app setting;
+-- a request can override any cohort with "handling_hours".
+CREATE TABLE IF NOT EXISTS mtl.COHORT_HANDLING_TIME (
+    population_cohort TEXT PRIMARY KEY,
+    expected_hours NUMERIC(6, 2) NOT NULL CHECK (expected_hours > 0),
+    update_user TEXT,
+    updated_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
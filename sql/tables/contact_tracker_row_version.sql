@@ -0,0 +1,6 @@
+-- Row version for the contact tracker (shared_code/contact_writes.py). The current
+-- contact_tracker row is updated in place on every contact save and approval, so its
+-- contact_tracker_sk never changes; row_version goes up by one on each save instead.
+-- Clients send back the row_version they loaded and a save against an older one is
+-- rejected with a 409. A constant default makes this a catalogue-only change.
+ALTER TABLE mtl.CONTACT_TRACKER ADD COLUMN IF NOT EXISTS row_version INTEGER NOT NULL DEFAULT 1;
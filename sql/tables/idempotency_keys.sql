@@ -0,0 +1,16 @@
+-- Idempotency-Key store for the mutating endpoints (shared_code/idempotency.py).
+-- key_hash is sha256(function name + client key). A row with a NULL status_code is a
+-- claim by a request that is still running; once that request finishes, the compressed
+-- response is stored and replayed until expires_ts. Expired rows are taken over by the
+-- next request with the same key, and are swept in small batches by the writers.
+CREATE TABLE IF NOT EXISTS mtl.IDEMPOTENCY_KEYS (
+    key_hash TEXT PRIMARY KEY,
+    function_name TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    status_code INTEGER,
+    response BYTEA,
+    created_ts TIMESTAMPTZ NOT NULL DEFAULT now(),
+    expires_ts TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idempotency_keys_expires_ts ON mtl.IDEMPOTENCY_KEYS (expires_ts);
@@ -0,0 +1,64 @@
+-- Mailing batch readiness counters (shared_code/mailing_batches.py). One row per QC
+-- mailing batch with how many of its cases are ready, removed, reset or still waiting
+-- for review. A statement trigger on QC_MAILING counts every inserted row into its
+-- batch's row, creating it if needed, so batches cut outside post-mailing-batch are
+-- counted too. post-mailing-review moves the counters by the cases each bulk action
+-- changed, in the same statement as the QC_MAILING update. QC_MAILING_STATS_VW is
+-- redefined over these rows (sql/views/qc_mailing_stats_vw.sql), so get-mailing-cases
+-- (qc_review) no longer aggregates QC_MAILING. The backfill below recounts existing
+-- batches and is safe to re-run.
+CREATE SEQUENCE IF NOT EXISTS mtl.MAILING_BATCH_SEQ;
+
+CREATE TABLE IF NOT EXISTS mtl.MAILING_BATCH (
+    mailing_batch_number TEXT PRIMARY KEY,
+    cases INTEGER NOT NULL DEFAULT 0,
+    ready INTEGER NOT NULL DEFAULT 0,
+    removed INTEGER NOT NULL DEFAULT 0,
+    reset INTEGER NOT NULL DEFAULT 0,
+    created_by TEXT,
+    created_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS qc_mailing_batch_case ON mtl.QC_MAILING (mailing_batch_number, case_id);
+
+CREATE INDEX IF NOT EXISTS qc_mailing_case_id ON mtl.QC_MAILING (case_id);
+
+-- Same states as mailing_batches.state(): reset, then ready, then removed, else pending
+CREATE OR REPLACE FUNCTION mtl.count_inserted_mailing_cases() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO mtl.MAILING_BATCH AS b (mailing_batch_number, cases, ready, removed, reset)
+    SELECT mailing_batch_number,
+           count(*),
+           count(*) FILTER (WHERE NOT COALESCE(case_reset, FALSE) AND COALESCE(qc_mailing_ready, FALSE)),
+           count(*) FILTER (WHERE NOT COALESCE(case_reset, FALSE) AND NOT COALESCE(qc_mailing_ready, FALSE)
+                                  AND qc_reason_remove_batch IS NOT NULL),
+           count(*) FILTER (WHERE COALESCE(case_reset, FALSE))
+    FROM inserted
+    WHERE mailing_batch_number IS NOT NULL
+    GROUP BY mailing_batch_number
+    ON CONFLICT (mailing_batch_number) DO UPDATE
+    SET cases = b.cases + EXCLUDED.cases, ready = b.ready + EXCLUDED.ready, removed = b.removed + EXCLUDED.removed,
+        reset = b.reset + EXCLUDED.reset, updated_ts = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS qc_mailing_count_inserted ON mtl.QC_MAILING;
+
+CREATE TRIGGER qc_mailing_count_inserted AFTER INSERT ON mtl.QC_MAILING
+    REFERENCING NEW TABLE AS inserted
+    FOR EACH STATEMENT EXECUTE FUNCTION mtl.count_inserted_mailing_cases();
+
+INSERT INTO mtl.MAILING_BATCH (mailing_batch_number, cases, ready, removed, reset)
+SELECT mailing_batch_number,
+       count(*),
+       count(*) FILTER (WHERE NOT COALESCE(case_reset, FALSE) AND qc_mailing_ready),
+       count(*) FILTER (WHERE NOT COALESCE(case_reset, FALSE) AND NOT COALESCE(qc_mailing_ready, FALSE) AND qc_reason_remove_batch IS NOT NULL),
+       count(*) FILTER (WHERE COALESCE(case_reset, FALSE))
+FROM mtl.QC_MAILING
+WHERE mailing_batch_number IS NOT NULL
+GROUP BY mailing_batch_number
+ON CONFLICT (mailing_batch_number) DO UPDATE
+SET cases = EXCLUDED.cases, ready = EXCLUDED.ready, removed = EXCLUDED.removed, reset = EXCLUDED.reset,
+    updated_ts = CURRENT_TIMESTAMP;
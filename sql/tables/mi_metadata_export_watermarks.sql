@@ -0,0 +1,7 @@
+-- Incremental MI exports (get-mi-export). A definition with watermark_column set only
+-- exports rows whose watermark is after last_watermark, and get-mi-export moves
+-- last_watermark forward once the delta file is uploaded. Definitions without a
+-- watermark_column keep exporting in full.
+ALTER TABLE mtl.MI_METADATA_EXPORT ADD COLUMN IF NOT EXISTS watermark_column TEXT;
+ALTER TABLE mtl.MI_METADATA_EXPORT ADD COLUMN IF NOT EXISTS last_watermark TIMESTAMP;
+ALTER TABLE mtl.MI_METADATA_EXPORT ADD COLUMN IF NOT EXISTS last_exported_ts TIMESTAMPTZ;
@@ -0,0 +1,10 @@
+-- Columns for documents uploaded straight to blob storage with a SAS URL (get-blob-sas).
+-- post-blob-files fills them when it confirms an upload; rows written before this
+-- change keep them NULL.
+ALTER TABLE mtl.UPLOADED_FILES ADD COLUMN IF NOT EXISTS blob_name TEXT;
+ALTER TABLE mtl.UPLOADED_FILES ADD COLUMN IF NOT EXISTS size_bytes BIGINT;
+ALTER TABLE mtl.UPLOADED_FILES ADD COLUMN IF NOT EXISTS content_md5 TEXT;
+ALTER TABLE mtl.UPLOADED_FILES ADD COLUMN IF NOT EXISTS confirmed_ts TIMESTAMPTZ;
+
+-- One metadata row per blob; makes confirming an upload idempotent
+CREATE UNIQUE INDEX IF NOT EXISTS uploaded_files_blob_name ON mtl.UPLOADED_FILES (blob_name) WHERE blob_name IS NOT NULL;
@@ -0,0 +1,27 @@
+-- Personal work inbox read by get-assigned-cases (shared_code/inbox.py). One row per
+-- user, role and case from the assignee columns of the current CASE_ALLOCATION row; the
+-- allocation and status-change endpoints rewrite a case's rows in the same transaction
+-- as the allocation change. The primary key serves the home screen as one range scan on
+-- user_email. The backfill below is safe to re-run.
+CREATE TABLE IF NOT EXISTS mtl.USER_INBOX (
+    user_email TEXT NOT NULL,
+    role TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    status TEXT,
+    PRIMARY KEY (user_email, role, case_id)
+);
+
+CREATE INDEX IF NOT EXISTS user_inbox_case_id ON mtl.USER_INBOX (case_id);
+
+INSERT INTO mtl.USER_INBOX (user_email, role, case_id, status)
+SELECT r.user_email, r.role, ca.case_id, r.status
+FROM mtl.CASE_ALLOCATION ca
+CROSS JOIN LATERAL (VALUES
+    ('analyst', ca.assignedtoanalyst, ca.casestatusanalyst),
+    ('qc', ca.assignedtoqc, ca.casestatusqc),
+    ('qa', ca.assignedtoqa, ca.casestatusqa),
+    ('ctc', ca.assignedtoctc, ca.casestatusctc),
+    ('er', ca.assignedtoer, ca.casestatuser)
+) AS r (role, user_email, status)
+WHERE ca.end_ts = '9999-12-31 00:00:00' AND COALESCE(r.user_email, '') <> ''
+ON CONFLICT DO NOTHING;
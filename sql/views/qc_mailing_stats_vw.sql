@@ -0,0 +1,28 @@
+-- QC_MAILING_STATS_VW over the MAILING_BATCH readiness counters
+-- (sql/tables/mailing_batches.sql), so get-mailing-cases (qc_review) reads one maintained
+-- row per batch instead of aggregating QC_MAILING. Run after mailing_batches.sql. The
+-- view must keep the columns it is replacing: the block below compares the existing
+-- view's columns with the ones defined here and stops, listing both, if they differ, and
+-- CREATE OR REPLACE VIEW itself refuses a changed column name, order or type. Safe to re-run.
+DO $$
+DECLARE
+    expected TEXT[] := ARRAY['mailing_batch_number', 'total_cases', 'ready_cases', 'removed_cases', 'reset_cases', 'pending_cases'];
+    existing TEXT[];
+BEGIN
+    SELECT array_agg(attname::text ORDER BY attnum) INTO existing
+    FROM pg_attribute
+    WHERE attrelid = to_regclass('mtl.qc_mailing_stats_vw') AND attnum > 0 AND NOT attisdropped;
+    IF existing IS NOT NULL AND existing <> expected THEN
+        RAISE EXCEPTION 'mtl.QC_MAILING_STATS_VW has columns %, this definition has %; map the existing columns here first',
+            existing, expected;
+    END IF;
+END $$;
+
+CREATE OR REPLACE VIEW mtl.QC_MAILING_STATS_VW AS
+SELECT mailing_batch_number,
+       cases::bigint AS total_cases,
+       ready::bigint AS ready_cases,
+       removed::bigint AS removed_cases,
+       reset::bigint AS reset_cases,
+       (cases - ready - removed - reset)::bigint AS pending_cases
+FROM mtl.MAILING_BATCH;